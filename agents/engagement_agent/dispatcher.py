@@ -0,0 +1,329 @@
+"""
+Notification Dispatcher
+-----------------------
+Asyncio fan-out for engagement messages.
+
+- Bounded concurrency per channel (a fixed pool of workers per channel)
+- Token-bucket rate limit per channel
+- Batched provider calls for providers that accept several messages at once
+- Durable SQLite retry queue with exponential backoff + jitter, and a
+  dead-letter state once max_attempts is reached. Retries that come due
+  within `retry_window` seconds are sent in the same run; a queued row is
+  only leased while it is being sent and removed once the send succeeds,
+  so a crash mid-send leaves it to be retried
+
+Messages are plain dicts:
+{
+    "channel": "sms" | "email" | "whatsapp",
+    "to": "<phone or email>",
+    "body": "<text>",
+    "user_id": "<user uuid>",    # optional, for logs
+    "attempts": 0                # managed by the dispatcher
+}
+
+Providers implement `async send_batch(messages) -> list[bool]`. StubProvider
+is the local stand-in used until real SMS / email / WhatsApp providers are
+wired in.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# =========================
+# Rate Limiting
+# =========================
+
+class TokenBucket:
+    """Allows `rate` tokens per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1):
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+# =========================
+# Providers
+# =========================
+
+class StubProvider:
+    """
+    Local provider for testing. Simulates latency and random failures and
+    records everything it "sent".
+    """
+
+    def __init__(self, channel: str, max_batch: int = 100, latency: float = 0.0, failure_rate: float = 0.0,
+                 verbose: bool = True, seed: int = None):
+        self.channel = channel
+        self.max_batch = max_batch
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.verbose = verbose
+        self.sent = []
+        self._random = random.Random(seed)
+
+    async def send_batch(self, messages: list) -> list:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        results = []
+        for message in messages:
+            ok = self._random.random() >= self.failure_rate
+            if ok:
+                self.sent.append(message)
+                if self.verbose:
+                    print(f"[REMINDER:{self.channel}] to {message.get('to')}: {message.get('body')}")
+            results.append(ok)
+        return results
+
+# =========================
+# Retry Queue
+# =========================
+
+class RetryQueue:
+    """SQLite-backed queue of failed messages waiting for their next attempt."""
+
+    def __init__(self, path: str, lease_seconds: float = 300.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS retries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                dead INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS retries_due ON retries (dead, next_attempt)")
+        self.conn.commit()
+
+    def push(self, message: dict, delay: float, error: str = None, dead: bool = False):
+        message = {k: v for k, v in message.items() if k != "retry_id"}
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO retries (channel, payload, attempts, next_attempt, last_error, dead) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (message["channel"], json.dumps(message), message.get("attempts", 0), time.time() + delay, error,
+                 int(dead)),
+            )
+            self.conn.commit()
+
+    def claim_due(self, limit: int = 1000) -> list:
+        """
+        Lease and return messages whose next attempt is due. Each carries its
+        row id as "retry_id"; a leased row is pushed back by lease_seconds,
+        so it comes due again if the process dies before ack/reschedule.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, payload FROM retries WHERE dead = 0 AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            if rows:
+                self.conn.executemany("UPDATE retries SET next_attempt = ? WHERE id = ?",
+                                      [(now + self.lease_seconds, row[0]) for row in rows])
+                self.conn.commit()
+        return [dict(json.loads(row[1]), retry_id=row[0]) for row in rows]
+
+    def ack(self, retry_id: int):
+        """The message was sent: drop its row."""
+        with self._lock:
+            self.conn.execute("DELETE FROM retries WHERE id = ?", (retry_id,))
+            self.conn.commit()
+
+    def reschedule(self, message: dict, delay: float, error: str = None, dead: bool = False):
+        """Record another failed attempt of a queued message."""
+        payload = {k: v for k, v in message.items() if k != "retry_id"}
+        with self._lock:
+            self.conn.execute(
+                "UPDATE retries SET payload = ?, attempts = ?, next_attempt = ?, last_error = ?, dead = ? WHERE id = ?",
+                (json.dumps(payload), payload.get("attempts", 0), time.time() + delay, error, int(dead),
+                 message["retry_id"]),
+            )
+            self.conn.commit()
+
+    def next_due(self):
+        """Time of the earliest pending retry, or None."""
+        with self._lock:
+            return self.conn.execute("SELECT MIN(next_attempt) FROM retries WHERE dead = 0").fetchone()[0]
+
+    def counts(self) -> dict:
+        with self._lock:
+            pending, dead = self.conn.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM retries"
+            ).fetchone()
+        return {"pending": pending, "dead": dead}
+
+# =========================
+# Dispatcher
+# =========================
+
+class NotificationDispatcher:
+    def __init__(self, providers: dict, concurrency: dict = None, rates: dict = None, retry_queue: RetryQueue = None,
+                 max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 600.0,
+                 retry_window: float = 30.0):
+        """
+        providers:    {channel: provider}
+        concurrency:  {channel: max in-flight provider calls} (default 10)
+        rates:        {channel: messages per second} (default unlimited)
+        retry_window: keep retrying within a run while the next retry is due
+                      within this many seconds; later ones wait for the next run
+        """
+        self.providers = providers
+        self.concurrency = concurrency or {}
+        self.rates = rates or {}
+        self.retry_queue = retry_queue
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_window = retry_window
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+        return delay * (0.5 + random.random() / 2)
+
+    def _failed(self, message: dict, error: str, stats: dict):
+        message = dict(message, attempts=message.get("attempts", 0) + 1)
+        dead = message["attempts"] >= self.max_attempts
+        stats["dead" if dead else "retrying"] += 1
+        if self.retry_queue is None:
+            return
+        if message.get("retry_id") is not None:
+            self.retry_queue.reschedule(message, self.backoff(message["attempts"]), error, dead=dead)
+        else:
+            self.retry_queue.push(message, self.backoff(message["attempts"]), error, dead=dead)
+
+    def _sent(self, message: dict, stats: dict):
+        stats["sent"] += 1
+        if self.retry_queue is not None and message.get("retry_id") is not None:
+            self.retry_queue.ack(message["retry_id"])
+
+    async def _channel_worker(self, provider, batches: asyncio.Queue, bucket: TokenBucket, stats: dict):
+        while True:
+            batch = await batches.get()
+            try:
+                if bucket:
+                    await bucket.acquire(len(batch))
+                try:
+                    results = await provider.send_batch(batch)
+                    errors = [None if ok else "provider rejected message" for ok in results]
+                except Exception as e:
+                    errors = [str(e)] * len(batch)
+                for message, error in zip(batch, errors):
+                    if error is None:
+                        self._sent(message, stats)
+                    else:
+                        self._failed(message, error, stats)
+            finally:
+                batches.task_done()
+
+    async def dispatch(self, messages) -> dict:
+        """Send messages across all channels. Returns {"sent", "retrying", "dead", "unroutable"}."""
+        stats = {"sent": 0, "retrying": 0, "dead": 0, "unroutable": 0}
+        by_channel = {}
+        for message in messages:
+            if message.get("channel") in self.providers:
+                by_channel.setdefault(message["channel"], []).append(message)
+            else:
+                stats["unroutable"] += 1
+
+        workers = []
+        queues = []
+        for channel, channel_messages in by_channel.items():
+            provider = self.providers[channel]
+            size = max(1, getattr(provider, "max_batch", 1))
+            rate = self.rates.get(channel)
+            bucket = TokenBucket(rate, capacity=max(rate, size)) if rate else None
+
+            batches = asyncio.Queue()
+            for start in range(0, len(channel_messages), size):
+                batches.put_nowait(channel_messages[start:start + size])
+            queues.append(batches)
+            for _ in range(self.concurrency.get(channel, 10)):
+                workers.append(asyncio.create_task(self._channel_worker(provider, batches, bucket, stats)))
+
+        for batches in queues:
+            await batches.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        return stats
+
+    async def dispatch_with_retries(self, messages) -> dict:
+        """
+        Send the new messages together with retry-queue messages that are due,
+        then keep sending retries as they come due within retry_window.
+        """
+        if self.retry_queue is None:
+            stats = await self.dispatch(messages)
+            stats["retried"] = 0
+            return stats
+
+        deadline = time.time() + self.retry_window
+        due = self.retry_queue.claim_due()
+        stats = await self.dispatch(due + list(messages))
+        retried = len(due)
+        while True:
+            next_due = self.retry_queue.next_due()
+            if next_due is None or next_due > deadline:
+                break
+            await asyncio.sleep(max(0.0, next_due - time.time()))
+            due = self.retry_queue.claim_due()
+            retried += len(due)
+            # Counts are per attempt: a message retried here shows up in "retrying" and in its final state
+            for key, value in (await self.dispatch(due)).items():
+                stats[key] += value
+        stats["retried"] = retried
+        return stats
+
+    def run(self, messages) -> dict:
+        """Synchronous entry point for the agent."""
+        return asyncio.run(self.dispatch_with_retries(messages))
+
+
+_default_dispatcher = None
+_default_lock = threading.Lock()
+
+
+def default_dispatcher() -> NotificationDispatcher:
+    """
+    Stub providers on every channel with a durable retry queue, created once
+    per process. ENGAGEMENT_RETRY_DB overrides the queue location and
+    ENGAGEMENT_RETRY_WINDOW_SECONDS how long a run keeps retrying.
+    """
+    global _default_dispatcher
+    with _default_lock:
+        if _default_dispatcher is None:
+            retry_path = os.getenv("ENGAGEMENT_RETRY_DB",
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), "retry_queue.db"))
+            _default_dispatcher = NotificationDispatcher(
+                providers={channel: StubProvider(channel) for channel in ("sms", "email", "whatsapp")},
+                concurrency={"sms": 20, "email": 50, "whatsapp": 20},
+                rates={"sms": 100, "email": 500, "whatsapp": 80},
+                retry_queue=RetryQueue(retry_path),
+                retry_window=float(os.getenv("ENGAGEMENT_RETRY_WINDOW_SECONDS", "30")),
+            )
+    return _default_dispatcher
@@ -12,8 +12,16 @@ Tables used:
 
 from datetime import datetime, timedelta
 from crewai import Agent, Task
-from supabase import create_client, Client
+from supabase import Client
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from supabase_transport import get_client
+from profiling import profiled
+from dispatcher import default_dispatcher
+from reminder_scheduler import ReminderScheduler
 
 # =========================
 # Environment Variables
@@ -21,7 +29,7 @@ import os
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
 
 # =========================
 # Helper Functions
@@ -34,11 +42,108 @@ def fetch_upcoming_rentals(days_ahead=1):
     response = supabase.table("rentals").select("*").eq("status", "active").lte("end_date", target_date).execute()
     return response.data if response.data else []
 
+def fetch_active_rentals():
+    """Fetch every active rental once, to seed the reminder scheduler."""
+    response = supabase.table("rentals").select("*").eq("status", "active").execute()
+    return response.data if response.data else []
+
+# Rows per PostgREST page; the server caps unpaged responses at 1000 rows
+CHANGE_PAGE_SIZE = 1000
+
+def fetch_changed_rentals(since: str):
+    """
+    Fetch rentals updated at or after `since` (any status, so completions
+    drop their timers). Inclusive, so rows sharing the watermark timestamp
+    are not skipped; callers de-duplicate. Paged, so a large change set is
+    not truncated.
+    """
+    rentals = []
+    start = 0
+    while True:
+        response = (supabase.table("rentals").select("*").gte("updated_at", since).order("updated_at")
+                    .range(start, start + CHANGE_PAGE_SIZE - 1).execute())
+        rows = response.data or []
+        rentals.extend(rows)
+        if len(rows) < CHANGE_PAGE_SIZE:
+            return rentals
+        start += CHANGE_PAGE_SIZE
+
 def fetch_user_contact(user_id: str):
     """Fetch user's contact info."""
     response = supabase.table("users").select("full_name, email, phone").eq("user_id", user_id).execute()
     return response.data[0] if response.data else {}
 
+# PostgREST puts in_() filters in the URL, so very large id lists are split
+CONTACT_BATCH_SIZE = 500
+
+def fetch_user_contacts(user_ids) -> dict:
+    """Fetch contact info for many users at once. Returns {user_id: contact}."""
+    ids = sorted({user_id for user_id in user_ids if user_id})
+    contacts = {}
+    for start in range(0, len(ids), CONTACT_BATCH_SIZE):
+        batch = ids[start:start + CONTACT_BATCH_SIZE]
+        response = supabase.table("users").select("user_id, full_name, email, phone").in_("user_id", batch).execute()
+        for row in response.data or []:
+            contacts[row["user_id"]] = row
+    return contacts
+
+def group_reminders_by_recipient(reminders) -> dict:
+    """
+    Group (kind, rental) reminders per user: renters get "return_<kind>",
+    lenders "pickup_<kind>".
+    Returns {user_id: [(reminder_type, rental), ...]}.
+    """
+    by_user = {}
+    for kind, rental in reminders:
+        if rental.get("renter_id"):
+            by_user.setdefault(rental["renter_id"], []).append((f"return_{kind}", rental))
+        if rental.get("lender_id"):
+            by_user.setdefault(rental["lender_id"], []).append((f"pickup_{kind}", rental))
+    return by_user
+
+def group_rentals_by_recipient(rentals) -> dict:
+    """Group due rentals per user: renters get "return_due", lenders "pickup_due"."""
+    return group_reminders_by_recipient(("due", rental) for rental in rentals)
+
+def deliver_reminders(reminders_by_user: dict) -> dict:
+    """
+    One contact query for every recipient, one digest per user, then dispatch.
+    stats["dispatched_to"] lists the users whose digest was handed to the
+    dispatcher; users without a reachable contact are skipped.
+    """
+    contacts = fetch_user_contacts(reminders_by_user.keys())
+    messages = [
+        build_digest_message(contacts[user_id], reminders)
+        for user_id, reminders in reminders_by_user.items()
+        if user_id in contacts
+    ]
+    messages = [message for message in messages if message["to"]]
+    skipped = len(reminders_by_user) - len(messages)
+    if skipped:
+        print(f"[WARN] {skipped} reminder recipient(s) have no phone or email, not sent")
+    # Concurrent, rate-limited delivery; failures go to the durable retry queue
+    stats = default_dispatcher().run(messages)
+    stats["dispatched_to"] = {message["user_id"] for message in messages}
+    return stats
+
+def build_digest_message(user_contact: dict, reminders: list) -> dict:
+    """
+    One message covering all of a user's due rentals, routed to SMS when
+    the user has a phone number and to email otherwise.
+    """
+    name = user_contact.get("full_name", "User")
+    lines = [
+        f"- rental {rental.get('rental_id')}: {reminder_type.replace('_', ' ')} on {rental.get('end_date')}"
+        for reminder_type, rental in reminders
+    ]
+    phone = user_contact.get("phone")
+    return {
+        "channel": "sms" if phone else "email",
+        "to": phone or user_contact.get("email"),
+        "body": f"Hello {name}, you have {len(reminders)} rental reminder(s):\n" + "\n".join(lines),
+        "user_id": user_contact.get("user_id"),
+    }
+
 def send_reminder(user_contact: dict, rental_info: dict, reminder_type="return_due"):
     """
     Placeholder for notification logic.
@@ -84,25 +189,67 @@ def run_engagement_agent(task_input: dict):
     days_ahead = task_input.get("days_ahead", 1)
     rentals_due = fetch_upcoming_rentals(days_ahead)
 
-    reminders_sent = 0
-    for rental in rentals_due:
-        # Notify borrower
-        borrower_contact = fetch_user_contact(rental.get("renter_id"))
-        if borrower_contact:
-            send_reminder(borrower_contact, rental, reminder_type="return_due")
-            reminders_sent += 1
+    stats = deliver_reminders(group_rentals_by_recipient(rentals_due))
 
-        # Notify lender
-        lender_contact = fetch_user_contact(rental.get("lender_id"))
-        if lender_contact:
-            send_reminder(lender_contact, rental, reminder_type="pickup_due")
-            reminders_sent += 1
+    return {
+        "reminders_sent": stats["sent"],
+        "rentals_covered": len(rentals_due),
+        "retrying": stats["retrying"],
+        "dead_lettered": stats["dead"],
+    }
 
-    return {"reminders_sent": reminders_sent}
+# =========================
+# Reminder Scheduler
+# =========================
+# Sent-state lives next to the agent unless ENGAGEMENT_SCHEDULER_DB says otherwise
+SCHEDULER_DB = os.getenv("ENGAGEMENT_SCHEDULER_DB",
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), "reminder_state.db"))
+# Seconds between incremental pulls of changed rentals
+CHANGE_POLL_SECONDS = float(os.getenv("ENGAGEMENT_CHANGE_POLL_SECONDS", "300"))
+
+def run_reminder_scheduler(stop=None):
+    """
+    Long-running alternative to run_engagement_agent: loads active rentals
+    once, then only pulls rentals whose updated_at moved and sleeps until
+    the next reminder is due. Each (rental, kind) is sent at most once.
+    """
+    scheduler = ReminderScheduler(SCHEDULER_DB)
+    watermark = datetime.utcnow().isoformat()
+    scheduler.load(fetch_active_rentals())
+    print(f"[INFO] Reminder scheduler started, next reminder at {scheduler.next_fire_time()}")
+
+    # Rentals already applied at exactly the watermark timestamp
+    seen_at_watermark = set()
+
+    def pull_changes():
+        nonlocal watermark, seen_at_watermark
+        for rental in fetch_changed_rentals(watermark):
+            updated_at = str(rental.get("updated_at") or watermark)
+            if updated_at == watermark and rental["rental_id"] in seen_at_watermark:
+                continue
+            scheduler.upsert_rental(rental)
+            if updated_at > watermark:
+                watermark, seen_at_watermark = updated_at, set()
+            if updated_at == watermark:
+                seen_at_watermark.add(rental["rental_id"])
+
+    def deliver(reminders):
+        stats = deliver_reminders(group_reminders_by_recipient(reminders))
+        print(f"[INFO] Sent {stats['sent']} reminder digest(s) for {len(reminders)} due reminder(s)")
+        # Reminders nobody could be sent stay unmarked, so they fire again later
+        reached = stats["dispatched_to"]
+        return [(kind, rental) for kind, rental in reminders
+                if rental.get("renter_id") in reached or rental.get("lender_id") in reached]
+
+    scheduler.run(deliver, stop=stop, on_idle=pull_changes, idle_interval=CHANGE_POLL_SECONDS)
 
 # =========================
 # Run Agent (for testing)
 # =========================
 if __name__ == "__main__":
-    result = run_engagement_agent({"days_ahead": 1})
-    print(f"[INFO] Engagement Agent Result: {result}")
+    with profiled("engagement"):
+        if "--scheduler" in sys.argv:
+            run_reminder_scheduler()
+        else:
+            result = run_engagement_agent({"days_ahead": 1})
+            print(f"[INFO] Engagement Agent Result: {result}")
@@ -0,0 +1,162 @@
+"""
+Reminder Scheduler
+------------------
+Precomputes reminder fire times per rental instead of rescanning every
+active rental on each run.
+
+- Each active rental gets one timer per entry in REMINDER_OFFSETS
+  (T-24h, T-1h, overdue +1d, overdue +3d) relative to its due time
+- Timers live in a heap; rentals are upserted / removed incrementally and
+  superseded timers are discarded lazily via a per-rental version
+- Sent state is persisted in SQLite, so a reminder fires at most once per
+  (rental, kind) across restarts
+- run() sleeps until the next timer is due or a rental changes
+"""
+
+import heapq
+import sqlite3
+import threading
+from datetime import date, datetime, time, timedelta
+
+# A rental is due at this UTC time on its end_date
+DUE_TIME = time(23, 59)
+
+REMINDER_OFFSETS = {
+    "due_in_24h": timedelta(hours=-24),
+    "due_in_1h": timedelta(hours=-1),
+    "overdue_1d": timedelta(days=1),
+    "overdue_3d": timedelta(days=3),
+}
+
+# Timers that were missed by more than this (e.g. while the scheduler was
+# down) are dropped instead of firing late
+MAX_LATENESS = timedelta(hours=6)
+
+
+def due_at(rental: dict) -> datetime:
+    end_date = rental["end_date"]
+    if isinstance(end_date, str):
+        end_date = date.fromisoformat(end_date[:10])
+    return datetime.combine(end_date, DUE_TIME)
+
+
+class ReminderScheduler:
+    def __init__(self, state_path: str = ":memory:", now=datetime.utcnow):
+        self.now = now
+        self._heap = []          # (fire_at, rental_id, kind, version)
+        self._rentals = {}       # rental_id -> (version, rental)
+        self._version = 0
+        self._cond = threading.Condition()
+
+        self.conn = sqlite3.connect(state_path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sent_reminders (
+                rental_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                sent_at TEXT NOT NULL,
+                PRIMARY KEY (rental_id, kind)
+            )
+        """)
+        self.conn.commit()
+
+    # ---- sent state ----
+
+    def was_sent(self, rental_id: str, kind: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM sent_reminders WHERE rental_id = ? AND kind = ?",
+                                (rental_id, kind)).fetchone()
+        return row is not None
+
+    def mark_sent(self, reminders):
+        """Persist [(kind, rental)] as delivered."""
+        sent_at = self.now().isoformat()
+        with self._cond:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO sent_reminders (rental_id, kind, sent_at) VALUES (?, ?, ?)",
+                [(rental["rental_id"], kind, sent_at) for kind, rental in reminders],
+            )
+            self.conn.commit()
+
+    # ---- incremental updates ----
+
+    def upsert_rental(self, rental: dict):
+        """Add or reschedule a rental's reminders; non-active rentals are removed."""
+        rental_id = rental["rental_id"]
+        if rental.get("status") != "active" or not rental.get("end_date"):
+            self.remove_rental(rental_id)
+            return
+
+        with self._cond:
+            self._version += 1
+            self._rentals[rental_id] = (self._version, rental)
+            due = due_at(rental)
+            for kind, offset in REMINDER_OFFSETS.items():
+                if not self.was_sent(rental_id, kind):
+                    heapq.heappush(self._heap, (due + offset, rental_id, kind, self._version))
+            self._cond.notify_all()
+
+    def remove_rental(self, rental_id: str):
+        with self._cond:
+            self._rentals.pop(rental_id, None)
+            self._cond.notify_all()
+
+    def load(self, rentals):
+        for rental in rentals:
+            self.upsert_rental(rental)
+
+    # ---- timers ----
+
+    def _is_current(self, rental_id: str, version: int) -> bool:
+        current = self._rentals.get(rental_id)
+        return current is not None and current[0] == version
+
+    def next_fire_time(self):
+        """Fire time of the earliest live timer, or None."""
+        with self._cond:
+            while self._heap and not self._is_current(self._heap[0][1], self._heap[0][3]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self) -> list:
+        """Return [(kind, rental)] for live, unsent timers that are due now."""
+        now = self.now()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, rental_id, kind, version = heapq.heappop(self._heap)
+                if not self._is_current(rental_id, version) or self.was_sent(rental_id, kind):
+                    continue
+                if now - fire_at > MAX_LATENESS:
+                    continue
+                due.append((kind, self._rentals[rental_id][1]))
+        return due
+
+    def wait(self, timeout: float = None):
+        """Sleep until the next timer is due, a rental changes, or timeout."""
+        next_fire = self.next_fire_time()
+        with self._cond:
+            if next_fire is not None:
+                until_due = max(0.0, (next_fire - self.now()).total_seconds())
+                timeout = until_due if timeout is None else min(timeout, until_due)
+            if timeout != 0:
+                self._cond.wait(timeout)
+
+    def run(self, deliver, stop: threading.Event = None, on_idle=None, idle_interval: float = None):
+        """
+        Deliver due reminders until `stop` is set.
+        deliver([(kind, rental)]) sends them and returns the ones it actually
+        dispatched (None means all of them); only those are marked sent, so a
+        reminder skipped for lack of a contact fires again once its rental is
+        rescheduled (next change or restart).
+        on_idle() is called at least every idle_interval seconds (e.g. to
+        pull rental changes) and may call upsert_rental / remove_rental.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            due = self.pop_due()
+            if due:
+                dispatched = deliver(due)
+                self.mark_sent(due if dispatched is None else dispatched)
+                continue
+            if on_idle is not None:
+                on_idle()
+            self.wait(idle_interval)
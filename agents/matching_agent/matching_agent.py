@@ -1,8 +1,18 @@
 # matching_agent.py
 import os
-from supabase import create_client, Client
+import sys
+import threading
+from datetime import datetime
+from supabase import Client
 from dotenv import load_dotenv
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from supabase_transport import get_client
+from result_cache import invalidate
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from text_index import ItemIndex
+
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
@@ -13,12 +23,30 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     print("[WARN] Supabase credentials not found for matching agent")
     supabase = None
 else:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Candidates retrieved from the text index before credibility ranking
+MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "20"))
+
+_item_index = None
+_item_index_lock = threading.Lock()
 
 # -------------------------
 # Helpers
 # -------------------------
 
+def get_item_index() -> ItemIndex:
+    """Process-wide BM25 index over available items, refreshed incrementally."""
+    global _item_index
+    with _item_index_lock:
+        if _item_index is None:
+            _item_index = ItemIndex(supabase)
+    return _item_index
+
+def search_items(query: str, k: int = MATCH_TOP_K):
+    """Top-k available items for a free-form request such as "DSLR camera"."""
+    return get_item_index().search(query, k)
+
 def fetch_available_items(category: str):
     """Fetch all available items of a given category"""
     response = (
@@ -40,13 +68,26 @@ def get_owner_credibility(user_id: str) -> float:
         return data["credibility_score"]
     return 0
 
+def rank_items(items):
+    """Items by owner credibility, best first"""
+    return sorted(items, key=lambda x: get_owner_credibility(x.get("user_id")), reverse=True)
+
 def select_best_item(items):
     """Pick the best item based on owner's credibility"""
     if not items:
         return None
-    # Sort items by owner credibility descending
-    items.sort(key=lambda x: get_owner_credibility(x.get("user_id")), reverse=True)
-    return items[0]
+    return rank_items(items)[0]
+
+def claim_item(item_id: str) -> bool:
+    """
+    Mark an item unavailable if it still is. False means another rental
+    claimed it first (rentals are matched concurrently).
+    """
+    response = supabase.table("items").update({
+        "available": False,
+        "updated_at": datetime.utcnow().isoformat()
+    }).eq("item_id", item_id).eq("available", True).execute()
+    return bool(response.data)
 
 # -------------------------
 # Main Function for Orchestrator
@@ -65,22 +106,24 @@ def match_rentals(rental: dict) -> dict:
         rental_id = rental["rental_id"]
         category = rental.get("item_type") or "General"
 
-        # Fetch available items
-        items = fetch_available_items(category)
-        best_item = select_best_item(items)
+        # Top-k text matches first; fall back to the exact category scan
+        items = search_items(category) or fetch_available_items(category)
 
-        if best_item:
+        # Claim the best item still available; one taken since the search moves on to the next
+        for best_item in rank_items(items):
             item_id = best_item["item_id"]
+            claimed = claim_item(item_id)
+            get_item_index().remove(item_id)
+            if not claimed:
+                print(f"[INFO] Item {item_id} was claimed by another rental, trying the next match")
+                continue
 
-            # Assign item and mark unavailable
             supabase.table("rentals").update({
                 "item_id": item_id,
-                "status": "active"
+                "status": "active",
+                "updated_at": datetime.utcnow().isoformat()
             }).eq("rental_id", rental_id).execute()
-
-            supabase.table("items").update({
-                "available": False
-            }).eq("item_id", item_id).execute()
+            invalidate(f"rental:{rental_id}", f"item:{item_id}")
 
             print(f"[INFO] Rental {rental_id} assigned item {item_id}")
             return {"item_id": item_id}
@@ -0,0 +1,169 @@
+"""
+recommendations.py
+
+Offline "people who rented this also rented" job.
+
+- Streams (renter_id, item_id) pairs from `rentals`
+- Builds a sparse binary renter x item matrix and computes item-item
+  cosine similarity with sparse matrix products, a block of items at a
+  time so memory stays bounded
+- Keeps the top-k neighbours per item and saves them as a compact .npz
+  lookup table (item ids, neighbour indices, scores)
+
+Recommendations.load() reads the table back; similar(item_id) is a dict
+lookup plus one row slice.
+
+Usage:
+    python recommendations.py --out recommendations.npz --k 20
+"""
+
+import os
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_K = 20
+DEFAULT_PATH = os.getenv("RECOMMENDATIONS_PATH",
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations.npz"))
+
+# Item columns per similarity block
+BLOCK_SIZE = 2048
+PAGE_SIZE = 10000
+
+
+# =========================
+# Loading
+# =========================
+def stream_rental_pairs(supabase, page_size: int = PAGE_SIZE):
+    """Yield (renter_id, item_id) for every rental with both set, in rental_id keyset pages."""
+    last = None
+    while True:
+        query = supabase.table("rentals").select("rental_id, renter_id, item_id").not_.is_("item_id", "null")
+        if last is not None:
+            query = query.gt("rental_id", last)
+        rows = query.order("rental_id").limit(page_size).execute().data or []
+        for row in rows:
+            if row.get("renter_id") and row.get("item_id"):
+                yield row["renter_id"], row["item_id"]
+        if len(rows) < page_size:
+            return
+        last = rows[-1]["rental_id"]
+
+
+def interaction_matrix(pairs):
+    """Binary CSR renter x item matrix and the item id for each column."""
+    renters, items = [], []
+    for renter_id, item_id in pairs:
+        renters.append(renter_id)
+        items.append(item_id)
+    renter_ids, rows = np.unique(np.array(renters, dtype=str), return_inverse=True)
+    item_ids, cols = np.unique(np.array(items, dtype=str), return_inverse=True)
+
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                               shape=(len(renter_ids), len(item_ids)))
+    # Repeat rentals of the same item count once
+    matrix.sum_duplicates()
+    matrix.data[:] = 1.0
+    return matrix, item_ids
+
+
+# =========================
+# Similarity
+# =========================
+def top_k_similar(matrix, k: int = DEFAULT_K, block_size: int = BLOCK_SIZE):
+    """
+    Item-item cosine top-k. Returns (neighbours int32 [n_items, k], scores
+    float32 [n_items, k]); missing neighbours are -1 / 0.
+    """
+    n_items = matrix.shape[1]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = (matrix @ sparse.diags(1.0 / norms)).tocsc().astype(np.float32)
+    normalized_t = normalized.T.tocsr()
+
+    neighbours = np.full((n_items, k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, k), dtype=np.float32)
+
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        # (n_items x block) similarities; only co-rented pairs are non-zero
+        block = (normalized_t @ normalized[:, start:stop]).tocsc()
+        for j in range(stop - start):
+            item = start + j
+            lo, hi = block.indptr[j], block.indptr[j + 1]
+            candidates = block.indices[lo:hi]
+            values = block.data[lo:hi]
+            keep = candidates != item
+            candidates, values = candidates[keep], values[keep]
+            if not len(values):
+                continue
+            if len(values) > k:
+                top = np.argpartition(-values, k)[:k]
+                candidates, values = candidates[top], values[top]
+            order = np.argsort(-values, kind="stable")
+            neighbours[item, :len(order)] = candidates[order]
+            scores[item, :len(order)] = values[order]
+    return neighbours, scores
+
+
+def build(supabase, path: str = DEFAULT_PATH, k: int = DEFAULT_K) -> dict:
+    matrix, item_ids = interaction_matrix(stream_rental_pairs(supabase))
+    neighbours, scores = top_k_similar(matrix, k)
+    np.savez_compressed(path, item_ids=item_ids, neighbours=neighbours, scores=scores)
+    return {"items": len(item_ids), "renters": matrix.shape[0], "rentals": int(matrix.nnz), "k": k, "path": path}
+
+
+# =========================
+# Lookup
+# =========================
+class Recommendations:
+    def __init__(self, item_ids, neighbours, scores):
+        self.item_ids = item_ids
+        self.neighbours = neighbours
+        self.scores = scores
+        self.positions = {item_id: i for i, item_id in enumerate(item_ids.tolist())}
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_PATH):
+        with np.load(path) as data:
+            return cls(data["item_ids"], data["neighbours"], data["scores"])
+
+    def similar(self, item_id: str, k: int = None) -> list:
+        """[(item_id, score)] of items most often co-rented with item_id, best first."""
+        row = self.positions.get(item_id)
+        if row is None:
+            return []
+        neighbours = self.neighbours[row][:k]
+        scores = self.scores[row][:k]
+        return [(self.item_ids[n], float(s)) for n, s in zip(neighbours, scores) if n >= 0]
+
+
+_loaded = None
+
+
+def similar_items(item_id: str, k: int = None, path: str = DEFAULT_PATH) -> list:
+    """Neighbours from the most recently built table (loaded once per process)."""
+    global _loaded
+    if _loaded is None or _loaded[0] != path:
+        _loaded = (path, Recommendations.load(path))
+    return _loaded[1].similar(item_id, k)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from dotenv import load_dotenv
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from supabase_transport import get_client
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+
+    parser = argparse.ArgumentParser(description="Build the co-rental recommendation table")
+    parser.add_argument("--out", default=DEFAULT_PATH, help="Output .npz path")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="Neighbours kept per item")
+    args = parser.parse_args()
+
+    client = get_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY"))
+    print(f"[INFO] Recommendations built: {build(client, args.out, args.k)}")
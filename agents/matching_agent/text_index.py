@@ -0,0 +1,179 @@
+"""
+text_index.py
+
+In-process BM25 inverted index over available items, so free-form
+requests like "DSLR camera" retrieve the best-matching items directly
+instead of scanning a whole category.
+
+- Title, category and description are tokenized into one postings list
+  per term; title and category terms count FIELD_WEIGHTS times
+- Documents can be added, replaced and removed one at a time
+- ItemIndex keeps the index in sync with `items` incrementally, pulling
+  only rows whose updated_at is at or after the last refresh's watermark
+  (inclusive, so rows written in the same timestamp tick are not missed;
+  rows already applied at the watermark are skipped). It is shared by
+  the orchestrator's rental workers, so every access holds its lock
+"""
+
+import heapq
+import math
+import re
+import threading
+import time
+from datetime import datetime
+
+K1 = 1.2
+B = 0.75
+
+FIELD_WEIGHTS = {"title": 3, "category": 2, "description": 1}
+
+STOPWORDS = {"a", "an", "and", "the", "for", "of", "to", "in", "on", "with", "or", "my", "i", "need", "want", "rent"}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in _TOKEN.findall((text or "").lower()):
+        if token in STOPWORDS:
+            continue
+        # Light plural folding: "cameras" -> "camera", but keep "glass", "bus"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}      # term -> {doc_id: term frequency}
+        self.doc_terms = {}     # doc_id -> {term: term frequency}
+        self.doc_len = {}
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.doc_len
+
+    def add(self, doc_id, fields: dict):
+        """Index (or re-index) a document from {field: text}."""
+        self.remove(doc_id)
+        terms = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1)
+            for token in tokenize(text):
+                terms[token] = terms.get(token, 0) + weight
+        if not terms:
+            return
+
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = sum(terms.values())
+        self.total_len += self.doc_len[doc_id]
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(doc_id)
+        for term in terms:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 20) -> list:
+        """[(doc_id, score)] for the top-k documents, best first."""
+        n = len(self.doc_len)
+        if not n:
+            return []
+        avgdl = self.total_len / n
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class ItemIndex:
+    """BM25 index over available items, refreshed incrementally from Supabase."""
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, supabase, refresh_seconds: float = 60.0):
+        self.supabase = supabase
+        self.refresh_seconds = refresh_seconds
+        self.index = BM25Index()
+        self.items = {}
+        self.watermark = None
+        self.seen_at_watermark = set()      # item ids already applied at exactly the watermark
+        self.refreshed_at = 0.0
+        # Reentrant: refresh() upserts and search() refreshes under the same lock
+        self._lock = threading.RLock()
+
+    def upsert(self, item: dict):
+        item_id = item["item_id"]
+        with self._lock:
+            if not item.get("available", True):
+                self.remove(item_id)
+                return
+            self.items[item_id] = item
+            self.index.add(item_id, {field: item.get(field) for field in FIELD_WEIGHTS})
+
+    def remove(self, item_id):
+        with self._lock:
+            self.items.pop(item_id, None)
+            self.index.remove(item_id)
+
+    def refresh(self, force: bool = False):
+        """Load all available items once, then only items updated since the last refresh."""
+        with self._lock:
+            # Concurrent callers wait for one refresh instead of each running their own
+            if not force and time.monotonic() - self.refreshed_at < self.refresh_seconds:
+                return
+            self._refresh()
+
+    def _refresh(self):
+        started = datetime.utcnow().isoformat()
+        since = self.watermark
+        start = 0
+        while True:
+            query = self.supabase.table("items").select("*")
+            if since is None:
+                query = query.eq("available", True)
+            else:
+                query = query.gte("updated_at", since)
+            rows = query.order("updated_at").range(start, start + self.PAGE_SIZE - 1).execute().data or []
+            for item in rows:
+                updated_at = item.get("updated_at")
+                if updated_at and updated_at == self.watermark and item["item_id"] in self.seen_at_watermark:
+                    continue
+                self.upsert(item)
+                if not updated_at:
+                    continue
+                if self.watermark is None or updated_at > self.watermark:
+                    self.watermark, self.seen_at_watermark = updated_at, set()
+                if updated_at == self.watermark:
+                    self.seen_at_watermark.add(item["item_id"])
+            if len(rows) < self.PAGE_SIZE:
+                break
+            start += self.PAGE_SIZE
+        if self.watermark is None:
+            self.watermark = started
+        self.refreshed_at = time.monotonic()
+
+    def search(self, query: str, k: int = 20) -> list:
+        """Top-k available items for a free-form query, best first."""
+        with self._lock:
+            self.refresh()
+            return [self.items[item_id] for item_id, _ in self.index.search(query, k)]
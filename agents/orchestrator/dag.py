@@ -0,0 +1,116 @@
+"""
+dag.py
+
+Dependency-aware stage scheduler for the orchestrator.
+
+A pipeline is a set of Stages. Each stage declares
+- after:  stages whose results it needs (their outputs are passed in)
+- needs:  rental fields that must be present, otherwise the stage is skipped
+
+Stages whose dependencies are satisfied run concurrently on a shared thread
+pool. A stage returns HALT (or raises StageHalted) to stop everything
+downstream of it; a stage that raises is recorded as failed and its
+dependents are skipped as well.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class StageHalted(Exception):
+    """Raised by a stage to short-circuit its dependents."""
+
+
+HALT = object()
+
+# Stage states
+DONE = "done"
+HALTED = "halted"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Stage:
+    def __init__(self, name: str, fn, after=(), needs=()):
+        """fn(rental, upstream) -> result; upstream is {stage name: result} for `after`."""
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.needs = tuple(needs)
+
+
+class Pipeline:
+    def __init__(self, stages, max_workers: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in pipeline at stage '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].after:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def _call(self, stage: Stage, rental: dict, results: dict):
+        try:
+            result = stage.fn(rental, {dep: results[dep] for dep in stage.after})
+        except StageHalted:
+            return HALTED, None
+        return (HALTED, None) if result is HALT else (DONE, result)
+
+    def run(self, rental: dict, executor: ThreadPoolExecutor = None):
+        """
+        Run every stage for one rental.
+        Returns (states, results): {stage: DONE | HALTED | FAILED | SKIPPED}
+        and {stage: result} for stages that completed.
+        """
+        states, results = {}, {}
+        pending = dict(self.stages)
+        running = {}
+        own_executor = executor is None
+        executor = executor or ThreadPoolExecutor(max_workers=self.max_workers)
+
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    dep_states = [states.get(dep) for dep in stage.after]
+                    if any(state in (HALTED, FAILED, SKIPPED) for state in dep_states):
+                        states[name] = SKIPPED
+                    elif any(rental.get(field) in (None, "") for field in stage.needs):
+                        states[name] = SKIPPED
+                    elif all(state == DONE for state in dep_states):
+                        running[executor.submit(self._call, stage, rental, results)] = name
+                    else:
+                        continue
+                    del pending[name]
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        states[name], result = future.result()
+                    except Exception as e:
+                        states[name] = FAILED
+                        print(f"[ERROR] Stage '{name}' failed for rental {rental.get('rental_id')}: {e}")
+                        continue
+                    if states[name] == DONE:
+                        results[name] = result
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+
+        return states, results
@@ -0,0 +1,160 @@
+"""
+fair_scheduler.py
+
+Weighted fair scheduling of rentals across tenants.
+
+- Every rental belongs to a partition: its enterprise ("enterprise:<id>")
+  when the lender is an enterprise, otherwise the individual lender
+  ("lender:<id>"), or the renter ("renter:<id>") when no lender is set.
+  Only fields a pending rental already has are used: item_id is not
+  known until matching
+- Partitions are served by deficit round robin: each visit adds
+  quantum x weight to the partition's deficit, and jobs are dequeued
+  while their cost fits in it. A bulk import from one enterprise
+  interleaves with everyone else instead of running ahead of them
+- Per-partition throughput and queueing + processing latency (p50/p99)
+  are recorded as jobs complete
+
+next() and complete() are thread-safe so several workers can pull from
+one scheduler.
+"""
+
+import collections
+import math
+import threading
+import time
+
+DEFAULT_QUANTUM = 1.0
+DEFAULT_WEIGHT = 1.0
+
+
+def rental_partition(rental: dict, owner_enterprises: dict = None) -> str:
+    """
+    Partition key for a rental: the enterprise the lender owns, else the
+    lender, else the renter.
+    """
+    lender_id = rental.get("lender_id")
+    enterprise_id = (owner_enterprises or {}).get(lender_id)
+    if enterprise_id:
+        return f"enterprise:{enterprise_id}"
+    if lender_id:
+        return f"lender:{lender_id}"
+    return f"renter:{rental.get('renter_id') or 'unknown'}"
+
+
+def _valid_weight(weight: float) -> bool:
+    # A zero, negative or NaN weight never earns credit, so next() would spin forever
+    return math.isfinite(weight) and weight > 0
+
+
+def parse_weights(spec: str) -> dict:
+    """'enterprise:abc=2,lender:xyz=0.5' -> {partition: weight}; weights must be positive"""
+    weights = {}
+    for entry in (spec or "").split(","):
+        if "=" not in entry:
+            continue
+        partition, weight = entry.rsplit("=", 1)
+        try:
+            weight = float(weight)
+        except ValueError:
+            weight = None
+        if weight is None or not _valid_weight(weight):
+            print(f"[WARN] Ignoring partition weight '{entry}'")
+            continue
+        weights[partition.strip()] = weight
+    return weights
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(-(-q * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class DeficitRoundRobin:
+    def __init__(self, quantum: float = DEFAULT_QUANTUM, weights: dict = None):
+        if not _valid_weight(quantum):
+            raise ValueError(f"quantum must be positive, got {quantum}")
+        for partition, weight in (weights or {}).items():
+            if not _valid_weight(weight):
+                raise ValueError(f"Weight for partition '{partition}' must be positive, got {weight}")
+        self.quantum = quantum
+        self.weights = weights or {}
+        self.queues = {}                        # partition -> deque of (job, cost, enqueued_at)
+        self.deficit = collections.defaultdict(float)
+        self.active = collections.deque()       # partitions with queued jobs, in round order
+        self._visiting = None                   # head partition that already got this visit's quantum
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def weight(self, partition: str) -> float:
+        return self.weights.get(partition, DEFAULT_WEIGHT)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def add(self, partition: str, job, cost: float = 1.0):
+        with self._lock:
+            queue = self.queues.setdefault(partition, collections.deque())
+            if not queue:
+                self.active.append(partition)
+                self.deficit[partition] = 0.0
+            queue.append((job, cost, time.monotonic()))
+            self._stats.setdefault(partition, {"latencies": [], "first_start": None, "last_finish": None})
+
+    def next(self):
+        """(partition, job, enqueued_at) for the next job in fair order, or None when empty."""
+        with self._lock:
+            while self.active:
+                partition = self.active[0]
+                queue = self.queues[partition]
+                if self._visiting != partition:
+                    self.deficit[partition] += self.quantum * self.weight(partition)
+                    self._visiting = partition
+
+                job, cost, enqueued_at = queue[0]
+                if cost <= self.deficit[partition]:
+                    queue.popleft()
+                    self.deficit[partition] -= cost
+                    if not queue:
+                        # An idle partition does not bank credit for later
+                        self.active.popleft()
+                        self.deficit[partition] = 0.0
+                        self._visiting = None
+                    stats = self._stats[partition]
+                    if stats["first_start"] is None:
+                        stats["first_start"] = time.monotonic()
+                    return partition, job, enqueued_at
+
+                # Out of credit this round: move on to the next partition
+                self.active.rotate(-1)
+                self._visiting = None
+            return None
+
+    def complete(self, partition: str, enqueued_at: float):
+        """Record a finished job's latency (enqueue to completion)."""
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats[partition]
+            stats["latencies"].append(now - enqueued_at)
+            stats["last_finish"] = now
+
+    def report(self) -> dict:
+        """{partition: {completed, throughput_per_s, p50_latency_s, p99_latency_s, weight}}"""
+        with self._lock:
+            report = {}
+            for partition, stats in self._stats.items():
+                latencies = stats["latencies"]
+                if not latencies:
+                    continue
+                span = stats["last_finish"] - stats["first_start"]
+                report[partition] = {
+                    "completed": len(latencies),
+                    "throughput_per_s": round(len(latencies) / span, 3) if span > 0 else None,
+                    "p50_latency_s": round(percentile(latencies, 50), 3),
+                    "p99_latency_s": round(percentile(latencies, 99), 3),
+                    "weight": self.weight(partition),
+                }
+            return report
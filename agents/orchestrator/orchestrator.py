@@ -1,14 +1,28 @@
 # orchestrator.py
 import os
 import sys
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # -------------------------
 # Supabase Setup
 # -------------------------
-from supabase import create_client, Client
+from supabase import Client
+
+# Shared pooled transport lives in the agents directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from supabase_transport import get_client, transport_stats
+from result_cache import invalidate
+from profiling import profiled
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from dag import DONE, FAILED, HALT, Pipeline, Stage
+from fair_scheduler import DeficitRoundRobin, parse_weights, rental_partition
+import work_queue
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
@@ -19,14 +33,16 @@ SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("Supabase credentials not found in .env")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Preprocessing tier for damage verification ("fast", "balanced", "accurate").
+# A rental can override it with its own "verification_tier" field.
+VERIFICATION_TIER = os.getenv("VERIFICATION_TIER", "accurate")
+
+supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
 
 # -------------------------
 # Import Real Agents
 # -------------------------
-# Add parent directory to Python path to import sibling modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+# Sibling agent packages resolve through the agents directory added above
 try:
     from matching_agent.matching_agent import match_rentals as matching_agent
     print("[INFO] Imported real matching agent")
@@ -52,40 +68,71 @@ except ImportError as e:
         return {"ok": True, "trust_score": 0.85}
 
 try:
-    from verification_agent.main import verify_damage as verification_agent
+    from verification_agent.main import delete_damage_mask, store_damage_mask, verify_damage as verification_agent
     print("[INFO] Imported real verification agent")
 except ImportError as e:
     print(f"[WARN] Could not import verification agent: {e}")
-    def verification_agent(rental_id, before_image, after_image):
+    def verification_agent(rental_id, before_image, after_image, tier=VERIFICATION_TIER):
         return {"damage_detected": False, "confidence": 0.95}
+    def store_damage_mask(result, rental_id):
+        result.pop("damage_mask", None)
+        return None
+    def delete_damage_mask(mask_key):
+        pass
 
 # -------------------------
 # Helpers: Supabase Interactions
 # -------------------------
 
+def fetch_disputed_rental_ids() -> set:
+    """Rentals with a damage report still pending review"""
+    response = supabase.table("damage_reports").select("rental_id").eq("status", "pending").execute()
+    return {row["rental_id"] for row in response.data or []}
+
 def fetch_rentals(status="pending") -> List[Dict]:
     """Fetch pending rentals from Supabase"""
     response = supabase.table("rentals").select("*").eq("status", status).execute()
     return response.data or []
 
+def fetch_rental(rental_id: str) -> Dict:
+    """Current row for one rental, or None if it no longer exists"""
+    response = supabase.table("rentals").select("*").eq("rental_id", rental_id).limit(1).execute()
+    return response.data[0] if response.data else None
+
+def fetch_owner_enterprises() -> Dict:
+    """{owner_id: enterprise_id}, for partitioning rentals by their lender's enterprise"""
+    response = supabase.table("enterprises").select("enterprise_id, owner_id").execute()
+    return {row["owner_id"]: row["enterprise_id"] for row in response.data or [] if row.get("owner_id")}
+
 def update_rental_item(rental_id: str, item_id: str):
     """Update rental with matched item and set status to active"""
     supabase.table("rentals").update({
         "item_id": item_id, 
-        "status": "active"
+        "status": "active",
+        "updated_at": datetime.utcnow().isoformat()
     }).eq("rental_id", rental_id).execute()
+    invalidate(f"rental:{rental_id}", f"item:{item_id}")
 
 def update_rental_price(rental_id: str, price: float):
     """Update rental total cost"""
-    supabase.table("rentals").update({"total_cost": price}).eq("rental_id", rental_id).execute()
+    supabase.table("rentals").update({
+        "total_cost": price,
+        "updated_at": datetime.utcnow().isoformat()
+    }).eq("rental_id", rental_id).execute()
+    invalidate(f"rental:{rental_id}")
 
 def store_verification(verification_result: dict):
     """Insert verification result into damage_reports table"""
     supabase.table("damage_reports").insert(verification_result).execute()
+    invalidate(f"rental:{verification_result.get('rental_id')}", f"user:{verification_result.get('reporter_id')}")
 
 def mark_rental_flagged(rental_id: str):
     """Flag rental if trust fails"""
-    supabase.table("rentals").update({"status": "flagged"}).eq("rental_id", rental_id).execute()
+    supabase.table("rentals").update({
+        "status": "flagged",
+        "updated_at": datetime.utcnow().isoformat()
+    }).eq("rental_id", rental_id).execute()
+    invalidate(f"rental:{rental_id}")
     print(f"[WARN] Rental {rental_id} flagged due to trust issues")
 
 
@@ -93,6 +140,119 @@ def mark_rental_flagged(rental_id: str):
 # Orchestrator Loop
 # -------------------------
 
+# Each stage declares what it runs after and which rental fields it needs.
+# Trust and verification only start once matching went through, and
+# verification waits for trust_gate, so a rental that matches nothing or is
+# flagged never pays for damage verification. Pricing runs alongside trust
+# and verification.
+
+def matching_stage(rental, upstream):
+    matched_item = matching_agent(rental)  # Must return dict with "item_id"
+    if not (matched_item and matched_item.get("item_id")):
+        print(f"[WARN] No matching item found for rental {rental['rental_id']}")
+        return HALT
+    update_rental_item(rental["rental_id"], matched_item["item_id"])
+    print(f"[INFO] Rental {rental['rental_id']} assigned item {matched_item['item_id']}")
+    return matched_item
+
+def pricing_stage(rental, upstream):
+    price = pricing_agent(rental["rental_id"])
+    if price:
+        update_rental_price(rental["rental_id"], price)
+        print(f"[INFO] Rental {rental['rental_id']} price updated to {price}")
+    return price
+
+def trust_stage(rental, upstream):
+    return trust_agent(rental["renter_id"], rental["lender_id"])
+
+def trust_gate_stage(rental, upstream):
+    if not upstream["trust"].get("ok", True):
+        mark_rental_flagged(rental["rental_id"])
+        return HALT
+    print(f"[INFO] Trust check passed for rental {rental['rental_id']}")
+    return True
+
+def verification_stage(rental, upstream):
+    return verification_agent(
+        rental_id=rental["rental_id"],
+        before_image=rental["image_before_url"],
+        after_image=rental["image_after_url"],
+        tier=rental.get("verification_tier") or VERIFICATION_TIER
+    )
+
+def store_verification_stage(rental, upstream):
+    verification_result = dict(upstream["verification"])
+    # The mask is only stored now that the report is actually being saved
+    stored = store_damage_mask(verification_result, rental["rental_id"])
+    if stored:
+        verification_result["damage_heatmap_url"] = stored["url"]
+    # Add extra fields expected in damage_reports
+    verification_result.update({
+        "rental_id": rental["rental_id"],
+        "reporter_id": rental.get("renter_id"),
+        "status": "pending",
+        "verified_by_agent": True
+    })
+    try:
+        store_verification(verification_result)
+    except Exception:
+        if stored:
+            # No report references the mask, so do not leave it in storage
+            try:
+                delete_damage_mask(stored["key"])
+            except Exception as e:
+                print(f"[WARN] Could not remove orphaned damage mask {stored['key']}: {e}")
+        raise
+    print(f"[INFO] Verification result stored for rental {rental['rental_id']}")
+    return True
+
+RENTAL_PIPELINE = Pipeline([
+    Stage("matching", matching_stage),
+    Stage("pricing", pricing_stage, after=["matching"]),
+    Stage("trust", trust_stage, after=["matching"], needs=["renter_id", "lender_id"]),
+    Stage("trust_gate", trust_gate_stage, after=["matching", "trust"]),
+    Stage("verification", verification_stage, after=["trust_gate"], needs=["image_before_url", "image_after_url"]),
+    Stage("store_verification", store_verification_stage, after=["trust_gate", "verification"]),
+])
+
+# Re-run only verification (and storing its report) for a rental whose
+# verification failed after matching and trust already went through
+VERIFICATION_RETRY_PIPELINE = Pipeline([
+    Stage("verification", verification_stage, needs=["image_before_url", "image_after_url"]),
+    Stage("store_verification", store_verification_stage, after=["verification"]),
+])
+
+# Threads shared by the stages of one rental
+STAGE_WORKERS = int(os.getenv("ORCHESTRATOR_STAGE_WORKERS", "4"))
+
+def process_rental(rental: Dict, executor: ThreadPoolExecutor = None) -> Dict:
+    """Run the stage DAG for one rental. Returns {stage: state}."""
+    rental_id = rental["rental_id"]
+    print(f"\n[INFO] Processing rental: {rental_id}")
+    states, _ = RENTAL_PIPELINE.run(rental, executor)
+    if states.get("matching") == DONE and states.get("trust_gate") == DONE:
+        if states.get("verification") == FAILED:
+            # No damage report was stored; retry verification alone
+            queue_verification_retry(rental)
+        print(f"[INFO] Rental {rental_id} processed successfully.")
+    return states
+
+# -------------------------
+# Orchestrator Loop
+# -------------------------
+
+# Pending rentals are partitioned by enterprise (or lender) and interleaved
+# by deficit round robin, so one tenant's bulk import cannot starve the rest.
+RENTAL_WORKERS = int(os.getenv("ORCHESTRATOR_RENTAL_WORKERS", "4"))
+PARTITION_WEIGHTS = parse_weights(os.getenv("ORCHESTRATOR_PARTITION_WEIGHTS", ""))
+# Rentals with images also run damage verification, which dominates their runtime
+VERIFICATION_COST = float(os.getenv("ORCHESTRATOR_VERIFICATION_COST", "3"))
+
+def rental_cost(rental: Dict) -> float:
+    if rental.get("image_before_url") and rental.get("image_after_url"):
+        return VERIFICATION_COST
+    return 1.0
+
 def orchestrate():
     rentals = fetch_rentals(status="pending")
 
@@ -100,60 +260,140 @@ def orchestrate():
         print("[INFO] No pending rentals found")
         return
 
+    owner_enterprises = fetch_owner_enterprises()
+    scheduler = DeficitRoundRobin(quantum=VERIFICATION_COST, weights=PARTITION_WEIGHTS)
     for rental in rentals:
-        rental_id = rental["rental_id"]
-        print(f"\n[INFO] Processing rental: {rental_id}")
-
-        # ---- Matching Agent ----
-        matched_item = matching_agent(rental)  # Must return dict with "item_id"
-        if matched_item and matched_item.get("item_id"):
-            update_rental_item(rental_id, matched_item["item_id"])
-            print(f"[INFO] Rental {rental_id} assigned item {matched_item['item_id']}")
-        else:
-            print(f"[WARN] No matching item found for rental {rental_id}")
-            continue
-
-        # ---- Pricing Agent ----
-        price = pricing_agent(rental_id)
-        if price:
-            update_rental_price(rental_id, price)
-            print(f"[INFO] Rental {rental_id} price updated to {price}")
-
-        # ---- Trust Agent ----
-        trust_result = trust_agent(rental["renter_id"], rental["lender_id"])
-        if not trust_result.get("ok", True):
-            mark_rental_flagged(rental_id)
-            print(f"[WARN] Rental {rental_id} flagged due to trust issues")
-            continue
-        else:
-            print(f"[INFO] Trust check passed for rental {rental_id}")
-
-        # ---- Verification Agent ----
-        # Fetch before/after images for this rental from damage_reports if exists
-        before_image = rental.get("image_before_url")
-        after_image = rental.get("image_after_url")
-        if before_image and after_image:
-            verification_result = verification_agent(
-                rental_id=rental_id,
-                before_image=before_image,
-                after_image=after_image
-            )
-            # Add extra fields expected in damage_reports
-            verification_result.update({
-                "rental_id": rental_id,
-                "reporter_id": rental.get("renter_id"),
-                "status": "pending",
-                "verified_by_agent": True
-            })
-            store_verification(verification_result)
-            print(f"[INFO] Verification result stored for rental {rental_id}")
+        scheduler.add(rental_partition(rental, owner_enterprises), rental, rental_cost(rental))
+    print(f"[INFO] {len(rentals)} pending rental(s) across {len(scheduler.queues)} partition(s)")
 
-        print(f"[INFO] Rental {rental_id} processed successfully.")
+    def worker():
+        while True:
+            picked = scheduler.next()
+            if picked is None:
+                return
+            partition, rental, enqueued_at = picked
+            try:
+                process_rental(rental, executor)
+            except Exception as e:
+                print(f"[ERROR] Rental {rental['rental_id']} failed: {e}")
+            scheduler.complete(partition, enqueued_at)
+
+    with ThreadPoolExecutor(max_workers=STAGE_WORKERS) as executor:
+        workers = [threading.Thread(target=worker, name=f"rental-worker-{i}") for i in range(RENTAL_WORKERS)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    for partition, stats in sorted(scheduler.report().items()):
+        print(f"[INFO] Partition {partition}: {stats}")
+
+# -------------------------
+# Work Queue
+# -------------------------
+# Several orchestrator processes can share this queue; ORCHESTRATOR_QUEUE_DB moves it
+WORK_QUEUE_DB = os.getenv("ORCHESTRATOR_QUEUE_DB",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "work_queue.db"))
+LEASE_SECONDS = int(os.getenv("ORCHESTRATOR_LEASE_SECONDS", str(work_queue.DEFAULT_LEASE_SECONDS)))
+IDLE_POLL_SECONDS = 5
+
+_retry_queue = None
+_retry_queue_lock = threading.Lock()
+
+def queue_verification_retry(rental: Dict) -> bool:
+    """Queue a verification-only job for a rental; --worker runs it with backoff."""
+    global _retry_queue
+    with _retry_queue_lock:
+        if _retry_queue is None:
+            _retry_queue = work_queue.SQLiteWorkQueue(WORK_QUEUE_DB)
+    queued = _retry_queue.enqueue(f"{rental['rental_id']}:verification", dict(rental, retry="verification"),
+                                  lane="verification")
+    print(f"[WARN] Verification failed for rental {rental['rental_id']}, queued for retry")
+    return queued
+
+def rental_lane(rental: Dict, disputed: set) -> str:
+    if rental["rental_id"] in disputed:
+        return "dispute"
+    if rental.get("image_before_url") and rental.get("image_after_url"):
+        return "verification"
+    return "matching"
+
+def enqueue_rentals(queue) -> int:
+    """Queue every pending rental once. Returns how many were newly queued."""
+    disputed = fetch_disputed_rental_ids()
+    queued = 0
+    for rental in fetch_rentals(status="pending"):
+        queued += queue.enqueue(rental["rental_id"], rental, lane=rental_lane(rental, disputed))
+    print(f"[INFO] Queued {queued} rental(s): {queue.counts()}")
+    return queued
+
+def run_worker(queue, exit_when_idle: bool = False):
+    """Claim rentals from the queue and process them, heartbeating the lease meanwhile."""
+    owner = work_queue.worker_id()
+    with ThreadPoolExecutor(max_workers=STAGE_WORKERS) as executor:
+        while True:
+            job = queue.claim(owner, LEASE_SECONDS)
+            if job is None:
+                if exit_when_idle:
+                    return
+                time.sleep(IDLE_POLL_SECONDS)
+                continue
+
+            done = threading.Event()
+
+            def heartbeat():
+                while not done.wait(LEASE_SECONDS / 3):
+                    if not queue.heartbeat(job["id"], owner, LEASE_SECONDS):
+                        print(f"[WARN] Lost lease on rental {job['key']}")
+                        return
+
+            beat = threading.Thread(target=heartbeat, daemon=True)
+            beat.start()
+            try:
+                if job["payload"].get("retry") == "verification":
+                    states, _ = VERIFICATION_RETRY_PIPELINE.run(job["payload"], executor)
+                    failed = [name for name, state in states.items() if state == FAILED]
+                else:
+                    # The payload is a snapshot from enqueue time; another worker
+                    # (or orchestrate()) may have processed the rental since
+                    rental = fetch_rental(job["payload"]["rental_id"])
+                    if rental is None or rental.get("status") != "pending":
+                        print(f"[INFO] Rental {job['key']} is no longer pending, skipping")
+                        states = {}
+                    else:
+                        states = process_rental(rental, executor)
+                    # A failed verification was already re-queued as its own job
+                    failed = [name for name, state in states.items()
+                              if state == FAILED and not (name == "verification" and states.get("trust_gate") == DONE)]
+            except Exception as e:
+                failed = [str(e)]
+            finally:
+                done.set()
+                beat.join()
+
+            if failed:
+                state = queue.fail(job["id"], owner, f"failed: {', '.join(failed)}")
+                if state is None:
+                    print(f"[WARN] Rental {job['key']} attempt {job['attempt']} failed after its lease was lost")
+                else:
+                    print(f"[WARN] Rental {job['key']} attempt {job['attempt']} failed, now {state}")
+            else:
+                queue.complete(job["id"], owner)
 
 # -------------------------
 # Entry Point
 # -------------------------
 
 if __name__ == "__main__":
-    print("[INFO] Starting Orchestrator...")
-    orchestrate()
+    with profiled("orchestrator"):
+        if "--enqueue" in sys.argv or "--worker" in sys.argv:
+            queue = work_queue.SQLiteWorkQueue(WORK_QUEUE_DB)
+            if "--enqueue" in sys.argv:
+                enqueue_rentals(queue)
+            if "--worker" in sys.argv:
+                print(f"[INFO] Orchestrator worker {work_queue.worker_id()} started")
+                run_worker(queue, exit_when_idle="--drain" in sys.argv)
+        else:
+            print("[INFO] Starting Orchestrator...")
+            orchestrate()
+        print(f"[INFO] Supabase transport: {transport_stats()}")
@@ -0,0 +1,187 @@
+"""
+work_queue.py
+
+Durable work queue for running several orchestrator workers at once.
+
+- Jobs are keyed (e.g. by rental_id); a key is only queued once while it
+  is ready or leased, so repeated enqueue runs do not double-process
+- Workers claim a job with a time-limited lease and extend it with
+  heartbeats; a job whose lease expires becomes claimable again
+- Priority lanes: lower lane numbers are always claimed first
+- Failed jobs are retried with exponential backoff and moved to the
+  dead-letter state once max_attempts is reached
+
+SQLiteWorkQueue is the local backend (WAL mode, safe across processes on
+one machine). Another storage backend only needs the same public methods.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+from typing import Optional
+
+# Claimed in this order
+LANES = {
+    "dispute": 0,        # verification disputes
+    "verification": 1,
+    "matching": 2,       # routine pending rentals
+}
+
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 5
+
+READY = "ready"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SQLiteWorkQueue:
+    def __init__(self, path: str, base_delay: float = 5.0, max_delay: float = 900.0):
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL,
+                lane INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (key) "
+                          "WHERE state IN ('ready', 'leased')")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, lane, available_at)")
+
+    def _write(self):
+        """Exclusive write transaction, so concurrent claimers never pick the same row."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    # ---- producers ----
+
+    def enqueue(self, key: str, payload: dict, lane: str = "matching", max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                delay: float = 0.0) -> bool:
+        """Queue a job. Returns False if the key is already ready or leased."""
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs (key, lane, payload, state, max_attempts, available_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, LANES[lane], json.dumps(payload, default=str), READY, max_attempts, now + delay, now),
+        )
+        return cursor.rowcount == 1
+
+    # ---- workers ----
+
+    def claim(self, owner: str, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        """Lease the highest-priority available job. Returns a job dict or None."""
+        now = time.time()
+        conn = self._write()
+        try:
+            # Leases that ran out without a heartbeat count as a failed attempt
+            conn.execute(
+                "UPDATE jobs SET state = ?, last_error = 'lease expired' "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (DEAD, LEASED, now),
+            )
+            row = conn.execute(
+                "SELECT id, key, lane, payload, attempts FROM jobs "
+                "WHERE (state = ? AND available_at <= ?) OR (state = ? AND lease_expires < ?) "
+                "ORDER BY lane, available_at LIMIT 1",
+                (READY, now, LEASED, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (LEASED, owner, now + lease_seconds, row[0]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"id": row[0], "key": row[1], "lane": row[2], "payload": json.loads(row[3]), "attempt": row[4] + 1}
+
+    def heartbeat(self, job_id: int, owner: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """Extend a lease. False means the lease was lost and the job may be running elsewhere."""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+            (time.time() + lease_seconds, job_id, LEASED, owner),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, owner: str) -> bool:
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = ?, lease_owner = NULL, lease_expires = NULL "
+            "WHERE id = ? AND state = ? AND lease_owner = ?",
+            (DONE, job_id, LEASED, owner),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, owner: str, error: str) -> Optional[str]:
+        """
+        Schedule a retry with backoff, or dead-letter the job. Returns the new
+        state, or None if the lease was lost (the job is not ours to fail).
+        """
+        conn = self._write()
+        try:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND state = ? AND lease_owner = ?",
+                               (job_id, LEASED, owner)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            attempts, max_attempts = row
+            state = DEAD if attempts >= max_attempts else READY
+            delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+            conn.execute(
+                "UPDATE jobs SET state = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL, last_error = ? "
+                "WHERE id = ?",
+                (state, time.time() + delay, error, job_id),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return state
+
+    # ---- operations ----
+
+    def counts(self) -> dict:
+        rows = self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {READY: 0, LEASED: 0, DONE: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def dead_letters(self, limit: int = 100) -> list:
+        rows = self.conn.execute(
+            "SELECT id, key, attempts, last_error FROM jobs WHERE state = ? ORDER BY id LIMIT ?", (DEAD, limit)
+        ).fetchall()
+        return [{"id": r[0], "key": r[1], "attempts": r[2], "last_error": r[3]} for r in rows]
+
+    def requeue_dead(self, job_id: int) -> bool:
+        """Give a dead-lettered job a fresh set of attempts (unless its key is queued again already)."""
+        try:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, available_at = ? WHERE id = ? AND state = ?",
+                (READY, time.time(), job_id, DEAD),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return cursor.rowcount == 1
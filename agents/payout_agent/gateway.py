@@ -0,0 +1,62 @@
+"""
+Payment Gateway
+---------------
+Gateway interface used by the payout agent.
+
+Every charge carries an idempotency key derived from the payment_id, so a
+payment that is retried (after a crash, a timeout or by a second worker)
+is charged at most once. StubGateway is the local stand-in used until a
+real UPI / card gateway is wired in; it honours idempotency keys the same
+way Razorpay and Stripe do, by replaying the first result.
+"""
+
+import random
+import threading
+import time
+import uuid
+
+# Fixed namespace so the same payment_id always maps to the same key
+IDEMPOTENCY_NAMESPACE = uuid.UUID("6f1c2a4e-3b7d-5e9f-8a1c-0d2e4f6a8b9c")
+
+
+def idempotency_key(payment_id: str) -> str:
+    return str(uuid.uuid5(IDEMPOTENCY_NAMESPACE, str(payment_id)))
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or timed out; the outcome is unknown."""
+
+
+class StubGateway:
+    """
+    Local gateway for testing. Simulates latency, declines and transient
+    errors, and records one charge per idempotency key.
+    """
+
+    def __init__(self, latency: float = 0.0, decline_rate: float = 0.0, error_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.decline_rate = decline_rate
+        self.error_rate = error_rate
+        self.charges = {}        # idempotency key -> result dict
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def charge(self, amount, method: str, key: str) -> dict:
+        """Returns {"success": bool, "reference": str}; raises GatewayError on transient failures."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if key in self.charges:
+                return self.charges[key]
+            if self._random.random() < self.error_rate:
+                raise GatewayError("gateway timeout")
+            result = {
+                "success": self._random.random() >= self.decline_rate,
+                "reference": f"stub_{key[:12]}",
+                "amount": amount,
+                "method": method,
+            }
+            self.charges[key] = result
+            return result
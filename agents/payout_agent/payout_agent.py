@@ -12,9 +12,20 @@ Tables used:
 - users
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from crewai import Agent, Task
-from supabase import create_client, Client
+from supabase import Client
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from supabase_transport import get_client
+from profiling import profiled
+from gateway import GatewayError, StubGateway, idempotency_key
+from reconciliation import reconcile
+from settlement import previous_day_window, settle
 
 # =========================
 # Environment Variables
@@ -22,7 +33,18 @@ import os
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Concurrent gateway calls per payout worker
+PAYOUT_CONCURRENCY = int(os.getenv("PAYOUT_CONCURRENCY", "32"))
+# Payments claimed per conditional update; also the status write batch size
+PAYOUT_BATCH_SIZE = 200
+# A payment left in 'processing' longer than this (worker crashed between
+# claim and status write) is handed back to 'pending'. Charges reuse the
+# payment's idempotency key, so re-processing it cannot charge twice.
+CLAIM_TIMEOUT_SECONDS = int(os.getenv("PAYOUT_CLAIM_TIMEOUT_SECONDS", "900"))
+
+gateway = StubGateway()
 
 # =========================
 # Helper Functions
@@ -38,28 +60,105 @@ def update_payment_status(payment_id: str, status: str):
     supabase.table("payments").update({"status": status}).eq("payment_id", payment_id).execute()
     print(f"[INFO] Payment {payment_id} updated to {status}")
 
-def process_payment(payment: dict):
+def claim_payments(payment_ids) -> list:
     """
-    Placeholder for real payment processing.
-    Integrate with:
-    - UPI (Razorpay, Google Pay API, etc.)
-    - Card gateways (Stripe, Razorpay, PayPal)
+    Move payments from 'pending' to 'processing'. The status filter makes the
+    transition conditional, so when several payout workers race for the same
+    rows each payment is claimed by exactly one of them.
+    Returns the claimed rows.
+    """
+    ids = list(payment_ids)
+    if not ids:
+        return []
+    response = (supabase.table("payments").update({"status": "processing", "claimed_at": datetime.utcnow().isoformat()})
+                .in_("payment_id", ids).eq("status", "pending").execute())
+    return response.data if response.data else []
+
+def reclaim_stale_payments(timeout_seconds: int = CLAIM_TIMEOUT_SECONDS) -> int:
+    """Return 'processing' payments whose claim is older than the timeout to 'pending'."""
+    cutoff = (datetime.utcnow() - timedelta(seconds=timeout_seconds)).isoformat()
+    released = {"status": "pending", "claimed_at": None}
+    stale = (supabase.table("payments").update(released)
+             .eq("status", "processing").lt("claimed_at", cutoff).execute()).data or []
+    # Rows claimed before claimed_at existed
+    stale += (supabase.table("payments").update(released)
+              .eq("status", "processing").is_("claimed_at", "null").execute()).data or []
+    if stale:
+        print(f"[WARN] Reclaimed {len(stale)} payment(s) stuck in processing")
+    return len(stale)
+
+def update_payment_statuses(results: dict):
+    """
+    Batched status write: one update per target status for all claimed
+    payments in `results` ({payment_id: status}).
+    """
+    by_status = {}
+    for payment_id, status in results.items():
+        by_status.setdefault(status, []).append(payment_id)
+    for status, ids in by_status.items():
+        (supabase.table("payments").update({"status": status, "claimed_at": None})
+         .in_("payment_id", ids).eq("status", "processing").execute())
+        print(f"[INFO] {len(ids)} payment(s) updated to {status}")
+
+def charge_payment(payment: dict) -> str:
+    """
+    Charge one payment through the gateway and return its new status.
+    Transient gateway errors return 'pending' so the payment is retried later
+    with the same idempotency key.
     """
     payment_id = payment.get("payment_id")
     amount = payment.get("amount")
     method = payment.get("payment_method")
-    
-    # Simulate success/failure
-    success = True  # Replace with actual API call result
-    
-    if success:
-        update_payment_status(payment_id, "completed")
+
+    try:
+        result = gateway.charge(amount, method, idempotency_key(payment_id))
+    except GatewayError as e:
+        print(f"[PAYMENT RETRY] {payment_id}: {e}")
+        return "pending"
+
+    if result["success"]:
         print(f"[PAYMENT SUCCESS] {payment_id}: {amount} via {method}")
-    else:
-        update_payment_status(payment_id, "failed")
-        print(f"[PAYMENT FAILED] {payment_id}: {amount} via {method}")
-    
-    return success
+        return "completed"
+    print(f"[PAYMENT FAILED] {payment_id}: {amount} via {method}")
+    return "failed"
+
+def process_payments(payments: list, concurrency: int = PAYOUT_CONCURRENCY, batch_size: int = PAYOUT_BATCH_SIZE) -> dict:
+    """
+    Claim payments in batches, charge them with bounded parallelism and
+    write statuses back in batches. Returns a count per resulting status.
+    """
+    counts = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for start in range(0, len(payments), batch_size):
+            batch = payments[start:start + batch_size]
+            claimed = claim_payments(p["payment_id"] for p in batch)
+            futures = {pool.submit(charge_payment, p): p["payment_id"] for p in claimed}
+
+            results = {}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    # Release the row instead of stranding it (and the batch) in 'processing'
+                    print(f"[ERROR] Payment {futures[future]} could not be processed: {e}")
+                    results[futures[future]] = "pending"
+            update_payment_statuses(results)
+
+            for status in results.values():
+                counts[status] = counts.get(status, 0) + 1
+    return counts
+
+def process_payment(payment: dict):
+    """
+    Process a single payment through the gateway.
+    Integrate with:
+    - UPI (Razorpay, Google Pay API, etc.)
+    - Card gateways (Stripe, Razorpay, PayPal)
+    """
+    status = charge_payment(payment)
+    if status != "pending":
+        update_payment_status(payment.get("payment_id"), status)
+    return status == "completed"
 
 # =========================
 # CrewAI Task
@@ -84,21 +183,43 @@ def run_payout_agent(task_input: dict):
     """
     Optional task_input can include:
     {
-        "process_all": True  # if set, process all pending payments
+        "process_all": True,        # if set, process all pending payments
+        "mode": "settlement",       # net the window into one transfer per lender instead,
+                                    # or "reconcile" to check payments against rentals.total_cost
+        "window_start": "<iso>",    # settlement window, defaults to the previous UTC day
+        "window_end": "<iso>",
+        "outdir": "settlements"
     }
     """
+    if task_input.get("mode") == "settlement":
+        window_start, window_end = previous_day_window()
+        if task_input.get("window_start"):
+            window_start = datetime.fromisoformat(task_input["window_start"])
+        if task_input.get("window_end"):
+            window_end = datetime.fromisoformat(task_input["window_end"])
+        return settle(supabase, window_start, window_end, outdir=task_input.get("outdir", "settlements"))
+    if task_input.get("mode") == "reconcile":
+        return reconcile(supabase, outdir=task_input.get("outdir", "reconciliation"))
+
+    reclaim_stale_payments()
     pending_payments = fetch_pending_payments()
-    processed_count = 0
-    
-    for payment in pending_payments:
-        if process_payment(payment):
-            processed_count += 1
-    
-    return {"payments_processed": processed_count}
+    counts = process_payments(pending_payments)
+
+    return {
+        "payments_processed": counts.get("completed", 0),
+        "payments_failed": counts.get("failed", 0),
+        "payments_retrying": counts.get("pending", 0),
+    }
 
 # =========================
 # Run Agent (for testing)
 # =========================
 if __name__ == "__main__":
-    result = run_payout_agent({})
-    print(f"[INFO] Payout Agent Result: {result}")
+    with profiled("payout"):
+        if "--settle" in sys.argv:
+            result = run_payout_agent({"mode": "settlement"})
+        elif "--reconcile" in sys.argv:
+            result = run_payout_agent({"mode": "reconcile"})
+        else:
+            result = run_payout_agent({})
+        print(f"[INFO] Payout Agent Result: {result}")
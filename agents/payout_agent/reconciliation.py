@@ -0,0 +1,189 @@
+"""
+Reconciliation
+--------------
+Checks payments.amount against rentals.total_cost (as set by the
+orchestrator's pricing step).
+
+Both tables are streamed in rental_id order: rentals in keyset pages, and
+for every page only the payments whose rental_id falls in that page's key
+range. Each chunk is joined with sorted arrays (np.argsort + np.searchsorted)
+and totals are summed with np.bincount in minor units, so memory stays
+bounded by the page size no matter how many rows the tables hold.
+
+Flags:
+- missing        billable rental with no completed payment
+- mismatch       completed payments do not add up to total_cost
+- double_charge  more than one completed payment for a rental
+- orphan         payment whose rental_id does not exist
+
+Outputs reconciliation_<date>.csv (one row per flagged rental / payment)
+and reconciliation_<date>.json (counts and totals).
+"""
+
+import csv
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Rentals per keyset page; payments are fetched for the same key range
+PAGE_SIZE = 5000
+
+# Rentals that are expected to have been paid for
+BILLABLE_STATUSES = ("active", "completed")
+
+# Allowed difference between paid and expected, in minor units
+TOLERANCE_MINOR = 1
+
+
+def _to_minor(values) -> np.ndarray:
+    return np.rint(np.array([float(v or 0) for v in values], dtype=np.float64) * 100).astype(np.int64)
+
+
+# =========================
+# Streaming
+# =========================
+def _keyset_pages(query_fn, key: str, page_size: int):
+    """Yield pages ordered by `key`, resuming after the last key of the previous page."""
+    last = None
+    while True:
+        query = query_fn()
+        if last is not None:
+            query = query.gt(key, last)
+        rows = query.order(key).limit(page_size).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1][key]
+
+
+def stream_rentals(supabase, page_size=PAGE_SIZE):
+    return _keyset_pages(lambda: supabase.table("rentals").select("rental_id, total_cost, status"),
+                         "rental_id", page_size)
+
+
+def fetch_payments_in_range(supabase, low, high, page_size=PAGE_SIZE) -> list:
+    """Completed payments with low < rental_id <= high (either bound may be None)."""
+    def query():
+        q = supabase.table("payments").select("payment_id, rental_id, amount").eq("status", "completed")
+        if low is not None:
+            q = q.gt("rental_id", low)
+        if high is not None:
+            q = q.lte("rental_id", high)
+        return q
+
+    rows = []
+    for page in _keyset_pages(query, "payment_id", page_size):
+        rows.extend(page)
+    return rows
+
+
+def fetch_unlinked_payments(supabase) -> list:
+    response = (supabase.table("payments").select("payment_id, rental_id, amount")
+                .eq("status", "completed").is_("rental_id", "null").execute())
+    return response.data or []
+
+
+# =========================
+# Chunk Join
+# =========================
+def reconcile_chunk(rentals: list, payments: list):
+    """
+    Join one chunk of rentals with the payments in the same key range.
+    Returns (flagged rows as dicts, chunk totals).
+    """
+    flagged = []
+    rental_ids = np.array([r["rental_id"] for r in rentals], dtype=str)
+    expected = _to_minor(r.get("total_cost") for r in rentals)
+    billable = np.array([r.get("status") in BILLABLE_STATUSES for r in rentals], dtype=bool)
+
+    pay_ids = np.array([p["rental_id"] for p in payments], dtype=str)
+    pay_amounts = _to_minor(p.get("amount") for p in payments)
+
+    # Sorted-array join: locate every payment's rental in the sorted rental ids
+    order = np.argsort(rental_ids, kind="stable")
+    sorted_ids = rental_ids[order]
+    if len(sorted_ids):
+        pos = np.minimum(np.searchsorted(sorted_ids, pay_ids), len(sorted_ids) - 1)
+        found = sorted_ids[pos] == pay_ids
+    else:
+        pos = np.zeros(len(pay_ids), dtype=np.int64)
+        found = np.zeros(len(pay_ids), dtype=bool)
+
+    rental_index = order[pos[found]]
+    paid = np.bincount(rental_index, weights=pay_amounts[found], minlength=len(rentals))
+    paid = np.rint(paid).astype(np.int64)
+    counts = np.bincount(rental_index, minlength=len(rentals))
+
+    missing = billable & (expected > 0) & (counts == 0)
+    double = counts > 1
+    mismatch = (counts > 0) & (np.abs(paid - expected) > TOLERANCE_MINOR) & ~double
+
+    for issue, mask in (("missing", missing), ("double_charge", double), ("mismatch", mismatch)):
+        for i in np.flatnonzero(mask):
+            flagged.append({"issue": issue, "rental_id": rentals[i]["rental_id"], "payment_id": "",
+                            "expected": expected[i] / 100, "paid": paid[i] / 100, "payments": int(counts[i])})
+
+    for j in np.flatnonzero(~found):
+        flagged.append({"issue": "orphan", "rental_id": payments[j]["rental_id"],
+                        "payment_id": payments[j]["payment_id"], "expected": 0.0,
+                        "paid": pay_amounts[j] / 100, "payments": 1})
+
+    stats = {
+        "rentals": len(rentals),
+        "payments": len(payments),
+        "expected_total": int(expected[billable].sum()),
+        "paid_total": int(pay_amounts.sum()),
+    }
+    return flagged, stats
+
+
+# =========================
+# Job
+# =========================
+def reconcile(supabase, outdir: str = "reconciliation", page_size: int = PAGE_SIZE) -> dict:
+    """Stream, join and report. Returns the summary that is also written as JSON."""
+    os.makedirs(outdir, exist_ok=True)
+    tag = datetime.utcnow().strftime("%Y%m%d")
+    report_path = os.path.join(outdir, f"reconciliation_{tag}.csv")
+    summary_path = os.path.join(outdir, f"reconciliation_{tag}.json")
+
+    totals = {"rentals": 0, "payments": 0, "expected_total": 0, "paid_total": 0}
+    issues = {"missing": 0, "mismatch": 0, "double_charge": 0, "orphan": 0}
+
+    with open(report_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["issue", "rental_id", "payment_id", "expected", "paid", "payments"])
+        writer.writeheader()
+
+        def emit(flagged, stats):
+            writer.writerows(flagged)
+            for row in flagged:
+                issues[row["issue"]] += 1
+            for key in totals:
+                totals[key] += stats[key]
+
+        low = None
+        for rentals in stream_rentals(supabase, page_size):
+            high = rentals[-1]["rental_id"]
+            emit(*reconcile_chunk(rentals, fetch_payments_in_range(supabase, low, high, page_size)))
+            low = high
+
+        # Payments past the last rental id, or with no rental at all, are orphans
+        emit(*reconcile_chunk([], fetch_payments_in_range(supabase, low, None, page_size)))
+        emit(*reconcile_chunk([], [dict(p, rental_id="") for p in fetch_unlinked_payments(supabase)]))
+
+    summary = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "rentals": totals["rentals"],
+        "payments": totals["payments"],
+        "expected_total": totals["expected_total"] / 100,
+        "paid_total": totals["paid_total"] / 100,
+        "issues": issues,
+        "report_file": report_path,
+    }
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    summary["summary_file"] = summary_path
+    return summary
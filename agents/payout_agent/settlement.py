@@ -0,0 +1,217 @@
+"""
+Settlement
+----------
+Nets a settlement window into one transfer per lender instead of one
+transfer per payment.
+
+For each lender, over [window_start, window_end):
+- rental payments created in the window are credited, including ones
+  refunded since (they were paid out, or are being paid out now)
+- refunds are debited in the window they happened in (payments.refunded_at;
+  rows refunded before that column existed fall back to created_at), so a
+  refund landing after its payment's window was settled is still recovered
+- resolved damage reports on the lender's rentals are credited with the
+  damage deduction withheld from the renter (see damage_deduction)
+
+Amounts are handled in minor units (paise / cents) and summed with
+np.bincount over the lender index, so a window of hundreds of thousands of
+payments nets in one pass.
+
+Outputs:
+- settlement_<window>.csv  one row per lender: gross, refunds, damage, net
+- linkage_<window>.csv     one row per payment / damage report and the
+                           settlement it was netted into
+"""
+
+import csv
+import os
+import uuid
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+# Settlement ids are derived from (lender, window) so re-running a window
+# reproduces the same ids
+SETTLEMENT_NAMESPACE = uuid.UUID("0b8e4d52-7c1a-5f36-9d2e-4a6b8c0e1f37")
+
+# Rows per PostgREST page when streaming payments
+PAGE_SIZE = 1000
+
+# Share of the rental cost withheld for a resolved damage report, scaled by
+# the verifier's damage score (0-100)
+DAMAGE_DEDUCTION_RATE = 0.5
+
+
+def damage_deduction(report: dict, rental: dict) -> float:
+    """Default deduction for a resolved damage report. Swap in a real policy via settle(deduction=...)."""
+    score = min(max(float(report.get("verification_score") or 0.0), 0.0), 100.0)
+    total_cost = float(rental.get("total_cost") or 0)
+    return min(total_cost, DAMAGE_DEDUCTION_RATE * score / 100.0 * total_cost)
+
+
+def settlement_id(lender_id: str, window_start: datetime, window_end: datetime) -> str:
+    return str(uuid.uuid5(SETTLEMENT_NAMESPACE, f"{lender_id}:{window_start.isoformat()}:{window_end.isoformat()}"))
+
+
+def previous_day_window(now: datetime = None):
+    """The last full UTC day: the default nightly settlement window."""
+    today = (now or datetime.utcnow()).date()
+    end = datetime.combine(today, time.min)
+    return end - timedelta(days=1), end
+
+
+# =========================
+# Loading
+# =========================
+def _paged(query_fn, page_size=PAGE_SIZE):
+    start = 0
+    while True:
+        rows = query_fn().range(start, start + page_size - 1).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+
+def fetch_window_payments(supabase, window_start: datetime, window_end: datetime):
+    """Completed (or since refunded) payments created inside the window, streamed page by page."""
+    return _paged(lambda: supabase.table("payments")
+                  .select("payment_id, rental_id, amount, status")
+                  .in_("status", ["completed", "refunded"])
+                  .gte("created_at", window_start.isoformat())
+                  .lt("created_at", window_end.isoformat())
+                  .order("payment_id"))
+
+
+def fetch_window_refunds(supabase, window_start: datetime, window_end: datetime):
+    """Payments refunded inside the window, whenever they were created."""
+    yield from _paged(lambda: supabase.table("payments")
+                      .select("payment_id, rental_id, amount, status")
+                      .eq("status", "refunded")
+                      .gte("refunded_at", window_start.isoformat())
+                      .lt("refunded_at", window_end.isoformat())
+                      .order("payment_id"))
+    # Refunded before refunded_at was recorded: treat as refunded at creation
+    yield from _paged(lambda: supabase.table("payments")
+                      .select("payment_id, rental_id, amount, status")
+                      .eq("status", "refunded")
+                      .is_("refunded_at", "null")
+                      .gte("created_at", window_start.isoformat())
+                      .lt("created_at", window_end.isoformat())
+                      .order("payment_id"))
+
+
+def fetch_window_damage_reports(supabase, window_start: datetime, window_end: datetime):
+    return _paged(lambda: supabase.table("damage_reports")
+                  .select("damage_id, rental_id, verification_score, status")
+                  .eq("status", "resolved")
+                  .gte("created_at", window_start.isoformat())
+                  .lt("created_at", window_end.isoformat())
+                  .order("damage_id"))
+
+
+def fetch_rentals(supabase, rental_ids, batch_size=500) -> dict:
+    """{rental_id: rental} with lender_id and total_cost, fetched in in_() batches."""
+    ids = sorted({rental_id for rental_id in rental_ids if rental_id})
+    rentals = {}
+    for start in range(0, len(ids), batch_size):
+        response = (supabase.table("rentals").select("rental_id, lender_id, total_cost")
+                    .in_("rental_id", ids[start:start + batch_size]).execute())
+        for row in response.data or []:
+            rentals[row["rental_id"]] = row
+    return rentals
+
+
+# =========================
+# Netting
+# =========================
+KINDS = ("payment", "refund", "damage")
+
+
+def net_lines(lenders, kinds, amounts_minor):
+    """
+    Vectorized netting of signed lines.
+    lenders: lender id per line; kinds: index into KINDS; amounts_minor: int64.
+    Returns (unique lenders, inverse index, totals[n_lenders, len(KINDS)], counts).
+    """
+    unique, inverse = np.unique(np.asarray(lenders, dtype=object).astype(str), return_inverse=True)
+    kinds = np.asarray(kinds, dtype=np.int64)
+    amounts = np.asarray(amounts_minor, dtype=np.int64)
+
+    # One bincount over a combined (lender, kind) index gives every total at once
+    flat = inverse * len(KINDS) + kinds
+    totals = np.bincount(flat, weights=amounts, minlength=len(unique) * len(KINDS))
+    totals = np.rint(totals).astype(np.int64).reshape(len(unique), len(KINDS))
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, inverse, totals, counts
+
+
+def settle(supabase, window_start: datetime, window_end: datetime, outdir: str = "settlements",
+           deduction=damage_deduction) -> dict:
+    """Net the window per lender and write the settlement and linkage files."""
+    line_ids, line_kinds, lines_rental, amounts = [], [], [], []
+    payments = [("payment", p) for p in fetch_window_payments(supabase, window_start, window_end)]
+    payments += [("refund", p) for p in fetch_window_refunds(supabase, window_start, window_end)]
+    for kind, payment in payments:
+        line_ids.append(payment["payment_id"])
+        line_kinds.append(KINDS.index(kind))
+        lines_rental.append(payment["rental_id"])
+        amounts.append(float(payment["amount"]))
+    reports = list(fetch_window_damage_reports(supabase, window_start, window_end))
+
+    rentals = fetch_rentals(supabase, lines_rental + [r["rental_id"] for r in reports])
+    for report in reports:
+        rental = rentals.get(report["rental_id"])
+        if rental is None:
+            continue
+        line_ids.append(report["damage_id"])
+        line_kinds.append(KINDS.index("damage"))
+        lines_rental.append(report["rental_id"])
+        amounts.append(deduction(report, rental))
+
+    # Lines whose rental or lender is unknown cannot be settled
+    lenders = [(rentals.get(rental_id) or {}).get("lender_id") for rental_id in lines_rental]
+    keep = [i for i, lender in enumerate(lenders) if lender]
+    skipped = len(lenders) - len(keep)
+
+    os.makedirs(outdir, exist_ok=True)
+    tag = f"{window_start:%Y%m%dT%H%M}_{window_end:%Y%m%dT%H%M}"
+    settlement_path = os.path.join(outdir, f"settlement_{tag}.csv")
+    linkage_path = os.path.join(outdir, f"linkage_{tag}.csv")
+
+    if not keep:
+        unique = np.array([], dtype=str)
+        inverse = np.array([], dtype=np.int64)
+        totals = np.zeros((0, len(KINDS)), dtype=np.int64)
+        counts = np.array([], dtype=np.int64)
+        minor = np.array([], dtype=np.int64)
+    else:
+        minor = np.rint(np.array([amounts[i] for i in keep]) * 100).astype(np.int64)
+        unique, inverse, totals, counts = net_lines([lenders[i] for i in keep], [line_kinds[i] for i in keep], minor)
+    net = totals[:, 0] - totals[:, 1] + totals[:, 2]
+    ids = [settlement_id(lender, window_start, window_end) for lender in unique]
+
+    with open(settlement_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["settlement_id", "lender_id", "window_start", "window_end", "gross", "refunds",
+                         "damage", "net", "lines"])
+        for i, lender in enumerate(unique):
+            writer.writerow([ids[i], lender, window_start.isoformat(), window_end.isoformat(),
+                             f"{totals[i, 0] / 100:.2f}", f"{totals[i, 1] / 100:.2f}",
+                             f"{totals[i, 2] / 100:.2f}", f"{net[i] / 100:.2f}", int(counts[i])])
+
+    with open(linkage_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["settlement_id", "lender_id", "source_id", "kind", "rental_id", "amount"])
+        for j, i in enumerate(keep):
+            writer.writerow([ids[inverse[j]], unique[inverse[j]], line_ids[i], KINDS[line_kinds[i]],
+                             lines_rental[i], f"{minor[j] / 100:.2f}"])
+
+    return {
+        "settlements": len(unique),
+        "lines": len(keep),
+        "skipped_lines": skipped,
+        "net_total": round(float(net.sum()) / 100, 2),
+        "settlement_file": settlement_path,
+        "linkage_file": linkage_path,
+    }
@@ -0,0 +1,281 @@
+"""
+backtest.py
+
+Vectorized backtester for pricing policies.
+
+Replays rental history day by day for every item at once:
+- starts[item, day]  rentals starting that day
+- booked[item, day]  item out on rent that day
+- demand[item, day]  rentals started in the trailing window (90 days, as
+                     in calculate_demand_price), excluding the day itself
+
+A policy maps demand to a price multiplier, so every item-day with the
+same trailing demand gets the same multiplier. The replay is reduced to
+per-demand-level sums (np.bincount over all item-days), and a whole grid
+of policies is then evaluated as one (policies x demand levels) array
+operation.
+
+Demand response: history was observed at the base price, so a multiplier
+m keeps a booked day with probability min(1, m^-e) and converts an idle
+day with probability min(1, m^-e - 1) * the item's historical occupancy,
+for a price elasticity e. Revenue is price x expected occupancy; utilization
+is expected booked days / item-days.
+
+Usage:
+    python backtest.py --synthetic --items 5000 --days 730
+    python backtest.py --top 10            # history from Supabase
+"""
+
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+WINDOW_DAYS = 90
+DEFAULT_ELASTICITY = 1.5
+
+
+# =========================
+# History
+# =========================
+class History:
+    def __init__(self, item_ids, base_price, starts, booked, first_day: date):
+        self.item_ids = item_ids
+        self.base_price = base_price.astype(np.float64)
+        self.starts = starts
+        self.booked = booked
+        self.first_day = first_day
+
+    @property
+    def shape(self):
+        return self.booked.shape
+
+    @classmethod
+    def from_rows(cls, items, rentals):
+        """Build from items [{item_id, price_per_day}] and rentals [{item_id, start_date, end_date}]."""
+        item_ids = np.array([item["item_id"] for item in items], dtype=str)
+        base_price = np.array([float(item.get("price_per_day") or 0) for item in items])
+        position = {item_id: i for i, item_id in enumerate(item_ids.tolist())}
+
+        rows = [(position[r["item_id"]], date.fromisoformat(str(r["start_date"])[:10]),
+                 date.fromisoformat(str(r["end_date"])[:10]))
+                for r in rentals if r.get("item_id") in position and r.get("start_date") and r.get("end_date")]
+        if not rows:
+            empty = np.zeros((len(item_ids), 1), dtype=np.int32)
+            return cls(item_ids, base_price, empty, empty.astype(bool), date.today())
+
+        first_day = min(start for _, start, _ in rows)
+        last_day = max(end for _, _, end in rows)
+        n_days = (last_day - first_day).days + 1
+        item_idx = np.array([i for i, _, _ in rows])
+        start_idx = np.array([(start - first_day).days for _, start, _ in rows])
+        end_idx = np.array([(end - first_day).days for _, _, end in rows])
+        return cls.from_arrays(item_ids, base_price, item_idx, start_idx, np.maximum(end_idx, start_idx), n_days,
+                               first_day)
+
+    @classmethod
+    def from_arrays(cls, item_ids, base_price, item_idx, start_idx, end_idx, n_days, first_day=None):
+        """Rentals as parallel index arrays; end_idx is the last rented day (inclusive)."""
+        n_items = len(item_ids)
+        starts = np.zeros((n_items, n_days), dtype=np.int32)
+        np.add.at(starts, (item_idx, start_idx), 1)
+
+        # Occupancy via a difference array: +1 on the first day, -1 after the last
+        diff = np.zeros((n_items, n_days + 1), dtype=np.int32)
+        np.add.at(diff, (item_idx, start_idx), 1)
+        np.add.at(diff, (item_idx, end_idx + 1), -1)
+        booked = np.cumsum(diff[:, :-1], axis=1) > 0
+        return cls(np.asarray(item_ids), np.asarray(base_price), starts, booked, first_day or date.today())
+
+    def demand(self, window: int = WINDOW_DAYS) -> np.ndarray:
+        """Rentals started in [day - window, day) per item and day."""
+        cumulative = np.zeros((self.starts.shape[0], self.starts.shape[1] + 1), dtype=np.int32)
+        np.cumsum(self.starts, axis=1, out=cumulative[:, 1:])
+        days = np.arange(self.starts.shape[1])
+        return cumulative[:, days] - cumulative[:, np.maximum(days - window, 0)]
+
+
+def load_history(supabase, page_size: int = 10000) -> History:
+    items, rentals = [], []
+    for table, columns, sink in (("items", "item_id, price_per_day", items),
+                                 ("rentals", "rental_id, item_id, start_date, end_date", rentals)):
+        key = columns.split(",")[0]
+        last = None
+        while True:
+            query = supabase.table(table).select(columns)
+            if last is not None:
+                query = query.gt(key, last)
+            rows = query.order(key).limit(page_size).execute().data or []
+            sink.extend(rows)
+            if len(rows) < page_size:
+                break
+            last = rows[-1][key]
+    return History.from_rows(items, rentals)
+
+
+def synthetic_history(n_items: int = 5000, n_days: int = 730, seed: int = 0) -> History:
+    """Random catalog with skewed popularity, for timing and smoke tests."""
+    rng = np.random.default_rng(seed)
+    popularity = rng.gamma(0.6, 0.02, size=n_items)
+    n_rentals = int(popularity.sum() * n_days)
+    item_idx = rng.choice(n_items, size=n_rentals, p=popularity / popularity.sum())
+    start_idx = rng.integers(0, n_days, size=n_rentals)
+    end_idx = np.minimum(start_idx + rng.integers(0, 7, size=n_rentals), n_days - 1)
+    base_price = rng.uniform(5, 100, size=n_items).round(2)
+    return History.from_arrays(np.array([f"item-{i}" for i in range(n_items)]), base_price,
+                               item_idx, start_idx, end_idx, n_days)
+
+
+# =========================
+# Policies
+# =========================
+def threshold_grid(highs, lows, ups, downs) -> dict:
+    """Every combination of calculate_demand_price-style rules: >= high -> +up, <= low -> -down."""
+    h, l, u, d = np.meshgrid(highs, lows, ups, downs, indexing="ij")
+    valid = l.ravel() < h.ravel()
+    return {"high": h.ravel()[valid], "low": l.ravel()[valid], "up": u.ravel()[valid], "down": d.ravel()[valid]}
+
+
+def _per_policy(values, demand: np.ndarray) -> np.ndarray:
+    """Reshape a per-policy parameter to broadcast against demand[None]."""
+    return np.asarray(values).reshape((-1,) + (1,) * demand.ndim)
+
+
+def threshold_multipliers(demand: np.ndarray, grid: dict) -> np.ndarray:
+    """(policies, *demand.shape) multipliers for a threshold grid."""
+    up = 1 + _per_policy(grid["up"], demand)
+    down = 1 - _per_policy(grid["down"], demand)
+    return np.where(demand[None] >= _per_policy(grid["high"], demand), up,
+                    np.where(demand[None] <= _per_policy(grid["low"], demand), down, 1.0))
+
+
+def curve_grid(targets, gammas, floors, caps) -> dict:
+    """Elasticity curves: multiplier = clip(((demand + 1) / (target + 1)) ** gamma, floor, cap)."""
+    t, g, f, c = np.meshgrid(targets, gammas, floors, caps, indexing="ij")
+    return {"target": t.ravel(), "gamma": g.ravel(), "floor": f.ravel(), "cap": c.ravel()}
+
+
+def curve_multipliers(demand: np.ndarray, grid: dict) -> np.ndarray:
+    ratio = (demand[None] + 1.0) / (_per_policy(grid["target"], demand) + 1.0)
+    return np.clip(ratio ** _per_policy(grid["gamma"], demand), _per_policy(grid["floor"], demand),
+                   _per_policy(grid["cap"], demand))
+
+
+POLICY_FAMILIES = {
+    "threshold": threshold_multipliers,
+    "curve": curve_multipliers,
+}
+
+# The rule currently in calculate_demand_price
+CURRENT_RULE = {"high": np.array([5]), "low": np.array([1]), "up": np.array([0.1]), "down": np.array([0.1])}
+
+
+# =========================
+# Simulation
+# =========================
+def demand_profile(history: History, window: int = WINDOW_DAYS) -> dict:
+    """
+    Per-demand-level sums over all item-days: base price and count of booked
+    days, and occupancy-weighted base price and count of idle days.
+    """
+    demand = history.demand(window).ravel()
+    booked = history.booked.ravel()
+    base = np.broadcast_to(history.base_price[:, None], history.shape).ravel()
+    idle_rate = np.broadcast_to(history.booked.mean(axis=1)[:, None], history.shape).ravel()
+
+    levels = int(demand.max()) + 1 if demand.size else 1
+    idle = ~booked
+    return {
+        "booked_price": np.bincount(demand[booked], weights=base[booked], minlength=levels),
+        "booked_days": np.bincount(demand[booked], minlength=levels).astype(np.float64),
+        "idle_price": np.bincount(demand[idle], weights=(base * idle_rate)[idle], minlength=levels),
+        "idle_days": np.bincount(demand[idle], weights=idle_rate[idle], minlength=levels),
+        "item_days": demand.size,
+    }
+
+
+def simulate(history: History, family: str, grid: dict, elasticity: float = DEFAULT_ELASTICITY,
+             window: int = WINDOW_DAYS, profile: dict = None) -> dict:
+    """Expected revenue and utilization for every policy in the grid."""
+    profile = profile or demand_profile(history, window)
+    levels = np.arange(len(profile["booked_days"]))
+    m = POLICY_FAMILIES[family](levels, grid)            # (policies, demand levels)
+
+    response = m ** -elasticity
+    keep = np.minimum(response, 1.0)
+    gain = np.clip(response - 1.0, 0.0, 1.0)
+    revenue = (m * (keep * profile["booked_price"] + gain * profile["idle_price"])).sum(axis=1)
+    occupied = (keep * profile["booked_days"] + gain * profile["idle_days"]).sum(axis=1)
+    return {"revenue": revenue, "utilization": occupied / max(1, profile["item_days"])}
+
+
+def backtest(history: History, family: str, grid: dict, elasticity: float = DEFAULT_ELASTICITY,
+             window: int = WINDOW_DAYS, profile: dict = None) -> list:
+    """Policy rows sorted by simulated revenue, best first."""
+    results = simulate(history, family, grid, elasticity, window, profile)
+    rows = []
+    for i in np.argsort(-results["revenue"]):
+        row = {key: float(values[i]) for key, values in grid.items()}
+        row.update({"family": family, "revenue": round(float(results["revenue"][i]), 2),
+                    "utilization": round(float(results["utilization"][i]), 4)})
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Backtest pricing policies against rental history")
+    parser.add_argument("--synthetic", action="store_true", help="Use a synthetic history instead of Supabase")
+    parser.add_argument("--items", type=int, default=5000, help="Synthetic items")
+    parser.add_argument("--days", type=int, default=730, help="Synthetic days of history")
+    parser.add_argument("--elasticity", type=float, default=DEFAULT_ELASTICITY, help="Price elasticity of demand")
+    parser.add_argument("--top", type=int, default=10, help="Policies to print per family")
+    parser.add_argument("--out", default=None, help="Write all results as JSON here")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        history = synthetic_history(args.items, args.days)
+    else:
+        from dotenv import load_dotenv
+
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from supabase_transport import get_client
+
+        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+        history = load_history(get_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY")))
+
+    grids = {
+        "threshold": threshold_grid(highs=np.arange(2, 12), lows=np.arange(0, 4),
+                                    ups=np.array([0.05, 0.1, 0.15, 0.2, 0.3]),
+                                    downs=np.array([0.05, 0.1, 0.15, 0.2])),
+        "curve": curve_grid(targets=np.array([1, 2, 3, 5, 8]), gammas=np.array([0.05, 0.1, 0.2, 0.3]),
+                            floors=np.array([0.7, 0.8, 0.9]), caps=np.array([1.1, 1.2, 1.3, 1.5])),
+    }
+
+    print(f"[INFO] History: {history.shape[0]} items x {history.shape[1]} days, "
+          f"{int(history.starts.sum())} rentals")
+    started = time.perf_counter()
+    profile = demand_profile(history)
+    print(f"[INFO] Replayed history in {time.perf_counter() - started:.2f}s")
+    baseline = backtest(history, "threshold", CURRENT_RULE, args.elasticity, profile=profile)[0]
+    print(f"[INFO] Current rule (>=5 +10%, <=1 -10%): revenue {baseline['revenue']:.2f}, "
+          f"utilization {baseline['utilization']:.2%}")
+
+    all_rows = {"baseline": baseline}
+    for family, grid in grids.items():
+        started = time.perf_counter()
+        rows = backtest(history, family, grid, args.elasticity, profile=profile)
+        elapsed = time.perf_counter() - started
+        all_rows[family] = rows
+        print(f"\n[INFO] {family}: {len(rows)} policies in {elapsed:.2f}s")
+        for row in rows[:args.top]:
+            params = ", ".join(f"{k}={v:g}" for k, v in row.items() if k not in ("family", "revenue", "utilization"))
+            print(f"  revenue {row['revenue']:>14.2f}  utilization {row['utilization']:.2%}  {params}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(all_rows, f, indent=2)
@@ -12,8 +12,14 @@ Tables used:
 
 from datetime import datetime, timedelta
 from crewai import Agent, Task
-from supabase import create_client, Client
+from supabase import Client
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from supabase_transport import get_client
+from result_cache import invalidate
+from profiling import profiled
 
 # =========================
 # Environment Variables
@@ -30,7 +36,7 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     print("[WARN] Supabase credentials not found for pricing agent")
     supabase = None
 else:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
 
 # =========================
 # Helper Functions
@@ -48,7 +54,7 @@ def fetch_rental_history(item_id: str):
     response = supabase.table("rentals").select("*").eq("item_id", item_id).execute()
     return response.data if response.data else []
 
-def calculate_price(item, rentals):
+def calculate_demand_price(item, rentals):
     """Adjust price based on demand in the last 90 days."""
     base_price = item["price_per_day"]
     if not rentals:
@@ -72,6 +78,7 @@ def calculate_price(item, rentals):
 def update_price(item_id: str, new_price: float):
     """Update the item's price_per_day in Supabase."""
     supabase.table("items").update({"price_per_day": new_price, "updated_at": datetime.utcnow().isoformat()}).eq("item_id", item_id).execute()
+    invalidate(f"item:{item_id}")
     return new_price
 
 # =========================
@@ -156,13 +163,15 @@ def run_pricing_agent(task_input: dict):
     item_id = task_input.get("item_id")
     if not item_id:
         return {"error": "Missing item_id in task input"}
+    if not supabase:
+        return {"error": "Supabase not available"}
 
     item = fetch_item(item_id)
     if not item:
         return {"error": f"Item {item_id} not found"}
 
     rentals = fetch_rental_history(item_id)
-    new_price = calculate_price(item, rentals)
+    new_price = calculate_demand_price(item, rentals)
     update_price(item_id, new_price)
 
     return {"adjusted_price": new_price}
@@ -171,6 +180,7 @@ def run_pricing_agent(task_input: dict):
 # Run Agent (for testing)
 # =========================
 if __name__ == "__main__":
-    sample_item_id = "PUT_SAMPLE_ITEM_UUID_HERE"
-    result = run_pricing_agent({"item_id": sample_item_id})
-    print(f"[INFO] Pricing Agent Result: {result}")
+    with profiled("pricing"):
+        sample_item_id = "PUT_SAMPLE_ITEM_UUID_HERE"
+        result = run_pricing_agent({"item_id": sample_item_id})
+        print(f"[INFO] Pricing Agent Result: {result}")
@@ -0,0 +1,177 @@
+"""
+profiling.py
+
+On-demand sampling profiler for agent entry points.
+
+Enable it with `--profile` on any agent's command line, or set
+AGENT_PROFILE=1 in the environment (this also works for runs spawned by
+the HTTP agent route). A background thread samples the stack of every
+thread in the process except itself (stage pools, fetch threads) every
+AGENT_PROFILE_INTERVAL_MS (default 5) milliseconds, then writes to
+AGENT_PROFILE_DIR (default agents/profiles):
+
+- <name>-<timestamp>.collapsed   collapsed stacks, one "a;b;c count" line
+                                 per stack, for flamegraph.pl / speedscope
+- <name>-<timestamp>.top.txt     top-N functions by self and total time,
+                                 and time per category
+
+Categories attribute each sample to network I/O, JSON decode, OpenCV,
+skimage, matplotlib, idle (a thread blocked on a lock, join or pool
+queue) or Python by the innermost matching frame. OpenCV runs in C, so a
+sample whose innermost Python line calls `cv2.` counts as OpenCV as well.
+Times are thread-seconds: two busy threads for one second report two
+seconds. A short summary is printed to stderr.
+"""
+
+import collections
+import contextlib
+import linecache
+import os
+import sys
+import threading
+import time
+
+PROFILE_DIR = os.getenv("AGENT_PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+INTERVAL_MS = float(os.getenv("AGENT_PROFILE_INTERVAL_MS", "5"))
+TOP_N = 25
+
+# Checked in order against each frame's filename, innermost frame first
+CATEGORIES = (
+    ("network", ("/socket.py", "/ssl.py", "/http/client.py", "/httpx/", "/httpcore/", "/h2/", "/urllib3/",
+                 "/requests/", "/selectors.py")),
+    ("json", ("/json/", "/orjson")),
+    ("opencv", ("/cv2/",)),
+    ("skimage", ("/skimage/",)),
+    ("matplotlib", ("/matplotlib/",)),
+)
+# Only the innermost frame counts here: every pool worker has
+# concurrent/futures at the root of its stack
+IDLE = ("idle", ("/threading.py", "/concurrent/futures/", "/queue.py"))
+OTHER = "python"
+
+
+def profiling_requested(argv=None) -> bool:
+    argv = sys.argv if argv is None else argv
+    return "--profile" in argv or os.getenv("AGENT_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def _frame_label(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+def _categorize(frames, leaf_line: str) -> str:
+    if frames and any(pattern in frames[0].co_filename.replace("\\", "/") for pattern in IDLE[1]):
+        return IDLE[0]
+    for code in frames:
+        filename = code.co_filename.replace("\\", "/")
+        for category, patterns in CATEGORIES:
+            if any(pattern in filename for pattern in patterns):
+                return category
+    return "opencv" if "cv2." in leaf_line else OTHER
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = INTERVAL_MS / 1000.0, thread_id: int = None):
+        """thread_id limits sampling to one thread; by default every thread but the profiler's is sampled."""
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = collections.Counter()       # tuple of code objects, root first -> samples
+        self.categories = collections.Counter()
+        self.samples = 0                          # one per sampled thread per tick
+        self.ticks = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def _sample(self, own_id: int):
+        self.ticks += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.thread_id is not None and thread_id != self.thread_id):
+                continue
+            leaf_line = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            self.categories[_categorize(codes, leaf_line)] += 1
+            self.stacks[tuple(reversed(codes))] += 1
+            self.samples += 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own_id)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="agent-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+
+    # ---- reports ----
+
+    def collapsed(self) -> list:
+        lines = collections.Counter()
+        for stack, count in self.stacks.items():
+            lines[";".join(_frame_label(code) for code in stack)] += count
+        return [f"{stack} {count}" for stack, count in lines.most_common()]
+
+    def top(self, n: int = TOP_N) -> list:
+        """[(label, self samples, total samples)] ordered by self samples."""
+        self_counts = collections.Counter()
+        total_counts = collections.Counter()
+        for stack, count in self.stacks.items():
+            self_counts[_frame_label(stack[-1])] += count
+            for label in {_frame_label(code) for code in stack}:
+                total_counts[label] += count
+        return [(label, count, total_counts[label]) for label, count in self_counts.most_common(n)]
+
+    def report(self, name: str, n: int = TOP_N) -> str:
+        # Each sample stands for one thread over one tick
+        seconds_per_sample = self.elapsed / self.ticks if self.ticks else 0.0
+        lines = [f"Profile '{name}': {self.elapsed:.2f}s wall, {self.samples} samples over {self.ticks} ticks",
+                 "", "Time by category (thread-seconds):"]
+        for category, count in self.categories.most_common():
+            lines.append(f"  {category:<12} {count * seconds_per_sample:8.3f}s  {100 * count / self.samples:5.1f}%")
+        lines += ["", f"Top {n} functions:", f"  {'self %':>7} {'total %':>8}  function"]
+        for label, self_count, total_count in self.top(n):
+            lines.append(f"  {100 * self_count / self.samples:6.1f}% {100 * total_count / self.samples:7.1f}%  {label}")
+        return "\n".join(lines)
+
+    def write(self, name: str, outdir: str = PROFILE_DIR) -> dict:
+        os.makedirs(outdir, exist_ok=True)
+        base = os.path.join(outdir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        with open(base + ".collapsed", "w") as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+        with open(base + ".top.txt", "w") as f:
+            f.write(self.report(name) + "\n")
+        return {"collapsed": base + ".collapsed", "top": base + ".top.txt"}
+
+
+@contextlib.contextmanager
+def profiled(name: str, enabled: bool = None, outdir: str = PROFILE_DIR):
+    """Profile the enclosed block when enabled (default: --profile / AGENT_PROFILE)."""
+    if enabled is None:
+        enabled = profiling_requested()
+    if not enabled:
+        yield None
+        return
+
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        if profiler.samples:
+            paths = profiler.write(name, outdir)
+            print(profiler.report(name, n=10), file=sys.stderr)
+            print(f"[PROFILE] Wrote {paths['collapsed']} and {paths['top']}", file=sys.stderr)
+        else:
+            print(f"[PROFILE] '{name}' finished before the first sample", file=sys.stderr)
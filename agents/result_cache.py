@@ -0,0 +1,230 @@
+"""
+result_cache.py
+
+Cross-process cache for agent results served through pages/api/agents.
+
+- Keyed by agent name + a canonical hash of the JSON payload
+- Per-agent TTLs (AGENT_TTLS, overridable with RESULT_CACHE_TTL_<AGENT>);
+  agents without a TTL are never cached
+- Concurrent identical requests are coalesced: the first process holds a
+  per-key file lock while it computes, the others wait on the lock and
+  then read its result
+- Entries carry tags such as "rental:<id>" or "user:<id>"; invalidate()
+  drops every entry with a tag, and the code paths that write those rows
+  call it
+- Expired rows and their lock files are purged on a sample of cache
+  writes (RESULT_CACHE_PURGE_RATE, default 1%; see maybe_purge)
+
+Results containing an "error" key are not cached. One ResultCache may be
+shared by many threads (the orchestrator invalidates from its stage pool and
+rental workers); its SQLite connection is serialized by a lock.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process coalescing
+    fcntl = None
+
+CACHE_DIR = os.getenv("RESULT_CACHE_DIR",
+                      os.path.join(os.path.dirname(os.path.abspath(__file__)), ".result_cache"))
+
+# Seconds; read-mostly agents only. Agents that change rows (matching,
+# orchestrator, payout, engagement) are never cached.
+AGENT_TTLS = {
+    "verification": 3600,
+    "trust": 300,
+    "pricing": 120,
+    "recommendations": 3600,   # the table itself is rebuilt nightly
+}
+
+
+# Share of cache writes that also purge expired entries
+PURGE_RATE = float(os.getenv("RESULT_CACHE_PURGE_RATE", "0.01"))
+
+
+def ttl_for(agent: str) -> int:
+    override = os.getenv(f"RESULT_CACHE_TTL_{agent.upper()}")
+    return int(override) if override is not None else AGENT_TTLS.get(agent, 0)
+
+
+def payload_key(agent: str, payload) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{agent}\n{canonical}".encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.lock_dir = os.path.join(cache_dir, "locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._db_lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "results.db"), timeout=30, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                result TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))")
+        self.hits = 0
+        self.misses = 0
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._db_lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def get(self, key: str):
+        with self._db_lock:
+            row = self.conn.execute("SELECT result FROM results WHERE key = ? AND expires_at > ?",
+                                    (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, agent: str, result, ttl: float, tags=()):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO results (key, agent, result, expires_at) VALUES (?, ?, ?, ?)",
+                         (key, agent, json.dumps(result, default=str), time.time() + ttl))
+            conn.executemany("INSERT OR IGNORE INTO tags (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags])
+
+    @staticmethod
+    def _delete(conn, keys):
+        conn.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in keys])
+        conn.executemany("DELETE FROM tags WHERE key = ?", [(key,) for key in keys])
+
+    def invalidate(self, *tags) -> int:
+        """Drop every entry carrying any of `tags`. Returns how many were removed."""
+        if not tags:
+            return 0
+        marks = ", ".join("?" * len(tags))
+        with self._transaction() as conn:
+            keys = [row[0] for row in conn.execute(f"SELECT DISTINCT key FROM tags WHERE tag IN ({marks})", tags)]
+            self._delete(conn, keys)
+        self._remove_locks(keys)
+        return len(keys)
+
+    def purge_expired(self) -> int:
+        """Drop expired entries and their lock files. Returns how many were removed."""
+        with self._transaction() as conn:
+            keys = [row[0] for row in conn.execute("SELECT key FROM results WHERE expires_at <= ?", (time.time(),))]
+            self._delete(conn, keys)
+        self._remove_locks(keys)
+        return len(keys)
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, f"{key}.lock")
+
+    def _remove_locks(self, keys):
+        """Unlink lock files nobody holds; a key being computed keeps its lock."""
+        for key in keys:
+            path = self._lock_path(key)
+            if fcntl is None:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            try:
+                f = open(path, "r")
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+    @contextlib.contextmanager
+    def _key_lock(self, key: str):
+        if fcntl is None:
+            yield
+            return
+        path = self._lock_path(key)
+        while True:
+            f = open(path, "a")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # The file may have been unlinked by a purge while we waited; a
+            # lock on the orphaned inode would not exclude anyone, so retry
+            with contextlib.suppress(FileNotFoundError):
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            f.close()
+        with f:
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_or_compute(self, agent: str, payload, compute):
+        """
+        compute() -> (result, tags). Returns (result, from_cache); compute()
+        runs at most once per key across processes.
+        """
+        ttl = ttl_for(agent)
+        if ttl <= 0:
+            return compute()[0], False
+
+        key = payload_key(agent, payload)
+        result = self.get(key)
+        if result is None:
+            with self._key_lock(key):
+                # Another process may have filled the entry while we waited
+                result = self.get(key)
+                if result is None:
+                    self.misses += 1
+                    result, tags = compute()
+                    if not (isinstance(result, dict) and result.get("error")):
+                        self.put(key, agent, result, ttl, [tag for tag in tags if not tag.endswith(":None")])
+                    return result, False
+        self.hits += 1
+        return result, True
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache() -> ResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+    return _cache
+
+
+def maybe_purge(rate: float = PURGE_RATE) -> int:
+    """Purge expired entries on a random sample of calls. Best-effort, like invalidate()."""
+    if random.random() >= rate:
+        return 0
+    try:
+        return default_cache().purge_expired()
+    except Exception as e:
+        print(f"[WARN] Result cache purge failed: {e}")
+        return 0
+
+
+def invalidate(*tags) -> int:
+    """Best-effort invalidation for write paths; a cache problem never fails the write."""
+    try:
+        return default_cache().invalidate(*[tag for tag in tags if tag and not tag.endswith(":None")])
+    except Exception as e:
+        print(f"[WARN] Result cache invalidation failed for {tags}: {e}")
+        return 0
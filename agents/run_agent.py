@@ -0,0 +1,121 @@
+"""
+run_agent.py
+
+Single entry point spawned by pages/api/agents/[agent].js.
+
+    python run_agent.py <agent>            # JSON payload on stdin, JSON result on stdout
+    python run_agent.py --invalidate rental:<id> user:<id> ...
+
+Agents with a handler below are served through the result cache: identical
+payloads within the agent's TTL are answered without re-running it, and
+concurrent identical requests share one run. Anything the agent prints is
+redirected to stderr so stdout carries only the JSON reply. Agents without
+a handler run their own script as before. --profile / AGENT_PROFILE=1
+profiles the run (see profiling.py).
+"""
+
+import contextlib
+import io
+import json
+import os
+import runpy
+import sys
+
+AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, AGENTS_DIR)
+
+import result_cache
+from profiling import profiled
+
+SCRIPTS = {
+    "orchestrator": os.path.join(AGENTS_DIR, "orchestrator", "orchestrator.py"),
+    "matching": os.path.join(AGENTS_DIR, "matching_agent", "matching_agent.py"),
+    "pricing": os.path.join(AGENTS_DIR, "pricing_agent", "pricing_agent.py"),
+    "trust": os.path.join(AGENTS_DIR, "trust_agent", "trust_agent.py"),
+    "verification": os.path.join(AGENTS_DIR, "verification_agent", "main.py"),
+    "engagement": os.path.join(AGENTS_DIR, "engagement_agent", "engagement_agent.py"),
+    "payout": os.path.join(AGENTS_DIR, "payout_agent", "payout_agent.py"),
+    "recommendations": os.path.join(AGENTS_DIR, "matching_agent", "recommendations.py"),
+}
+
+
+# =========================
+# Handlers
+# =========================
+# Each returns (result, tags). Imports happen inside so only the requested
+# agent (and its Supabase client) is loaded.
+
+def handle_verification(payload):
+    from verification_agent.main import run_from_payload
+    return run_from_payload(payload), [f"rental:{payload.get('rental_id')}"]
+
+
+def handle_trust(payload):
+    from trust_agent.trust_agent import evaluate_trust, run_trust_agent
+    if payload.get("user_id"):
+        return run_trust_agent(payload), [f"user:{payload['user_id']}"]
+    result = evaluate_trust(payload.get("renter_id"), payload.get("lender_id"))
+    return result, [f"user:{payload.get('renter_id')}", f"user:{payload.get('lender_id')}"]
+
+
+def handle_pricing(payload):
+    from pricing_agent.pricing_agent import calculate_price, run_pricing_agent
+    if payload.get("rental_id"):
+        return {"price": calculate_price(payload["rental_id"])}, [f"rental:{payload['rental_id']}"]
+    return run_pricing_agent(payload), [f"item:{payload.get('item_id')}"]
+
+
+def handle_recommendations(payload):
+    from matching_agent.recommendations import similar_items
+    item_id = payload.get("item_id")
+    similar = similar_items(item_id, payload.get("k"))
+    return {"item_id": item_id, "similar": [{"item_id": i, "score": s} for i, s in similar]}, []
+
+
+HANDLERS = {
+    "verification": handle_verification,
+    "trust": handle_trust,
+    "pricing": handle_pricing,
+    "recommendations": handle_recommendations,
+}
+
+
+def run(agent: str, payload: dict):
+    """Returns (result, from_cache)."""
+    result, from_cache = result_cache.default_cache().get_or_compute(agent, payload, lambda: HANDLERS[agent](payload))
+    if not from_cache:
+        # Expired rows are otherwise never reclaimed
+        result_cache.maybe_purge()
+    return result, from_cache
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+
+    if sys.argv[1] == "--invalidate":
+        removed = result_cache.invalidate(*sys.argv[2:])
+        print(json.dumps({"invalidated": removed}))
+        sys.exit(0)
+
+    agent = sys.argv[1]
+    if agent not in SCRIPTS:
+        print(f"Unknown agent '{agent}'", file=sys.stderr)
+        sys.exit(2)
+
+    raw = sys.stdin.read() if not sys.stdin.isatty() else ""
+
+    if agent not in HANDLERS:
+        # Legacy path: the agent script reads stdin itself
+        sys.stdin = io.StringIO(raw)
+        sys.argv = [SCRIPTS[agent]]
+        sys.path.insert(0, os.path.dirname(SCRIPTS[agent]))
+        runpy.run_path(SCRIPTS[agent], run_name="__main__")
+        sys.exit(0)
+
+    payload = json.loads(raw) if raw.strip() else {}
+    with contextlib.redirect_stdout(sys.stderr), profiled(agent):
+        result, from_cache = run(agent, payload)
+    print(f"[INFO] {agent}: {'cache hit' if from_cache else 'computed'}", file=sys.stderr)
+    print(json.dumps(result, default=str))
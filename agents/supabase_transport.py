@@ -0,0 +1,120 @@
+"""
+supabase_transport.py
+
+One shared HTTP transport for every agent's Supabase access.
+
+Agents used to call create_client() at import time, so running several of
+them in one process meant several independent connection pools, each with
+its own TLS handshakes. get_client() hands out one Supabase client per
+(url, key), and every client sends its PostgREST / storage traffic
+through a single pooled keep-alive httpx client (HTTP/2 when the `h2`
+package is installed, so concurrent queries multiplex over one
+connection).
+
+Environment:
+- SUPABASE_POOL_SIZE        max connections in the shared pool (default 20)
+- SUPABASE_HTTP2            "0" to force HTTP/1.1 (default on when available)
+- SUPABASE_TIMEOUT_SECONDS  per-request timeout (default 30)
+
+transport_stats() reports how many requests reused an existing connection.
+"""
+
+import os
+import threading
+
+POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+HTTP2 = os.getenv("SUPABASE_HTTP2", "1") != "0"
+TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "30"))
+
+_lock = threading.Lock()
+_clients = {}
+_http_client = None
+_transport = None
+
+
+def _counting_transport(**kwargs):
+    """httpx.HTTPTransport that counts requests and newly opened connections."""
+    import httpx
+
+    class CountingTransport(httpx.HTTPTransport):
+        def __init__(self, **kw):
+            super().__init__(**kw)
+            self.requests = 0
+            self.connections_opened = 0
+            self._seen = set()
+            self._stats_lock = threading.Lock()
+
+        def handle_request(self, request):
+            response = super().handle_request(request)
+            with self._stats_lock:
+                self.requests += 1
+                for connection in getattr(self._pool, "connections", []):
+                    if id(connection) not in self._seen:
+                        self._seen.add(id(connection))
+                        self.connections_opened += 1
+            return response
+
+    return CountingTransport(**kwargs)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def shared_http_client():
+    """The process-wide pooled httpx client."""
+    global _http_client, _transport
+    with _lock:
+        if _http_client is None:
+            import httpx
+            limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+            _transport = _counting_transport(http2=HTTP2 and _http2_available(), limits=limits)
+            _http_client = httpx.Client(transport=_transport, timeout=TIMEOUT_SECONDS)
+        return _http_client
+
+
+def get_client(url: str, key: str):
+    """Shared Supabase client for (url, key), routed through the pooled transport."""
+    with _lock:
+        client = _clients.get((url, key))
+    if client is not None:
+        return client
+
+    from supabase import create_client
+    try:
+        from supabase import ClientOptions
+        client = create_client(url, key, options=ClientOptions(httpx_client=shared_http_client()))
+    except (ImportError, TypeError):
+        # Older supabase-py without httpx_client support: still one client per (url, key)
+        client = create_client(url, key)
+
+    with _lock:
+        return _clients.setdefault((url, key), client)
+
+
+def transport_stats() -> dict:
+    """Requests sent, connections opened and the share of requests that reused a connection."""
+    if _transport is None:
+        return {"requests": 0, "connections_opened": 0, "reuse_ratio": 0.0, "clients": len(_clients)}
+    requests = _transport.requests
+    opened = _transport.connections_opened
+    return {
+        "requests": requests,
+        "connections_opened": opened,
+        "reuse_ratio": round(1 - opened / requests, 4) if requests else 0.0,
+        "clients": len(_clients),
+    }
+
+
+def close():
+    global _http_client, _transport
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        _transport = None
+        _clients.clear()
@@ -0,0 +1,46 @@
+import os
+import sys
+import threading
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "engagement_agent"))
+
+from reminder_scheduler import ReminderScheduler
+
+NOW = datetime(2026, 3, 1, 23, 30)
+
+
+def rental(rental_id):
+    # Due today at 23:59: at 23:30 only the T-1h reminder is due (T-24h is past MAX_LATENESS)
+    return {"rental_id": rental_id, "status": "active", "end_date": "2026-03-01"}
+
+
+def run_once(scheduler, deliver):
+    stop = threading.Event()
+
+    def deliver_and_stop(due):
+        stop.set()
+        return deliver(due)
+
+    scheduler.run(deliver_and_stop, stop=stop)
+
+
+def test_only_dispatched_reminders_are_marked_sent():
+    scheduler = ReminderScheduler(now=lambda: NOW)
+    scheduler.load([rental("reached"), rental("no-contact")])
+
+    run_once(scheduler, lambda due: [reminder for reminder in due if reminder[1]["rental_id"] == "reached"])
+
+    assert scheduler.was_sent("reached", "due_in_1h")
+    assert not scheduler.was_sent("no-contact", "due_in_1h")
+
+    # Rescheduling (a change or a restart) gives the skipped reminder another chance
+    scheduler.upsert_rental(rental("no-contact"))
+    assert [(kind, r["rental_id"]) for kind, r in scheduler.pop_due()] == [("due_in_1h", "no-contact")]
+
+
+def test_deliver_returning_none_marks_everything():
+    scheduler = ReminderScheduler(now=lambda: NOW)
+    scheduler.load([rental("r1")])
+    run_once(scheduler, lambda due: None)
+    assert scheduler.was_sent("r1", "due_in_1h")
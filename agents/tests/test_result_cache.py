@@ -0,0 +1,68 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import result_cache
+from result_cache import ResultCache, payload_key
+
+
+def test_invalidate_from_worker_thread(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE_TTL_TRUST", "300")
+    cache = ResultCache(str(tmp_path))
+    payload = {"renter_id": "u1", "lender_id": "u2"}
+    result, from_cache = cache.get_or_compute("trust", payload, lambda: ({"ok": True}, ["user:u1"]))
+    assert (result, from_cache) == ({"ok": True}, False)
+    assert cache.get(payload_key("trust", payload)) == {"ok": True}
+
+    # Write paths invalidate from stage-pool and rental-worker threads
+    outcome = {}
+    worker = threading.Thread(target=lambda: outcome.setdefault("removed", cache.invalidate("user:u1")))
+    worker.start()
+    worker.join()
+
+    assert outcome["removed"] == 1
+    assert cache.get(payload_key("trust", payload)) is None
+    result, from_cache = cache.get_or_compute("trust", payload, lambda: ({"ok": False}, ["user:u1"]))
+    assert (result, from_cache) == ({"ok": False}, False)
+
+
+def test_concurrent_writes_share_one_connection(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE_TTL_PRICING", "120")
+    cache = ResultCache(str(tmp_path))
+    errors = []
+
+    def work(i):
+        try:
+            for j in range(20):
+                cache.get_or_compute("pricing", {"rental_id": f"{i}-{j}"}, lambda: ({"price": j}, [f"rental:{i}"]))
+            cache.invalidate(f"rental:{i}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 0
+
+
+def test_default_cache_is_a_single_instance(tmp_path, monkeypatch):
+    def slow_cache():
+        time.sleep(0.01)    # widen the construction race
+        return ResultCache(str(tmp_path))
+
+    monkeypatch.setattr(result_cache, "ResultCache", slow_cache)
+    monkeypatch.setattr(result_cache, "_cache", None)
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(result_cache.default_cache())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(cache) for cache in seen}) == 1
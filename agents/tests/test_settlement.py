@@ -0,0 +1,113 @@
+import csv
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "payout_agent"))
+
+import settlement
+
+DAY1, DAY2, DAY3 = datetime(2026, 3, 1), datetime(2026, 3, 2), datetime(2026, 3, 3)
+
+
+class FakeQuery:
+    """Just enough of the PostgREST builder for settlement's queries."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.checks = []
+        self.start, self.end = 0, None
+
+    def select(self, *args):
+        return self
+
+    def order(self, column):
+        self.rows = sorted(self.rows, key=lambda row: row[column])
+        return self
+
+    def eq(self, column, value):
+        self.checks.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        self.checks.append(lambda row: row.get(column) in values)
+        return self
+
+    def is_(self, column, value):
+        assert value == "null"
+        self.checks.append(lambda row: row.get(column) is None)
+        return self
+
+    def gte(self, column, value):
+        self.checks.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def lt(self, column, value):
+        self.checks.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def range(self, start, end):
+        self.start, self.end = start, end
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(check(row) for check in self.checks)]
+        return type("Response", (), {"data": rows[self.start:self.end + 1 if self.end is not None else None]})()
+
+
+class FakeSupabase:
+    def __init__(self, payments, reports=(), rentals=None):
+        self.tables = {
+            "payments": list(payments),
+            "damage_reports": list(reports),
+            "rentals": rentals or [{"rental_id": "r1", "lender_id": "lender-1", "total_cost": 200}],
+        }
+
+    def table(self, name):
+        return FakeQuery(self.tables[name])
+
+
+def payment(payment_id, created, status="completed", refunded=None, amount=100):
+    return {"payment_id": payment_id, "rental_id": "r1", "amount": amount, "status": status,
+            "created_at": created.isoformat(), "refunded_at": refunded.isoformat() if refunded else None}
+
+
+def net(summary) -> float:
+    with open(summary["settlement_file"]) as f:
+        rows = list(csv.DictReader(f))
+    return sum(float(row["net"]) for row in rows)
+
+
+def test_refund_in_later_window_is_debited_there(tmp_path):
+    created = datetime(2026, 3, 1, 10)
+    refunded = datetime(2026, 3, 2, 9)
+    supabase = FakeSupabase([payment("p1", created, "refunded", refunded)])
+
+    first = settlement.settle(supabase, DAY1, DAY2, outdir=str(tmp_path))
+    second = settlement.settle(supabase, DAY2, DAY3, outdir=str(tmp_path))
+
+    assert net(first) == 100.0
+    assert net(second) == -100.0
+
+
+def test_refund_in_same_window_nets_to_zero(tmp_path):
+    supabase = FakeSupabase([
+        payment("p1", datetime(2026, 3, 1, 10), "refunded", datetime(2026, 3, 1, 18)),
+        payment("p2", datetime(2026, 3, 1, 11), amount=40),
+    ])
+    summary = settlement.settle(supabase, DAY1, DAY2, outdir=str(tmp_path))
+    assert summary["lines"] == 3
+    assert net(summary) == 40.0
+
+
+def test_legacy_refund_without_refunded_at_uses_created_at(tmp_path):
+    supabase = FakeSupabase([payment("p1", datetime(2026, 3, 1, 10), "refunded")])
+    assert net(settlement.settle(supabase, DAY1, DAY2, outdir=str(tmp_path))) == 0.0
+    assert settlement.settle(supabase, DAY2, DAY3, outdir=str(tmp_path))["lines"] == 0
+
+
+def test_damage_deduction_scales_score_and_is_capped():
+    rental = {"total_cost": 200}
+    assert settlement.damage_deduction({"verification_score": 80}, rental) == 80.0
+    assert settlement.damage_deduction({"verification_score": 250}, rental) == 100.0
+    assert settlement.damage_deduction({"verification_score": None}, rental) == 0.0
@@ -0,0 +1,79 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "matching_agent"))
+
+from text_index import ItemIndex
+
+
+class FakeItems:
+    """items table supporting the refresh query: eq / gte / order / range."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        assert name == "items"
+        return self
+
+    def select(self, *args):
+        self.checks = []
+        return self
+
+    def eq(self, column, value):
+        self.checks.append(lambda row: row.get(column) == value)
+        return self
+
+    def gte(self, column, value):
+        self.checks.append(lambda row: row[column] >= value)
+        return self
+
+    def order(self, column):
+        self.ordered = sorted((row for row in self.rows if all(check(row) for check in self.checks)),
+                              key=lambda row: row[column])
+        return self
+
+    def range(self, start, end):
+        self.page = self.ordered[start:end + 1]
+        return self
+
+    def execute(self):
+        return type("Response", (), {"data": [dict(row) for row in self.page]})()
+
+
+def item(item_id, title, updated_at, available=True):
+    return {"item_id": item_id, "title": title, "category": "Electronics", "description": "",
+            "available": available, "updated_at": updated_at}
+
+
+def test_refresh_picks_up_rows_written_at_the_watermark():
+    table = FakeItems([item("a", "DSLR camera", "2026-03-01T10:00:00")])
+    index = ItemIndex(table, refresh_seconds=0)
+    index.refresh(force=True)
+    assert index.watermark == "2026-03-01T10:00:00"
+
+    # Written in the same timestamp tick as the last refreshed row
+    table.rows.append(item("b", "Mirrorless camera", "2026-03-01T10:00:00"))
+    index.refresh(force=True)
+    assert {found["item_id"] for found in index.search("camera")} == {"a", "b"}
+
+
+def test_refresh_skips_rows_already_applied_at_the_watermark():
+    table = FakeItems([item("a", "DSLR camera", "2026-03-01T10:00:00")])
+    index = ItemIndex(table, refresh_seconds=0)
+    index.refresh(force=True)
+
+    applied = []
+    index.upsert = lambda row: applied.append(row["item_id"])
+    index.refresh(force=True)
+    assert applied == []
+
+
+def test_refresh_drops_items_that_became_unavailable():
+    table = FakeItems([item("a", "DSLR camera", "2026-03-01T10:00:00")])
+    index = ItemIndex(table, refresh_seconds=0)
+    index.refresh(force=True)
+
+    table.rows[0] = item("a", "DSLR camera", "2026-03-01T11:00:00", available=False)
+    index.refresh(force=True)
+    assert index.search("camera") == []
@@ -14,8 +14,14 @@ Tables used:
 
 from datetime import datetime
 from crewai import Agent, Task
-from supabase import create_client, Client
+from supabase import Client
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from supabase_transport import get_client
+from result_cache import invalidate
+from profiling import profiled
 
 # =========================
 # Environment Variables
@@ -32,7 +38,7 @@ if not SUPABASE_URL or not SUPABASE_KEY:
     print("[WARN] Supabase credentials not found for trust agent")
     supabase = None
 else:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase: Client = get_client(SUPABASE_URL, SUPABASE_KEY)
 
 # =========================
 # Helper Functions
@@ -86,6 +92,7 @@ def update_user_credibility(user_id: str, score: float):
         "credibility_score": score,
         "updated_at": datetime.utcnow().isoformat()
     }).eq("user_id", user_id).execute()
+    invalidate(f"user:{user_id}")
     return score
 
 # =========================
@@ -179,6 +186,7 @@ def run_trust_agent(task_input: dict):
 # Run Agent (for testing)
 # =========================
 if __name__ == "__main__":
-    sample_user_id = "PUT_SAMPLE_USER_UUID_HERE"
-    result = run_trust_agent({"user_id": sample_user_id})
-    print(f"[INFO] Trust Agent Result: {result}")
+    with profiled("trust"):
+        sample_user_id = "PUT_SAMPLE_USER_UUID_HERE"
+        result = run_trust_agent({"user_id": sample_user_id})
+        print(f"[INFO] Trust Agent Result: {result}")
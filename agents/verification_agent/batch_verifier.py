@@ -0,0 +1,200 @@
+"""
+batch_verifier.py
+
+Batch damage verification across a process pool.
+
+- Pairs come from a list or a manifest file (CSV with before,after[,id]
+  columns, or JSON lines with the same keys)
+- Work is split into chunks; by default two chunks per core are in flight
+  so every core stays busy, and `max_images` can cap decoded images in
+  flight across all workers
+- Inside a chunk, same-size preprocessed images are stacked so LAB
+  conversion and Sobel run vectorized over the whole stack
+- Results are yielded as chunks finish, not in submission order
+- A pair that fails to decode or score yields an error row instead of
+  aborting the batch
+
+Usage:
+    python batch_verifier.py --manifest reports.csv --tier fast --out results.jsonl
+"""
+
+import csv
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from skimage.color import rgb2lab
+from skimage.metrics import structural_similarity as ssim
+
+from damage_verifier import (DAMAGE_THRESHOLD, DEFAULT_TIER, PREPROCESS_TIERS, damage_score, fuse_cues, load_image,
+                             preprocess)
+
+# BGR -> gray weights used by cv2.COLOR_BGR2GRAY
+_GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+
+# =========================
+# Manifest Loading
+# =========================
+def load_manifest(path: str):
+    """Read [(id, before, after)] from a CSV or JSONL manifest. Relative paths resolve against the manifest."""
+    base = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        return p if os.path.isabs(p) or "://" in p else os.path.join(base, p)
+
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    return [(row.get("id") or str(i), resolve(row["before"]), resolve(row["after"])) for i, row in enumerate(rows)]
+
+
+# =========================
+# Vectorized Cues
+# =========================
+def sobel_stack(gray: np.ndarray) -> np.ndarray:
+    """Sobel magnitude over a (N, H, W) stack, per image, with reflect borders."""
+    padded = np.pad(gray, ((0, 0), (1, 1), (1, 1)), mode="symmetric")
+    dx = padded[:, :, 2:] - padded[:, :, :-2]
+    dy = padded[:, 2:, :] - padded[:, :-2, :]
+    gx = dx[:, :-2] + 2 * dx[:, 1:-1] + dx[:, 2:]
+    gy = dy[:, :, :-2] + 2 * dy[:, :, 1:-1] + dy[:, :, 2:]
+    return np.sqrt(gx * gx + gy * gy)
+
+
+def score_stack(refs: np.ndarray, tests: np.ndarray, threshold=DAMAGE_THRESHOLD):
+    """
+    Score N preprocessed pairs of identical size, stacked as (N, H, W, 3).
+    LAB, grayscale and Sobel are computed once for the whole stack; SSIM
+    and fusion stay per pair. fuse_cues min-max normalizes each cue itself.
+    """
+    dE = np.linalg.norm(rgb2lab(refs) - rgb2lab(tests), axis=-1)
+
+    ref_gray = np.rint((refs * 255).astype(np.uint8) @ _GRAY_WEIGHTS).astype(np.uint8)
+    test_gray = np.rint((tests * 255).astype(np.uint8) @ _GRAY_WEIGHTS).astype(np.uint8)
+    edge_delta = np.abs(sobel_stack(ref_gray / 255.0) - sobel_stack(test_gray / 255.0))
+
+    scores = []
+    for i in range(len(refs)):
+        _, sim = ssim(ref_gray[i], test_gray[i], full=True, data_range=255)
+        fused = fuse_cues(1 - sim, dE[i], edge_delta[i])
+        scores.append(damage_score(fused, threshold))
+    return scores
+
+
+def _error_row(pair_id, before, after, tier, error):
+    return {"id": pair_id, "before": before, "after": after, "is_damaged": False,
+            "damage_severity": 0.0, "tier": tier, "error": str(error)}
+
+
+def _score_chunk(chunk, tier, threshold):
+    """Worker entry point: decode, preprocess and score one chunk of pairs."""
+    results = []
+    by_shape = {}
+    size = PREPROCESS_TIERS[tier]["size"]
+    for pair_id, before, after in chunk:
+        try:
+            ref = preprocess(load_image(before, size), tier=tier)
+            test = preprocess(load_image(after, size), tier=tier)
+            by_shape.setdefault(ref.shape, []).append((pair_id, before, after, ref, test))
+        except Exception as e:
+            results.append(_error_row(pair_id, before, after, tier, e))
+
+    for group in by_shape.values():
+        try:
+            scores = score_stack(np.stack([g[3] for g in group]), np.stack([g[4] for g in group]), threshold)
+        except Exception:
+            # Score the group pair by pair so one bad image only fails its own row
+            scores = []
+            for _, _, _, ref, test in group:
+                try:
+                    scores.append(score_stack(ref[None], test[None], threshold)[0])
+                except Exception as e:
+                    scores.append(e)
+        for (pair_id, before, after, _, _), score in zip(group, scores):
+            if isinstance(score, Exception):
+                results.append(_error_row(pair_id, before, after, tier, score))
+                continue
+            is_damaged, severity = score
+            results.append({"id": pair_id, "before": before, "after": after, "is_damaged": is_damaged,
+                            "damage_severity": severity, "tier": tier})
+    return results
+
+
+# =========================
+# Batch Runner
+# =========================
+def verify_batch(pairs, workers=None, chunk_size=8, max_images=None, tier=DEFAULT_TIER, threshold=DAMAGE_THRESHOLD):
+    """
+    Verify many (id, before, after) pairs, yielding result dicts as they finish.
+    Keeps two chunks per worker in flight; `max_images` optionally bounds
+    decoded images in flight (two per pair) below that.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_chunks = 2 * workers
+    if max_images:
+        chunk_size = max(1, min(chunk_size, max_images // 2))
+        max_chunks = max(1, min(max_chunks, max_images // (2 * chunk_size)))
+    pairs = iter(pairs)
+
+    def next_chunk():
+        chunk = []
+        for pair in pairs:
+            chunk.append(pair)
+            if len(chunk) == chunk_size:
+                break
+        return chunk
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        while True:
+            while len(in_flight) < max_chunks:
+                chunk = next_chunk()
+                if not chunk:
+                    break
+                in_flight[pool.submit(_score_chunk, chunk, tier, threshold)] = chunk
+            if not in_flight:
+                return
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                try:
+                    yield from future.result()
+                except Exception as e:
+                    # The worker itself died (e.g. out of memory): fail the chunk, keep the batch
+                    for pair_id, before, after in chunk:
+                        yield _error_row(pair_id, before, after, tier, e)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Verify damage for many before/after pairs")
+    parser.add_argument("--manifest", required=True, help="CSV (before,after[,id]) or JSONL manifest")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Pairs per worker task")
+    parser.add_argument("--max-images", type=int, default=None,
+                        help="Cap on decoded images in flight (default: two chunks per worker)")
+    parser.add_argument("--tier", default=DEFAULT_TIER, help="Preprocessing quality tier")
+    parser.add_argument("--threshold", type=float, default=DAMAGE_THRESHOLD, help="Severity threshold for is_damaged")
+    parser.add_argument("--out", default=None, help="Write JSON lines here instead of stdout")
+    args = parser.parse_args()
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    count = damaged = 0
+    for result in verify_batch(load_manifest(args.manifest), workers=args.workers, chunk_size=args.chunk_size,
+                               max_images=args.max_images, tier=args.tier, threshold=args.threshold):
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        count += 1
+        damaged += result["is_damaged"]
+    if args.out:
+        out.close()
+    print(f"[INFO] Verified {count} pairs, {damaged} flagged as damaged", file=sys.stderr)
@@ -0,0 +1,402 @@
+"""
+benchmark.py
+
+Speed and accuracy safety net for the damage verifier.
+
+--suite   regression suite over a fixed corpus: the shipped sample pairs plus
+          synthetically scratched / stained / dented copies of each "before"
+          photo. Reports per-stage latency (decode, preprocess, SSIM, ΔE,
+          edges, fusion, render), throughput and peak memory, and compares
+          damage_severity against golden_scores.json. Exits 1 on drift.
+--tiers   latency of each preprocessing tier and how closely its
+          damage_severity / is_damaged agree with the "accurate" tier
+--memory  peak memory of the legacy cue functions vs the lean float32
+          pipeline (tracemalloc sees numpy and OpenCV output arrays)
+--modes   damage_severity of "pyramid" vs "standard" mode per pair; exits 1
+          when they differ by more than --tolerance
+
+Usage:
+    python benchmark.py --suite
+    python benchmark.py --suite --update-golden   # after an intended score change
+    python benchmark.py --tiers --pair before.jpg after.jpg 1 --repeats 5
+    python benchmark.py --memory
+    python benchmark.py --modes
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from damage_verifier import (DEFAULT_TIER, PREPROCESS_TIERS, Workspace, analyze_pair, damage_score, deltaE_cue,
+                             deltaE_map, edge_cue, edge_diff, edge_feature, encode_image, extract_features,
+                             fuse_binary, fuse_cues, fused_from_features, gray_feature, lab_feature, load_image,
+                             preprocess, render_results, ssim_cue, ssim_diff, verify_damage_pyramid)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_PATH = os.path.join(HERE, "golden_scores.json")
+
+STAGES = ("decode", "preprocess", "ssim", "deltaE", "edges", "fusion", "render")
+
+# (before, after, is_damaged) - shipped samples, self-comparisons act as negatives
+DEFAULT_PAIRS = [
+    ("before.jpg", "after.jpg", True),
+    ("before1.jpg", "after1.jpg", True),
+    ("before.jpg", "before.jpg", False),
+    ("before1.jpg", "before1.jpg", False),
+]
+
+
+def load_pairs(pairs):
+    """Decode every pair once so decode time is excluded from tier timings."""
+    loaded = []
+    for before, after, label in pairs:
+        before = before if os.path.isabs(before) else os.path.join(HERE, before)
+        after = after if os.path.isabs(after) else os.path.join(HERE, after)
+        loaded.append((os.path.basename(before), os.path.basename(after), load_image(before), load_image(after), label))
+    return loaded
+
+
+def compare_tiers(pairs, repeats=3, reference_tier=DEFAULT_TIER):
+    """
+    Run every tier over the labeled pairs.
+    Returns {tier: {latency_ms, severity_mae, severity_max_err, agreement, accuracy, severities}}.
+    """
+    loaded = load_pairs(pairs)
+    severities = {}
+    decisions = {}
+    latencies = {}
+
+    for tier in PREPROCESS_TIERS:
+        severities[tier], decisions[tier], latencies[tier] = [], [], []
+        for _, _, ref_img, test_img, _ in loaded:
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                _, _, fused = analyze_pair(ref_img, test_img, tier=tier)
+                timings.append((time.perf_counter() - start) * 1000)
+            is_damaged, severity = damage_score(fused)
+            severities[tier].append(severity)
+            decisions[tier].append(is_damaged)
+            latencies[tier].append(float(np.median(timings)))
+
+    labels = np.array([label for *_, label in loaded], dtype=bool)
+    reference = np.array(severities[reference_tier])
+    reference_decisions = np.array(decisions[reference_tier], dtype=bool)
+
+    report = {}
+    for tier in PREPROCESS_TIERS:
+        tier_severity = np.array(severities[tier])
+        tier_decisions = np.array(decisions[tier], dtype=bool)
+        errors = np.abs(tier_severity - reference)
+        report[tier] = {
+            "latency_ms": float(np.mean(latencies[tier])),
+            "severity_mae": float(errors.mean()),
+            "severity_max_err": float(errors.max()),
+            "agreement": float((tier_decisions == reference_decisions).mean()),
+            "accuracy": float((tier_decisions == labels).mean()),
+            "severities": severities[tier],
+        }
+    return report
+
+
+def print_tier_report(report):
+    print(f"{'tier':<10} {'latency ms':>11} {'sev MAE':>9} {'sev max':>9} {'agree':>7} {'acc':>7}")
+    for tier, row in report.items():
+        print(f"{tier:<10} {row['latency_ms']:>11.1f} {row['severity_mae']:>9.3f} {row['severity_max_err']:>9.3f} "
+              f"{row['agreement']:>7.0%} {row['accuracy']:>7.0%}")
+
+
+def compare_modes(pairs, tier=DEFAULT_TIER, tolerance=0.25):
+    """
+    Severity of standard vs pyramid mode for each pair.
+    Returns [{pair, standard, pyramid, diff, tiles_refined, ok}].
+    """
+    rows = []
+    for before, after, ref_img, test_img, _ in load_pairs(pairs):
+        _, standard = damage_score(analyze_pair(ref_img, test_img, tier=tier)[2])
+        fused, refined = verify_damage_pyramid(ref_img, test_img, tier=tier)
+        _, pyramid = damage_score(fused)
+        rows.append({"pair": f"{before}/{after}", "standard": standard, "pyramid": pyramid,
+                     "diff": abs(pyramid - standard), "tiles_refined": refined,
+                     "ok": abs(pyramid - standard) <= tolerance})
+    return rows
+
+
+def print_mode_report(rows):
+    print(f"{'pair':<26} {'standard':>9} {'pyramid':>9} {'diff':>7} {'tiles':>6}")
+    for row in rows:
+        print(f"{row['pair']:<26} {row['standard']:>9.3f} {row['pyramid']:>9.3f} {row['diff']:>7.3f} "
+              f"{row['tiles_refined']:>6}{'' if row['ok'] else '  [WARN] disagree'}")
+
+
+def peak_bytes(fn) -> int:
+    """Peak traced allocation while running fn()."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def compare_memory(pairs, tier=DEFAULT_TIER):
+    """
+    Per-request peak memory of the legacy cue path vs the lean float32 path
+    (feature extraction + fusion, with a warm per-worker workspace).
+    """
+    ws = Workspace()
+    legacy, lean = [], []
+    for *_, ref_img, test_img, _ in load_pairs(pairs):
+        ref, test = preprocess(ref_img, tier=tier), preprocess(test_img, tier=tier)
+
+        legacy.append(peak_bytes(lambda: fuse_cues(ssim_diff(ref, test), deltaE_map(ref, test), edge_diff(ref, test))))
+
+        def run_lean():
+            return fused_from_features(extract_features(ref), extract_features(test), workspace=ws)
+
+        run_lean()  # warm the workspace, as a long-lived worker would be
+        lean.append(peak_bytes(run_lean))
+
+    mb = 1024 * 1024
+    return {
+        "legacy_peak_mb": max(legacy) / mb,
+        "lean_peak_mb": max(lean) / mb,
+        "workspace_mb": ws.nbytes / mb,
+        # ru_maxrss is KB on Linux
+        "process_max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+# =========================
+# Synthetic Damage
+# =========================
+# Synthetic damage is sized relative to the photo so it survives the
+# downscale to the 512x512 working size, denoising and morphological
+# cleanup, and every synthetic case must be detected as damaged.
+def add_scratches(img: np.ndarray, rng, count=6) -> np.ndarray:
+    out = img.copy()
+    h, w = out.shape[:2]
+    thickness = max(3, int(0.008 * max(h, w)))
+    for _ in range(count):
+        x0, y0 = int(rng.integers(w // 8, 7 * w // 8)), int(rng.integers(h // 8, 7 * h // 8))
+        angle = rng.uniform(0, np.pi)
+        length = rng.uniform(0.15, 0.35) * max(h, w)
+        x1, y1 = int(x0 + length * np.cos(angle)), int(y0 + length * np.sin(angle))
+        shade = int(rng.integers(225, 256))
+        cv2.line(out, (x0, y0), (x1, y1), (shade, shade, shade), thickness, cv2.LINE_AA)
+    return out
+
+
+def add_stain(img: np.ndarray, rng, count=2) -> np.ndarray:
+    h, w = img.shape[:2]
+    out = img.astype(np.float32)
+    stain = np.array([20, 45, 75], dtype=np.float32)  # dark brown, BGR
+    for _ in range(count):
+        alpha = np.zeros((h, w), dtype=np.float32)
+        center = (int(rng.integers(w // 5, 4 * w // 5)), int(rng.integers(h // 5, 4 * h // 5)))
+        axes = (int(rng.uniform(0.1, 0.14) * w), int(rng.uniform(0.08, 0.11) * h))
+        cv2.ellipse(alpha, center, axes, float(rng.uniform(0, 180)), 0, 360, 1.0, -1)
+        alpha = cv2.GaussianBlur(alpha, (0, 0), max(axes) / 12)[..., None] * 0.85
+        out = out * (1 - alpha) + stain * alpha
+    return out.astype(np.uint8)
+
+
+def add_dent(img: np.ndarray, rng, count=2) -> np.ndarray:
+    """Pinch the image towards a few points and shade them, like dents catching light."""
+    h, w = img.shape[:2]
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    map_x, map_y = xs.copy(), ys.copy()
+    shade = np.ones((h, w), dtype=np.float32)
+    for _ in range(count):
+        cx, cy = rng.uniform(0.2, 0.8) * w, rng.uniform(0.2, 0.8) * h
+        radius = rng.uniform(0.12, 0.16) * min(h, w)
+        dx, dy = xs - cx, ys - cy
+        falloff = np.clip(1 - np.sqrt(dx * dx + dy * dy) / radius, 0, 1)
+        map_x += dx * falloff * 0.5
+        map_y += dy * falloff * 0.5
+        # Steep rim, so the dent reads as a distinct region and not a gradient
+        shade *= 1 - 0.8 * falloff ** 0.25
+    dented = cv2.remap(img, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+    return (dented * shade[..., None]).astype(np.uint8)
+
+
+SYNTHETIC_DAMAGE = {"scratch": add_scratches, "stain": add_stain, "dent": add_dent}
+
+
+# Placement is random, and damage that lands on a dark, flat patch is
+# genuinely hard to see; this seed places every synthetic case where the
+# "accurate" tier flags it with margin (severity >= 1.3).
+CORPUS_SEED = 314
+
+
+def expected_damaged(case: str) -> bool:
+    """Every case except the unchanged "clean" copies is damage."""
+    return not case.endswith("/clean")
+
+
+def build_corpus(seed=CORPUS_SEED):
+    """[(case name, before bytes, after bytes)], deterministic for a given seed."""
+    corpus = []
+    for index, (before, after, _) in enumerate(p for p in DEFAULT_PAIRS if p[0] != p[1]):
+        with open(os.path.join(HERE, before), "rb") as f:
+            before_bytes = f.read()
+        with open(os.path.join(HERE, after), "rb") as f:
+            corpus.append((f"{before}/real", before_bytes, f.read()))
+        corpus.append((f"{before}/clean", before_bytes, before_bytes))
+
+        before_img = load_image(before_bytes)
+        for offset, (name, damage) in enumerate(SYNTHETIC_DAMAGE.items()):
+            rng = np.random.default_rng(seed + 10 * index + offset)
+            corpus.append((f"{before}/{name}", before_bytes, encode_image(damage(before_img, rng))))
+    return corpus
+
+
+# =========================
+# Regression Suite
+# =========================
+@contextmanager
+def _timed(timings: dict, stage: str):
+    start = time.perf_counter()
+    yield
+    timings[stage] = (time.perf_counter() - start) * 1000
+
+
+def run_case(before_bytes: bytes, after_bytes: bytes, tier: str, ws: Workspace):
+    """One verification split into timed stages. Returns (stage timings in ms, severity, is_damaged)."""
+    timings = {}
+    size = PREPROCESS_TIERS[tier]["size"]
+    with _timed(timings, "decode"):
+        ref_img, test_img = load_image(before_bytes, size), load_image(after_bytes, size)
+    with _timed(timings, "preprocess"):
+        ref, test = preprocess(ref_img, tier=tier), preprocess(test_img, tier=tier)
+    with _timed(timings, "ssim"):
+        ref_gray, test_gray = gray_feature(ref), gray_feature(test)
+        ssim_dissim = ssim_cue(ref_gray, test_gray, ws)
+    with _timed(timings, "deltaE"):
+        dE = deltaE_cue(lab_feature(ref), lab_feature(test), ws)
+    with _timed(timings, "edges"):
+        edge_delta = edge_cue(edge_feature(ref_gray), edge_feature(test_gray), ws)
+    with _timed(timings, "fusion"):
+        fused = fuse_binary(ssim_dissim, dE, edge_delta, ws)
+    with _timed(timings, "render"):
+        encode_image(render_results(ref, test, fused))
+
+    is_damaged, severity = damage_score(fused)
+    return timings, severity, is_damaged
+
+
+def run_suite(tier=DEFAULT_TIER, repeats=3, tolerance=0.25, update_golden=False):
+    corpus = build_corpus()
+    ws = Workspace()
+    run_case(*corpus[0][1:], tier, ws)  # warm-up: imports, workspace buffers
+
+    stage_ms = {stage: [] for stage in STAGES}
+    scores = {}
+    peak = 0
+    for name, before_bytes, after_bytes in corpus:
+        runs = []
+        for _ in range(repeats):
+            runs.append(run_case(before_bytes, after_bytes, tier, ws))
+        for stage in STAGES:
+            stage_ms[stage].append(float(np.median([timings[stage] for timings, _, _ in runs])))
+        _, severity, is_damaged = runs[0]
+        scores[name] = {"damage_severity": severity, "is_damaged": bool(is_damaged)}
+        peak = max(peak, peak_bytes(lambda: run_case(before_bytes, after_bytes, tier, ws)))
+
+    per_pair = {stage: float(np.mean(values)) for stage, values in stage_ms.items()}
+    score_only_ms = sum(per_pair[stage] for stage in STAGES if stage != "render")
+    report = {
+        "tier": tier,
+        "cases": len(corpus),
+        "stage_ms": per_pair,
+        "throughput_pairs_per_s": 1000 / score_only_ms,
+        "throughput_with_render_pairs_per_s": 1000 / (score_only_ms + per_pair["render"]),
+        "peak_mb": peak / (1024 * 1024),
+        "scores": scores,
+        "drift": [],
+    }
+
+    # Independent of the goldens: the suite must still tell damage from no damage
+    for name, score in scores.items():
+        if score["is_damaged"] != expected_damaged(name):
+            report["drift"].append(f"{name}: is_damaged {score['is_damaged']}, expected {expected_damaged(name)}")
+
+    if update_golden:
+        with open(GOLDEN_PATH, "w") as f:
+            json.dump({"tier": tier, "tolerance": tolerance, "cases": scores}, f, indent=2, sort_keys=True)
+        return report
+
+    if not os.path.exists(GOLDEN_PATH):
+        report["drift"].append("no golden_scores.json - run with --update-golden to create it")
+        return report
+
+    with open(GOLDEN_PATH) as f:
+        golden = json.load(f)
+    tolerance = golden.get("tolerance", tolerance)
+    for name, expected in golden["cases"].items():
+        actual = scores.get(name)
+        if actual is None:
+            report["drift"].append(f"{name}: missing from corpus")
+        elif abs(actual["damage_severity"] - expected["damage_severity"]) > tolerance:
+            report["drift"].append(f"{name}: severity {actual['damage_severity']:.3f} "
+                                   f"vs golden {expected['damage_severity']:.3f} (±{tolerance})")
+        elif actual["is_damaged"] != expected["is_damaged"]:
+            report["drift"].append(f"{name}: is_damaged {actual['is_damaged']} vs golden {expected['is_damaged']}")
+    return report
+
+
+def print_suite_report(report):
+    print(f"[INFO] {report['cases']} cases, tier={report['tier']}")
+    for stage, ms in report["stage_ms"].items():
+        print(f"  {stage:<11} {ms:>8.2f} ms")
+    print(f"  throughput  {report['throughput_pairs_per_s']:>8.1f} pairs/s "
+          f"({report['throughput_with_render_pairs_per_s']:.1f} with render)")
+    print(f"  peak mem    {report['peak_mb']:>8.1f} MB")
+    for name, score in report["scores"].items():
+        print(f"  {name:<24} severity={score['damage_severity']:.3f} damaged={score['is_damaged']}")
+    for problem in report["drift"]:
+        print(f"[WARN] {problem}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the damage verifier")
+    parser.add_argument("--suite", action="store_true", help="Run the latency / accuracy regression suite")
+    parser.add_argument("--update-golden", action="store_true", help="With --suite, overwrite golden_scores.json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed severity drift (percentage points)")
+    parser.add_argument("--tier", default=DEFAULT_TIER, help="Preprocessing tier for --suite")
+    parser.add_argument("--tiers", action="store_true", help="Compare preprocessing tiers against the accurate tier")
+    parser.add_argument("--memory", action="store_true", help="Compare peak memory of legacy and lean cue pipelines")
+    parser.add_argument("--modes", action="store_true", help="Compare pyramid and standard mode severities")
+    parser.add_argument("--pair", nargs=3, action="append", metavar=("BEFORE", "AFTER", "DAMAGED"),
+                        help="Labeled pair (DAMAGED is 1 or 0); defaults to the shipped samples")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per pair (median is reported)")
+    args = parser.parse_args()
+
+    pairs = [(b, a, d == "1") for b, a, d in args.pair] if args.pair else DEFAULT_PAIRS
+
+    failed = False
+    if args.suite:
+        report = run_suite(tier=args.tier, repeats=args.repeats, tolerance=args.tolerance,
+                           update_golden=args.update_golden)
+        print_suite_report(report)
+        failed = bool(report["drift"])
+    if args.tiers:
+        print_tier_report(compare_tiers(pairs, repeats=args.repeats))
+    if args.memory:
+        for name, value in compare_memory(pairs).items():
+            print(f"{name:<20} {value:>8.1f}")
+    if args.modes:
+        rows = compare_modes(pairs, tolerance=args.tolerance)
+        print_mode_report(rows)
+        failed = failed or not all(row["ok"] for row in rows)
+    if not (args.suite or args.tiers or args.memory or args.modes):
+        parser.print_help()
+    sys.exit(1 if failed else 0)
@@ -6,6 +6,15 @@ High-accuracy damage verification using:
 - Color differences (ΔE in LAB space)
 - Edge / texture changes
 - Weighted fusion & heatmap visualization
+
+Verification modes:
+- "standard": whole image at the tier's working size (512x512 by default)
+- "pyramid":  coarse pass, then full-resolution refinement of flagged tiles
+
+Render modes:
+- "matplotlib": 4-panel figure with colorbars (original, slowest)
+- "opencv":     same panels composed directly with OpenCV/NumPy
+- "none":       scores only, nothing is drawn or written
 """
 
 import cv2
@@ -13,21 +22,55 @@ import numpy as np
 from skimage.metrics import structural_similarity as ssim
 from skimage import exposure, filters
 from skimage.color import rgb2lab
-import matplotlib.pyplot as plt
+import hashlib
 import os
+import threading
+
+from feature_cache import default_cache
+from image_io import decode_image, describe_source, read_source
+from mask_store import default_store
+
+RENDER_MODES = ("matplotlib", "opencv", "none")
+VERIFY_MODES = ("standard", "pyramid")
+
+# Severity (mean of fused map * 100) above which a pair is flagged as damaged
+DAMAGE_THRESHOLD = 0.5
 
 # =========================
 # Preprocessing
 # =========================
-def preprocess(img: np.ndarray, size=(512, 512)) -> np.ndarray:
+# Quality tiers: working resolution + denoiser.
+# "accurate" is the original pipeline; run benchmark.py --tiers to measure
+# latency and severity agreement of the cheaper tiers against it.
+PREPROCESS_TIERS = {
+    "fast": {"size": (256, 256), "denoise": "gaussian"},
+    "balanced": {"size": (512, 512), "denoise": "bilateral"},
+    "accurate": {"size": (512, 512), "denoise": "nlmeans"},
+}
+DEFAULT_TIER = "accurate"
+
+
+def preprocess(img: np.ndarray, size=None, tier=DEFAULT_TIER) -> np.ndarray:
     """Resize, denoise, normalize image to [0,1]."""
+    if tier not in PREPROCESS_TIERS:
+        raise ValueError(f"Unknown preprocessing tier '{tier}', expected one of {tuple(PREPROCESS_TIERS)}")
+    settings = PREPROCESS_TIERS[tier]
+    size = size or settings["size"]
+
     # Ensure input is uint8
     if img.dtype != np.uint8:
         img = (img * 255).astype(np.uint8)
     
     img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
-    img = cv2.fastNlMeansDenoisingColored(img, None, 5, 5, 7, 21)
-    return img.astype(np.float32) / 255.0
+    if settings["denoise"] == "nlmeans":
+        img = cv2.fastNlMeansDenoisingColored(img, None, 5, 5, 7, 21)
+    elif settings["denoise"] == "bilateral":
+        img = cv2.bilateralFilter(img, 5, 40, 5)
+    else:
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+    out = img.astype(np.float32)
+    out *= 1.0 / 255.0
+    return out
 
 
 # =========================
@@ -93,6 +136,9 @@ def fuse_cues(ssim_dissim: np.ndarray, dE: np.ndarray, edge_delta: np.ndarray, m
 # Visualization
 # =========================
 def visualize_results(ref: np.ndarray, test: np.ndarray, fused: np.ndarray, save_path="damage_result.png"):
+    # Imported lazily so score-only and OpenCV renders never pay for matplotlib
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(18, 6))
     
     plt.subplot(1, 4, 1)
@@ -159,28 +205,461 @@ def visualize_results(ref: np.ndarray, test: np.ndarray, fused: np.ndarray, save
     plt.close()
 
 
+# =========================
+# Headless Visualization (OpenCV/NumPy only)
+# =========================
+def _colormap_lut(hex_colors) -> np.ndarray:
+    """Build a 256-entry BGR lookup table by interpolating anchor colors."""
+    anchors = np.array([[int(h[i:i + 2], 16) for i in (5, 3, 1)] for h in hex_colors], dtype=np.float32)
+    positions = np.linspace(0, 255, len(anchors))
+    lut = np.stack([np.interp(np.arange(256), positions, anchors[:, c]) for c in range(3)], axis=-1)
+    return lut.astype(np.uint8)
+
+
+# ColorBrewer anchors of the matplotlib "YlOrRd" and "Reds" colormaps
+_YLORRD_LUT = _colormap_lut(["#ffffcc", "#ffeda0", "#fed976", "#feb24c", "#fd8d3c",
+                             "#fc4e2a", "#e31a1c", "#bd0026", "#800026"])
+_REDS_LUT = _colormap_lut(["#fff5f0", "#fee0d2", "#fcbba1", "#fc9272", "#fb6a4a",
+                           "#ef3b2c", "#cb181d", "#a50f15", "#67000d"])
+
+
+def _to_uint8(img: np.ndarray) -> np.ndarray:
+    if img.dtype == np.uint8:
+        return img
+    return (np.clip(img, 0, 1) * 255).astype(np.uint8)
+
+
+def _titled(panel: np.ndarray, title: str, bar_height=32) -> np.ndarray:
+    bar = np.full((bar_height, panel.shape[1], 3), 255, dtype=np.uint8)
+    cv2.putText(bar, title, (8, bar_height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2, cv2.LINE_AA)
+    return np.vstack([bar, panel])
+
+
+def render_results(ref: np.ndarray, test: np.ndarray, fused: np.ndarray) -> np.ndarray:
+    """
+    Compose the same 4 panels as visualize_results (before, after, filtered
+    heatmap, red overlay) into a single BGR uint8 image buffer.
+    """
+    ref_u8 = _to_uint8(ref)
+    test_u8 = _to_uint8(test)
+
+    damage_threshold = 0.3
+    enhanced_fused = np.where(fused < damage_threshold, 0, fused)
+    levels = (np.clip(enhanced_fused, 0, 1) * 255).astype(np.uint8)
+
+    heatmap = _YLORRD_LUT[levels]
+    alpha = 0.6
+    blended = cv2.addWeighted(test_u8, 1 - alpha, _REDS_LUT[levels], alpha, 0)
+
+    panels = [
+        _titled(ref_u8, "Before (Reference)"),
+        _titled(test_u8, "After (Test)"),
+        _titled(heatmap, "Damage Heatmap (Filtered)"),
+        _titled(blended, "Damage Overlay (Red = Damage)"),
+    ]
+    return np.hstack(panels)
+
+
+def encode_image(img: np.ndarray, ext=".png") -> bytes:
+    """Encode an image buffer in memory (no temp files)."""
+    ok, buf = cv2.imencode(ext, img)
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    return buf.tobytes()
+
+
 # =========================
 # Main Pipeline
 # =========================
-def verify_damage(reference_path: str, test_path: str, mask_path: str = None, save_path="damage_result.png") -> np.ndarray:
-    ref = cv2.imread(reference_path)
-    test = cv2.imread(test_path)
+def load_image(source, target_size=None) -> np.ndarray:
+    """
+    Decode a path, URL, bytes or file-like source. With target_size, large
+    JPEGs are decoded at reduced resolution (see image_io.py).
+    """
+    return decode_image(read_source(source), target_size, describe_source(source))
 
-    ref = preprocess(ref)
-    test = preprocess(test)
 
-    mask = cv2.imread(mask_path, 0) if mask_path else None
+class ImageSource:
+    """A verification input that is read once, hashed once and decoded once per resolution."""
+
+    def __init__(self, source):
+        self.source = source
+        self._data = None
+        self._digest = None
+        self._images = {}
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = read_source(self.source)
+        return self._data
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.data).hexdigest()
+        return self._digest
+
+    def image_at(self, target_size=None) -> np.ndarray:
+        """Decoded image, at reduced resolution if it still covers target_size."""
+        key = tuple(target_size) if target_size else None
+        if key not in self._images:
+            self._images[key] = decode_image(self.data, target_size, describe_source(self.source))
+        return self._images[key]
+
+    @property
+    def image(self) -> np.ndarray:
+        return self.image_at(None)
+
+
+# =========================
+# Lean float32 Cue Pipeline
+# =========================
+# Bumped whenever extract_features changes, so cached features stay valid
+FEATURE_VERSION = 2
+
+# skimage structural_similarity defaults: 7x7 uniform window, sample covariance
+_SSIM_WIN = 7
+_SSIM_COV_NORM = _SSIM_WIN ** 2 / (_SSIM_WIN ** 2 - 1)
+_SSIM_C1 = 0.01 ** 2
+_SSIM_C2 = 0.03 ** 2
+_MORPH_KERNEL = np.ones((3, 3), np.uint8)
+
+
+class Workspace:
+    """Scratch buffers reused across verifications of the same image size."""
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name: str, shape, dtype=np.float32) -> np.ndarray:
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+        return buf
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+
+_workspaces = threading.local()
+
+
+def default_workspace() -> Workspace:
+    """One Workspace per worker thread."""
+    if not hasattr(_workspaces, "ws"):
+        _workspaces.ws = Workspace()
+    return _workspaces.ws
+
+
+def _normalize_(arr: np.ndarray) -> np.ndarray:
+    """In-place version of (arr - min) / (ptp + 1e-6)."""
+    arr -= arr.min()
+    arr /= arr.max() + 1e-6
+    return arr
+
+
+def gray_feature(pre: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(pre, cv2.COLOR_BGR2GRAY)
+
+
+def lab_feature(pre: np.ndarray) -> np.ndarray:
+    # RGB2Lab on BGR data matches what rgb2lab() sees in deltaE_map
+    return cv2.cvtColor(pre, cv2.COLOR_RGB2Lab)
+
+
+def edge_feature(gray: np.ndarray) -> np.ndarray:
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3, borderType=cv2.BORDER_REFLECT)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3, borderType=cv2.BORDER_REFLECT)
+    return cv2.magnitude(gx, gy, magnitude=gx)
+
+
+def extract_features(pre: np.ndarray) -> dict:
+    """Per-image float32 inputs of the SSIM / ΔE / edge cues, computed once."""
+    gray = gray_feature(pre)
+    return {"pre": pre, "gray": gray, "lab": lab_feature(pre), "edges": edge_feature(gray)}
+
+
+def _ssim_dissim_(x: np.ndarray, y: np.ndarray, ws: Workspace) -> np.ndarray:
+    """1 - SSIM map (skimage defaults, data_range=1) built entirely in workspace buffers."""
+    shape = x.shape
+
+    def box(src, name):
+        return cv2.boxFilter(src, -1, (_SSIM_WIN, _SSIM_WIN), dst=ws.get(name, shape),
+                             normalize=True, borderType=cv2.BORDER_REFLECT)
+
+    tmp = ws.get("ssim_tmp", shape)
+    ux, uy = box(x, "ssim_ux"), box(y, "ssim_uy")
+    uxx = box(np.multiply(x, x, out=tmp), "ssim_uxx")
+    uyy = box(np.multiply(y, y, out=tmp), "ssim_uyy")
+    uxy = box(np.multiply(x, y, out=tmp), "ssim_uxy")
+
+    # Variances / covariance, in place
+    uxx -= np.multiply(ux, ux, out=tmp)
+    uxx *= _SSIM_COV_NORM
+    uyy -= np.multiply(uy, uy, out=tmp)
+    uyy *= _SSIM_COV_NORM
+    uxy -= np.multiply(ux, uy, out=tmp)
+    uxy *= _SSIM_COV_NORM
+
+    # A1 = 2*ux*uy + C1 (tmp), A2 = 2*vxy + C2 (uxy)
+    np.multiply(ux, uy, out=tmp)
+    tmp *= 2
+    tmp += _SSIM_C1
+    uxy *= 2
+    uxy += _SSIM_C2
+    # B1 = ux^2 + uy^2 + C1 (ux), B2 = vx + vy + C2 (uxx)
+    ux *= ux
+    uy *= uy
+    ux += uy
+    ux += _SSIM_C1
+    uxx += uyy
+    uxx += _SSIM_C2
+
+    tmp *= uxy
+    ux *= uxx
+    out = np.divide(tmp, ux, out=ws.get("cue_ssim", shape))
+    np.subtract(1.0, out, out=out)
+    return out
 
-    ssim_dissim = ssim_diff(ref, test, mask)
-    dE = deltaE_map(ref, test, mask)
-    edge_delta = edge_diff(ref, test, mask)
 
-    fused = fuse_cues(ssim_dissim, dE, edge_delta, mask)
+def ssim_cue(ref_gray: np.ndarray, test_gray: np.ndarray, ws: Workspace) -> np.ndarray:
+    return _normalize_(_ssim_dissim_(ref_gray, test_gray, ws))
 
-    visualize_results(ref, test, fused, save_path)
+
+def deltaE_cue(ref_lab: np.ndarray, test_lab: np.ndarray, ws: Workspace) -> np.ndarray:
+    lab_delta = np.subtract(ref_lab, test_lab, out=ws.get("lab_delta", ref_lab.shape))
+    lab_delta *= lab_delta
+    dE = np.sum(lab_delta, axis=-1, out=ws.get("cue_de", ref_lab.shape[:2]))
+    return _normalize_(np.sqrt(dE, out=dE))
+
+
+def edge_cue(ref_edges: np.ndarray, test_edges: np.ndarray, ws: Workspace) -> np.ndarray:
+    edge_delta = np.subtract(ref_edges, test_edges, out=ws.get("cue_edge", ref_edges.shape))
+    return _normalize_(np.abs(edge_delta, out=edge_delta))
+
+
+def fuse_binary(ssim_dissim: np.ndarray, dE: np.ndarray, edge_delta: np.ndarray, ws: Workspace,
+                mask: np.ndarray = None) -> np.ndarray:
+    """Weighted fusion, adaptive threshold and morphological cleanup (see fuse_cues), in place."""
+    shape = ssim_dissim.shape
+
+    weight = None
+    if mask is not None:
+        weight = cv2.resize(mask.astype(np.uint8), shape[::-1]).astype(np.float32) / 255.0
+        for cue in (ssim_dissim, dE, edge_delta):
+            cue *= weight
+            _normalize_(cue)
+
+    fused = np.multiply(ssim_dissim, 0.4, out=ws.get("fused", shape))
+    dE *= 0.4
+    fused += dE
+    edge_delta *= 0.2
+    fused += edge_delta
+
+    binary = np.greater(fused, 0.5 * fused.max(), out=ws.get("binary", shape, np.bool_)).view(np.uint8)
+    opened = cv2.morphologyEx(binary, cv2.MORPH_OPEN, _MORPH_KERNEL, dst=ws.get("opened", shape, np.uint8), iterations=2)
+    clean = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, _MORPH_KERNEL, dst=binary, iterations=2)
+
+    result = clean.astype(np.float32)
+    if weight is not None:
+        result[weight <= 0] = 0
+    return result
+
+
+def fused_from_features(ref_feat: dict, test_feat: dict, mask: np.ndarray = None, workspace: Workspace = None) -> np.ndarray:
+    """
+    Same cues and fusion as ssim_diff / deltaE_map / edge_diff + fuse_cues,
+    computed in float32 with per-worker scratch buffers and in-place
+    normalization. Only the returned damage mask is newly allocated.
+    """
+    ws = workspace or default_workspace()
+    ssim_dissim = ssim_cue(ref_feat["gray"], test_feat["gray"], ws)
+    dE = deltaE_cue(ref_feat["lab"], test_feat["lab"], ws)
+    edge_delta = edge_cue(ref_feat["edges"], test_feat["edges"], ws)
+    return fuse_binary(ssim_dissim, dE, edge_delta, ws, mask)
+
+
+def _cached(cache, key: str, compute) -> dict:
+    if cache is None:
+        return compute()
+    features = cache.get(key)
+    if features is None:
+        features = compute()
+        cache.put(key, features)
+    return features
+
+
+def image_features(src: ImageSource, tier=DEFAULT_TIER, cache=None) -> dict:
+    """Preprocessed array + gray/LAB/edge features, keyed by content hash and tier settings."""
+    settings = PREPROCESS_TIERS[tier]
+    key = f"{src.digest}:v{FEATURE_VERSION}:{tier}:{settings['size'][0]}x{settings['size'][1]}:{settings['denoise']}"
+    return _cached(cache, key, lambda: extract_features(preprocess(src.image_at(settings["size"]), tier=tier)))
+
+
+def thumbnail_features(src: ImageSource, cache=None) -> dict:
+    return _cached(cache, f"{src.digest}:thumb64", lambda: {"thumb": _gray_thumbnail(src.image_at((64, 64)))})
+
+
+def analyze_pair(ref_img: np.ndarray, test_img: np.ndarray, mask: np.ndarray = None, tier=DEFAULT_TIER):
+    """Run the scoring part of the pipeline. Returns (ref, test, fused)."""
+    ref_feat = extract_features(preprocess(ref_img, tier=tier))
+    test_feat = extract_features(preprocess(test_img, tier=tier))
+
+    fused = fused_from_features(ref_feat, test_feat, mask)
+    return ref_feat["pre"], test_feat["pre"], fused
+
+
+def damage_score(fused: np.ndarray, threshold=DAMAGE_THRESHOLD):
+    """Severity metric and damage decision for a fused map."""
+    severity = float(fused.mean() * 100)
+    return severity > threshold, severity
+
+
+def verify_damage(reference_path: str, test_path: str, mask_path: str = None, save_path="damage_result.png",
+                  render="matplotlib", tier=DEFAULT_TIER) -> np.ndarray:
+    if render not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode '{render}', expected one of {RENDER_MODES}")
+
+    ref_img = load_image(reference_path)
+    test_img = load_image(test_path)
+    mask = cv2.imread(mask_path, 0) if mask_path else None
+
+    ref, test, fused = analyze_pair(ref_img, test_img, mask, tier=tier)
+
+    if render == "matplotlib":
+        visualize_results(ref, test, fused, save_path)
+    elif render == "opencv":
+        cv2.imwrite(save_path, render_results(ref, test, fused))
     return fused
 
 
+# =========================
+# Coarse-to-Fine (Pyramid) Verification
+# =========================
+def _raw_cues(ref: np.ndarray, test: np.ndarray):
+    """Un-normalized SSIM dissimilarity, ΔE and edge difference of one full-resolution tile."""
+    ref_gray = cv2.cvtColor((ref * 255).astype(np.uint8), cv2.COLOR_BGR2GRAY)
+    test_gray = cv2.cvtColor((test * 255).astype(np.uint8), cv2.COLOR_BGR2GRAY)
+    _, sim = ssim(ref_gray, test_gray, full=True, data_range=255)
+    dE = np.linalg.norm(rgb2lab(ref) - rgb2lab(test), axis=-1)
+    edges = np.abs(filters.sobel(ref_gray) - filters.sobel(test_gray))
+    return [(1 - sim).astype(np.float32), dE.astype(np.float32), edges.astype(np.float32)]
+
+
+def verify_damage_pyramid(ref_img: np.ndarray, test_img: np.ndarray, tier=DEFAULT_TIER, tile=256, margin=16,
+                          grow=None):
+    """
+    Two-pass verification for high-resolution photos.
+
+    Pass 1 runs the normal pipeline at the tier's working size. Pass 2
+    re-runs SSIM / ΔE / edge analysis at full resolution on tiles that touch
+    a coarse detection (grown by `grow` full-resolution pixels, default three
+    coarse pixels); every other tile stays 0. Cues are normalized and
+    thresholded with statistics over all refined tiles, not per tile, and
+    refined pixels must lie near a coarse detection, so the result sharpens
+    the coarse mask instead of re-detecting inside every tile and severity
+    stays comparable to "standard" mode. Tiles are analysed with `margin`
+    extra pixels of context to avoid SSIM border artefacts.
+    Returns (full-resolution damage mask, tiles refined).
+    """
+    h, w = ref_img.shape[:2]
+    if test_img.shape[:2] != (h, w):
+        test_img = cv2.resize(test_img, (w, h), interpolation=cv2.INTER_AREA)
+
+    _, _, coarse = analyze_pair(ref_img, test_img, tier=tier)
+    coarse_full = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_NEAREST)
+    grow = grow or 3 * max(1, round(max(h / coarse.shape[0], w / coarse.shape[1])))
+    near = cv2.dilate(coarse_full.astype(np.uint8), np.ones((2 * grow + 1, 2 * grow + 1), np.uint8))
+
+    tiles = []
+    for y0 in range(0, h, tile):
+        for x0 in range(0, w, tile):
+            y1, x1 = min(y0 + tile, h), min(x0 + tile, w)
+            if not near[y0:y1, x0:x1].any():
+                continue
+
+            ya, xa = max(0, y0 - margin), max(0, x0 - margin)
+            yb, xb = min(h, y1 + margin), min(w, x1 + margin)
+            ref_tile = cv2.GaussianBlur(ref_img[ya:yb, xa:xb], (3, 3), 0).astype(np.float32) / 255.0
+            test_tile = cv2.GaussianBlur(test_img[ya:yb, xa:xb], (3, 3), 0).astype(np.float32) / 255.0
+            cues = [cue[y0 - ya:y1 - ya, x0 - xa:x1 - xa] for cue in _raw_cues(ref_tile, test_tile)]
+            tiles.append(((y0, y1, x0, x1), cues))
+
+    mask = np.zeros((h, w), dtype=np.float32)
+    if not tiles:
+        return mask, 0
+
+    # Same weights and 0.5 * max threshold as fuse_cues, over all refined tiles at once
+    scales = [max(float(cues[i].max()) for _, cues in tiles) + 1e-6 for i in range(3)]
+    for (y0, y1, x0, x1), (ssim_dissim, dE, edges) in tiles:
+        mask[y0:y1, x0:x1] = 0.4 * ssim_dissim / scales[0] + 0.4 * dE / scales[1] + 0.2 * edges / scales[2]
+    binary = ((mask > 0.5 * mask.max()) & (near > 0)).astype(np.uint8)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, _MORPH_KERNEL, iterations=2)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, _MORPH_KERNEL, iterations=2)
+    return binary.astype(np.float32), len(tiles)
+
+
+def _display_images(ref_img: np.ndarray, test_img: np.ndarray, fused: np.ndarray, max_side=1024):
+    """Downscale a full-resolution result so renders stay cheap."""
+    h, w = fused.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return (cv2.resize(ref_img, size, interpolation=cv2.INTER_AREA),
+            cv2.resize(test_img, size, interpolation=cv2.INTER_AREA),
+            cv2.resize(fused, size, interpolation=cv2.INTER_AREA))
+
+
+# =========================
+# Fast Path (unchanged items)
+# =========================
+# Pairs whose thumbnail similarity reaches this value skip the full pipeline.
+# Set to None (or VERIFIER_FAST_PATH_THRESHOLD=off) to always run it.
+_fast_path_env = os.getenv("VERIFIER_FAST_PATH_THRESHOLD", "0.97")
+FAST_PATH_THRESHOLD = None if _fast_path_env.lower() in ("", "off", "none") else float(_fast_path_env)
+
+# How often the fast path was evaluated / short-circuited in this process
+FAST_PATH_STATS = {"checked": 0, "fired": 0}
+
+
+def _gray_thumbnail(img: np.ndarray, size=64) -> np.ndarray:
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def perceptual_hash(gray: np.ndarray) -> np.ndarray:
+    """64-bit DCT perceptual hash of a grayscale image, as a boolean array."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(small)[:8, :8].flatten()
+    return low_freq > np.median(low_freq[1:])
+
+
+def quick_check(ref_img: np.ndarray, test_img: np.ndarray, diff_level=25):
+    """
+    Cheap similarity check on 64x64 grayscale thumbnails.
+    Returns (confidence the pair is unchanged in [0,1], severity estimate).
+    Confidence is the lower of perceptual-hash agreement and low-res SSIM;
+    the severity estimate is the % of thumbnail pixels that changed noticeably.
+    """
+    ref_thumb = _gray_thumbnail(ref_img)
+    test_thumb = _gray_thumbnail(test_img)
+
+    hash_similarity = 1.0 - np.count_nonzero(perceptual_hash(ref_thumb) != perceptual_hash(test_thumb)) / 64.0
+    lowres_ssim = ssim(ref_thumb, test_thumb, data_range=255)
+
+    changed = cv2.absdiff(ref_thumb, test_thumb) > diff_level
+    severity = float(changed.mean() * 100)
+    return float(min(hash_similarity, lowres_ssim)), severity
+
+
+def fast_path_stats() -> dict:
+    stats = dict(FAST_PATH_STATS)
+    stats["rate"] = stats["fired"] / stats["checked"] if stats["checked"] else 0.0
+    return stats
+
+
 
 if __name__ == "__main__":
     import argparse
@@ -188,14 +667,19 @@ if __name__ == "__main__":
     parser.add_argument("--before", type=str, required=True, help="Path to BEFORE image")
     parser.add_argument("--after", type=str, required=True, help="Path to AFTER image")
     parser.add_argument("--outdir", type=str, required=True, help="Output directory to save results")
+    parser.add_argument("--render", choices=RENDER_MODES, default="matplotlib", help="Visualization backend")
+    parser.add_argument("--tier", choices=tuple(PREPROCESS_TIERS), default=DEFAULT_TIER, help="Preprocessing quality tier")
     args = parser.parse_args()
 
     os.makedirs(args.outdir, exist_ok=True)
 
     # Only generate and save damage_result.png (side-by-side visualization)
     result_path = os.path.join(args.outdir, "damage_result.png")
-    verify_damage(args.before, args.after, save_path=result_path)
-    print(f"[INFO] Side-by-side damage result saved at {result_path}")
+    fused = verify_damage(args.before, args.after, save_path=result_path, render=args.render, tier=args.tier)
+    if args.render == "none":
+        print(f"[INFO] Damage severity: {damage_score(fused)[1]:.2f}")
+    else:
+        print(f"[INFO] Side-by-side damage result saved at {result_path}")
 
     # =========================
     # Overlay Working Code (from overlayworkingcode.txt)
@@ -279,7 +763,7 @@ if __name__ == "__main__":
 
 # At the bottom of damage_verifier.py
 
-def generate_overlay(before_path, after_path, outdir="outputs/case_001"):
+def generate_overlay(before_path, after_path, outdir="outputs/case_001", tier=DEFAULT_TIER):
     """Generate overlay visualization of damage detection."""
     os.makedirs(outdir, exist_ok=True)
 
@@ -288,8 +772,8 @@ def generate_overlay(before_path, after_path, outdir="outputs/case_001"):
     if ref is None or test is None:
         raise ValueError("Could not read one of the input images. Check file paths.")
 
-    ref = preprocess(ref)
-    test = preprocess(test)
+    ref = preprocess(ref, tier=tier)
+    test = preprocess(test, tier=tier)
 
     ssim_map_val = compute_ssim(ref, test)
     color_diff = compute_color_diff(ref, test)
@@ -357,32 +841,124 @@ def visualize_damage(before, after, damage_mask, alpha=0.5):
     overlay = cv2.addWeighted(after, 1 - alpha, heatmap, alpha, 0)
     return overlay
 
-def verify_damage_with_json(before_path, after_path, outdir="outputs"):
+def render_overlay(mask_key: str, after_image, store=None) -> str:
+    """Overlay PNG for a stored damage mask, rendered on first view and cached (see mask_store.py)."""
+    store = store or default_store()
+    return store.overlay(mask_key, load_image(after_image), lambda after, damage: visualize_damage(after, after, damage))
+
+def store_damage_mask(result: dict, rental_id, store=None):
+    """
+    Pop the damage_mask from a verify_damage_with_json(return_mask=True)
+    result and store it for the rental (see mask_store.py). Call this only
+    when the damage report is about to be saved. Returns {key, url, regions,
+    bytes}, or None when there was no damage to store.
+    """
+    mask = result.pop("damage_mask", None)
+    if mask is None or rental_id is None:
+        return None
+    return (store or default_store()).save(rental_id, mask)
+
+def delete_damage_mask(mask_key: str, store=None):
+    """Undo store_damage_mask when the damage report insert fails, so no mask is orphaned."""
+    (store or default_store()).delete(mask_key)
+
+def verify_damage_with_json(before_path, after_path, outdir="outputs", render="matplotlib", tier=DEFAULT_TIER,
+                            mode="standard", fast_path_threshold=FAST_PATH_THRESHOLD, use_cache=True,
+                            return_mask=False):
     """
     Runs your full OpenCV pipeline and returns JSON result.
+
+    before_path / after_path may be paths, URLs, bytes or file-like objects;
+    the legacy render="matplotlib" + mode="standard" path needs file paths.
+
+    render="matplotlib" keeps the original figure + separate overlay pass,
+    render="opencv" draws both from a single analysis, and render="none"
+    returns scores only without touching the filesystem.
+    tier selects the preprocessing quality tier (see PREPROCESS_TIERS).
+    mode="pyramid" refines suspicious tiles at full resolution
+    (see verify_damage_pyramid).
+    fast_path_threshold: if the thumbnail quick_check is at least this
+    confident that nothing changed, return is_damaged=False with an estimated
+    severity and skip the full pipeline (no renders). None disables it.
+    use_cache: reuse features of previously seen photos (see feature_cache.py),
+    so a known "before" photo only costs reading and hashing its bytes.
+    return_mask: when damage is found, also return the fused mask as
+    "damage_mask" (a numpy array, not JSON). Whoever saves the damage report
+    passes it to store_damage_mask; the overlay is rendered later by
+    render_overlay, only when viewed.
     """
-    os.makedirs(outdir, exist_ok=True)
-    
     try:
-        # Generate side-by-side damage result
-        result_path = os.path.join(outdir, "damage_result.png")
-        fused = verify_damage(before_path, after_path, save_path=result_path)
+        if mode not in VERIFY_MODES:
+            raise ValueError(f"Unknown verification mode '{mode}', expected one of {VERIFY_MODES}")
+        if render not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode '{render}', expected one of {RENDER_MODES}")
+
+        cache = default_cache() if use_cache else None
+        ref_src, test_src = ImageSource(before_path), ImageSource(after_path)
+
+        extra = {}
+        if fast_path_threshold is not None:
+            FAST_PATH_STATS["checked"] += 1
+            confidence, estimate = quick_check(thumbnail_features(ref_src, cache)["thumb"],
+                                               thumbnail_features(test_src, cache)["thumb"])
+            if confidence >= fast_path_threshold and estimate <= DAMAGE_THRESHOLD:
+                FAST_PATH_STATS["fired"] += 1
+                return {
+                    "is_damaged": False,
+                    "damage_severity": estimate,
+                    "overlay_path": None,
+                    "tier": tier,
+                    "mode": mode,
+                    "fast_path": True,
+                    "fast_path_confidence": confidence
+                }
+            extra["fast_path_confidence"] = confidence
+
+        if render == "matplotlib" and mode == "standard":
+            os.makedirs(outdir, exist_ok=True)
+
+            # Generate side-by-side damage result
+            result_path = os.path.join(outdir, "damage_result.png")
+            fused = verify_damage(before_path, after_path, save_path=result_path, tier=tier)
+
+            # Generate overlay visualization
+            overlay_path = generate_overlay(before_path, after_path, outdir=outdir, tier=tier)
+        else:
+            if mode == "pyramid":
+                ref_img, test_img = ref_src.image, test_src.image
+                fused, extra["tiles_refined"] = verify_damage_pyramid(ref_img, test_img, tier=tier)
+                ref, test, display = _display_images(ref_img, test_img, fused) if render != "none" else (None,) * 3
+            else:
+                ref_feat = image_features(ref_src, tier, cache)
+                test_feat = image_features(test_src, tier, cache)
+                fused = fused_from_features(ref_feat, test_feat)
+                ref, test, display = ref_feat["pre"], test_feat["pre"], fused
+            overlay_path = None
+
+            if render != "none":
+                os.makedirs(outdir, exist_ok=True)
+                result_path = os.path.join(outdir, "damage_result.png")
+                if render == "matplotlib":
+                    visualize_results(ref, test, display, result_path)
+                else:
+                    cv2.imwrite(result_path, render_results(ref, test, display))
+                overlay_path = os.path.join(outdir, "overlay.png")
+                cv2.imwrite(overlay_path, visualize_damage(ref, test, display))
+
+        is_damaged, severity = damage_score(fused)
 
-        # Generate overlay visualization
-        overlay_path = generate_overlay(before_path, after_path, outdir=outdir)
-
-        # Example severity metric
-        severity = float(fused.mean() * 100)
-
-        # More reasonable threshold - even small differences should be flagged
-        damage_threshold = 0.5  # Much lower and more sensitive threshold
-        
         result = {
-            "is_damaged": severity > damage_threshold,
+            "is_damaged": is_damaged,
             "damage_severity": severity,
-            "overlay_path": overlay_path
+            "overlay_path": overlay_path,
+            "tier": tier,
+            "mode": mode,
+            **extra
         }
 
+        if return_mask and is_damaged:
+            result["damage_mask"] = fused
+
         return result
         
     except Exception as e:
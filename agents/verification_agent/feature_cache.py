@@ -0,0 +1,128 @@
+"""
+feature_cache.py
+
+Content-addressed cache for per-image verification features
+(preprocessed array, grayscale, LAB, edge map, thumbnail).
+
+Keys are "<content hash>:<preprocessing params>", so the same photo is
+only decoded / denoised / converted once no matter how many "after"
+photos it is compared against.
+
+- Memory tier: LRU bounded by total array bytes
+- Disk tier (optional): one .npy per array under disk_dir/<key>/,
+  loaded back memory-mapped
+
+Environment (for the process-wide default_cache()):
+- VERIFIER_CACHE_MB   memory budget in MB (default 256, 0 disables)
+- VERIFIER_CACHE_DIR  enables the on-disk tier
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FeatureCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def _size(features: dict) -> int:
+        return sum(arr.nbytes for arr in features.values())
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key.replace(":", "_").replace(os.sep, "_"))
+
+    def get(self, key: str):
+        """Return the feature dict for key, or None."""
+        with self._lock:
+            features = self._entries.get(key)
+            if features is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return features
+
+        features = self._load(key) if self.disk_dir else None
+        if features is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["disk_hits"] += 1
+        self._remember(key, features)
+        return features
+
+    def put(self, key: str, features: dict):
+        # Cached arrays are shared between requests - never let callers mutate them
+        for arr in features.values():
+            arr.flags.writeable = False
+        self._remember(key, features)
+        if self.disk_dir:
+            self._save(key, features)
+
+    def _remember(self, key: str, features: dict):
+        size = self._size(features)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._size(self._entries.pop(key))
+            self._entries[key] = features
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+                self.stats["evictions"] += 1
+
+    def _save(self, key: str, features: dict):
+        path = self._disk_path(key)
+        if os.path.isdir(path):
+            return
+        tmp = f"{path}.tmp{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        for name, arr in features.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), arr)
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            # Another process published the same key first
+            for name in os.listdir(tmp):
+                os.remove(os.path.join(tmp, name))
+            os.rmdir(tmp)
+
+    def _load(self, key: str):
+        path = self._disk_path(key)
+        if not os.path.isdir(path):
+            return None
+        return {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r")
+                for name in os.listdir(path) if name.endswith(".npy")}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        return {**self.stats, "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide cache configured from the environment (None if disabled)."""
+    global _default_cache
+    if _default_cache is None:
+        max_mb = int(os.getenv("VERIFIER_CACHE_MB", "256"))
+        if max_mb <= 0:
+            return None
+        _default_cache = FeatureCache(max_bytes=max_mb * 1024 * 1024, disk_dir=os.getenv("VERIFIER_CACHE_DIR") or None)
+    return _default_cache
@@ -0,0 +1,183 @@
+"""
+image_io.py
+
+In-memory image loading for the damage verifier.
+
+Sources can be filesystem paths, file:// or http(s):// URLs, raw bytes
+or file-like objects. Everything is decoded with cv2.imdecode, and when
+the caller only needs a small image, JPEGs are decoded directly at 1/2,
+1/4 or 1/8 scale (IMREAD_REDUCED_COLOR_*) instead of fully decoding a
+12MP photo just to shrink it to 512x512.
+
+URLs go through a pooled HTTP fetcher. Set VERIFIER_LOCAL_FETCH_DIR (or
+call set_fetcher(LocalFetcher(...))) to serve them from local files in
+tests and offline runs.
+"""
+
+import os
+import struct
+from urllib.parse import unquote, urlparse
+
+import cv2
+import numpy as np
+
+# Largest reduction first; each reduced decode still covers the target size
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+# =========================
+# Fetchers
+# =========================
+class HTTPFetcher:
+    """Fetches URLs over one pooled keep-alive HTTP client."""
+
+    def __init__(self, max_connections=20, timeout=30.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.Client(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=self.timeout,
+                follow_redirects=True,
+            )
+        return self._client
+
+    def fetch(self, url: str) -> bytes:
+        response = self.client.get(url)
+        response.raise_for_status()
+        return response.content
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class LocalFetcher:
+    """
+    Local stand-in for HTTPFetcher. Serves a URL from `mapping[url]`
+    (a path or bytes) or, failing that, from `root_dir/<basename of URL path>`.
+    """
+
+    def __init__(self, root_dir=None, mapping=None):
+        self.root_dir = root_dir
+        self.mapping = dict(mapping or {})
+        self.requests = []
+
+    def fetch(self, url: str) -> bytes:
+        self.requests.append(url)
+        target = self.mapping.get(url)
+        if isinstance(target, (bytes, bytearray)):
+            return bytes(target)
+        if target is None:
+            if not self.root_dir:
+                raise FileNotFoundError(f"No local file for {url}")
+            target = os.path.join(self.root_dir, os.path.basename(unquote(urlparse(url).path)))
+        with open(target, "rb") as f:
+            return f.read()
+
+
+_fetcher = None
+
+
+def get_fetcher():
+    global _fetcher
+    if _fetcher is None:
+        local_dir = os.getenv("VERIFIER_LOCAL_FETCH_DIR")
+        _fetcher = LocalFetcher(local_dir) if local_dir else HTTPFetcher()
+    return _fetcher
+
+
+def set_fetcher(fetcher):
+    """Swap the fetcher used for http(s) URLs (e.g. a LocalFetcher in tests)."""
+    global _fetcher
+    _fetcher = fetcher
+
+
+# =========================
+# Reading & Decoding
+# =========================
+def read_source(source) -> bytes:
+    """Return the encoded bytes of a path, URL, bytes-like or file-like source."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        return source.read()
+    source = os.fspath(source)
+    if source.startswith(("http://", "https://")):
+        return get_fetcher().fetch(source)
+    if source.startswith("file://"):
+        source = unquote(urlparse(source).path)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def image_dimensions(data: bytes):
+    """(width, height) from a PNG or JPEG header without decoding, or None."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def reduced_decode_flag(data: bytes, target_size=None) -> int:
+    """Pick the smallest IMREAD_REDUCED_COLOR_* decode that still covers target_size."""
+    if not target_size:
+        return cv2.IMREAD_COLOR
+    dims = image_dimensions(data)
+    if dims is None:
+        return cv2.IMREAD_COLOR
+
+    # Orientation-agnostic: EXIF rotation may swap width and height
+    shortest, needed = min(dims), max(target_size)
+    for factor, flag in _REDUCED_FLAGS:
+        if shortest // factor >= needed:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(data: bytes, target_size=None, description="image") -> np.ndarray:
+    """Decode encoded bytes to a BGR array, at reduced resolution when target_size allows."""
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), reduced_decode_flag(data, target_size))
+    if img is None:
+        raise ValueError(f"Could not read image: {description}")
+    return img
+
+
+def describe_source(source) -> str:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    if hasattr(source, "read"):
+        return getattr(source, "name", "<file object>")
+    return os.fspath(source)
@@ -1,14 +1,28 @@
-from damage_verifier import verify_damage_with_json
-from dotenv import load_dotenv
+import json
 import os
+import sys
+
+# Allow importing as verification_agent.main (orchestrator) as well as running from this directory,
+# and reach the shared modules in agents/
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from damage_verifier import delete_damage_mask, render_overlay, store_damage_mask, verify_damage_with_json
+from profiling import profiled
+from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-def run_damage_verification(before_path="before.jpg", after_path="after.jpg", output_dir="outputs"):
+def run_damage_verification(before_path="before.jpg", after_path="after.jpg", output_dir="outputs", render="matplotlib",
+                            tier="accurate", mode="standard"):
     """
     Simple wrapper that runs the OpenCV damage verification pipeline
     without requiring any AI agent API keys.
+
+    render: "matplotlib", "opencv" or "none" (scores only).
+    tier:   preprocessing quality tier - "fast", "balanced" or "accurate".
+    mode:   "standard" or "pyramid" (full-resolution refinement of damaged tiles).
     """
     print(f"🔍 Starting damage verification...")
     print(f"   Before image: {before_path}")
@@ -17,7 +31,7 @@ def run_damage_verification(before_path="before.jpg", after_path="after.jpg", ou
     
     try:
         # Call your OpenCV pipeline
-        result = verify_damage_with_json(before_path, after_path, outdir=output_dir)
+        result = verify_damage_with_json(before_path, after_path, outdir=output_dir, render=render, tier=tier, mode=mode)
         
         print(f"✅ Verification complete!")
         print(f"   Damage detected: {result['is_damaged']}")
@@ -35,8 +49,79 @@ def run_damage_verification(before_path="before.jpg", after_path="after.jpg", ou
             "error": str(e)
         }
 
+class VerificationError(RuntimeError):
+    """The verifier could not produce a result for a rental."""
+
+
+def verify_damage(rental_id, before_image, after_image, tier="accurate"):
+    """
+    Entry point used by the orchestrator. Images are URLs (or paths/bytes) and
+    are decoded in memory; returns the damage_reports columns for the rental,
+    plus the unsaved "damage_mask" when damage was found (see store_damage_mask).
+    Raises VerificationError if the images could not be verified.
+    """
+    result = verify_damage_with_json(before_image, after_image, render="none", tier=tier, return_mask=True)
+    if result.get("error"):
+        # Never report a failed run as "no damage": the orchestrator marks the
+        # stage failed, skips storing a report and leaves the rental for retry
+        raise VerificationError(f"Verification failed for rental {rental_id}: {result['error']}")
+    status = "damage detected" if result["is_damaged"] else "no damage detected"
+    report = {
+        "description": f"Automated damage verification: {status}",
+        "image_before_url": before_image if isinstance(before_image, str) else None,
+        "image_after_url": after_image if isinstance(after_image, str) else None,
+        "verification_score": result["damage_severity"],
+        "damage_heatmap_url": None,
+    }
+    if "damage_mask" in result:
+        report["damage_mask"] = result["damage_mask"]
+    return report
+
+
+def run_from_payload(payload: dict) -> dict:
+    """
+    Handle a JSON request from the API routes:
+    {"before_image_url": ..., "after_image_url": ..., "tier": "accurate", "mode": "standard",
+     "rental_id": ...}
+
+    With a rental_id the caller saves the report, so a damage mask is stored
+    and returned as mask_key / damage_heatmap_url / damage_regions (and
+    mask_object, its storage path, which the caller removes if saving the
+    report fails).
+
+    {"mask_key": ..., "after_image_url": ...} renders (or returns the cached)
+    overlay for a stored damage mask instead.
+    """
+    if payload.get("mask_key"):
+        return {"mask_key": payload["mask_key"],
+                "overlay_path": render_overlay(payload["mask_key"], payload["after_image_url"])}
+
+    result = verify_damage_with_json(
+        payload["before_image_url"],
+        payload["after_image_url"],
+        render="none",
+        tier=payload.get("tier", "accurate"),
+        mode=payload.get("mode", "standard"),
+        return_mask=True,
+    )
+    stored = store_damage_mask(result, payload.get("rental_id"))
+    result["verification_score"] = result["damage_severity"]
+    result["damage_heatmap_url"] = stored["url"] if stored else None
+    if stored:
+        result.update({"mask_key": stored["key"], "mask_object": stored["object"],
+                       "damage_regions": stored["regions"]})
+    return result
+
+
 if __name__ == "__main__":
-    # Run the damage verification without CrewAI
-    result = run_damage_verification("before.jpg", "after.jpg", "outputs")
-    print("\n📊 Final Result:")
-    print(result)
+    with profiled("verification"):
+        # Requests from pages/api arrive as JSON on stdin; reply with JSON only
+        payload = sys.stdin.read() if not sys.stdin.isatty() else ""
+        if payload.strip():
+            print(json.dumps(run_from_payload(json.loads(payload))))
+            sys.exit(0)
+
+        # Run the damage verification without CrewAI
+        result = run_damage_verification("before.jpg", "after.jpg", "outputs")
+        print("\n📊 Final Result:")
+        print(result)
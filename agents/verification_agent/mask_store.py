@@ -0,0 +1,218 @@
+"""
+mask_store.py
+
+Compact per-rental storage for damage masks.
+
+Instead of writing full PNG renders into a shared outputs/ directory, a
+persisted damage report stores
+- the damage mask, thresholded and bit-packed (np.packbits, 1 bit per
+  pixel, zlib-compressed inside an .npz)
+- one row per damaged region: bounding box, area and severity (the
+  region's share of damage_severity). The fused map is already binary, so
+  there is no per-region intensity to keep
+
+under a key that is unique per rental and run ("<rental_id>/<stamp>-<id>"),
+so concurrent verifications never touch the same file. When Supabase
+credentials are configured the .npz is uploaded to storage
+("masks/<key>.npz" in VERIFIER_MASK_BUCKET) and its public URL goes into
+damage_heatmap_url; the local copy is only a cache. The overlay PNG is
+only rendered when someone asks to view it, then cached next to the mask.
+
+Environment:
+- VERIFIER_MASK_DIR       local store / cache root (default verification_agent/masks)
+- VERIFIER_MASK_BUCKET    Supabase storage bucket (default damage-reports,
+                          the bucket the API route uploads photos to)
+- VERIFIER_MASK_URL_BASE  public URL prefix for keys when storage is not
+                          configured (default: file paths)
+"""
+
+import contextlib
+import io
+import os
+import sys
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+# Matches visualize_damage, which hides heatmap values below 0.3
+MASK_LEVEL = 0.3
+# Connected regions smaller than this many pixels are noise
+MIN_REGION_AREA = 16
+
+DEFAULT_DIR = os.getenv("VERIFIER_MASK_DIR",
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), "masks"))
+URL_BASE = os.getenv("VERIFIER_MASK_URL_BASE", "")
+BUCKET = os.getenv("VERIFIER_MASK_BUCKET", "damage-reports")
+# Storage folder for masks inside the bucket
+OBJECT_PREFIX = "masks"
+
+REGION_FIELDS = ("x", "y", "w", "h", "area", "severity")
+
+
+# =========================
+# Encoding
+# =========================
+def pack_mask(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(mask.astype(bool), axis=None)
+
+
+def unpack_mask(bits: np.ndarray, shape) -> np.ndarray:
+    h, w = shape
+    return np.unpackbits(bits, count=h * w).reshape(h, w).astype(bool)
+
+
+def damage_regions(fused: np.ndarray, level: float = MASK_LEVEL, min_area: int = MIN_REGION_AREA):
+    """
+    (binary mask, regions float32 [n, len(REGION_FIELDS)]) for a fused map.
+    Regions come from 8-connected components in label (raster) order, so
+    relabelling the stored mask gives region i label i + 1.
+    """
+    binary = (fused >= level).astype(np.uint8)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+    keep = np.flatnonzero(stats[:, cv2.CC_STAT_AREA] >= min_area)
+    keep = keep[keep != 0]                                  # label 0 is background
+
+    # damage_severity is the damaged share of the image, so a region's part is its own share
+    area = stats[keep, cv2.CC_STAT_AREA].astype(np.float64)
+    regions = np.column_stack([
+        stats[keep, cv2.CC_STAT_LEFT], stats[keep, cv2.CC_STAT_TOP],
+        stats[keep, cv2.CC_STAT_WIDTH], stats[keep, cv2.CC_STAT_HEIGHT],
+        area, area * 100.0 / fused.size,
+    ]).astype(np.float32).reshape(-1, len(REGION_FIELDS))
+
+    # Drop the noise components from the stored mask as well
+    binary = np.isin(labels, keep)
+    return binary, regions
+
+
+def regions_to_dicts(regions: np.ndarray) -> list:
+    """JSON-ready regions, most severe first."""
+    rows = []
+    for row in regions[np.argsort(-regions[:, -1], kind="stable")].tolist():
+        region = dict(zip(REGION_FIELDS, row))
+        for field in ("x", "y", "w", "h", "area"):
+            region[field] = int(region[field])
+        region["severity"] = round(region["severity"], 4)
+        rows.append(region)
+    return rows
+
+
+def mask_key(rental_id) -> str:
+    """Unique per rental and run, so concurrent verifications never share a file."""
+    return f"{rental_id or 'adhoc'}/{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:12]}"
+
+
+# =========================
+# Store
+# =========================
+class MaskStore:
+    def __init__(self, root: str = DEFAULT_DIR, url_base: str = URL_BASE, bucket=None):
+        """bucket: a Supabase storage bucket (client.storage.from_(name)); None keeps masks local."""
+        self.root = root
+        self.url_base = url_base
+        self.bucket = bucket
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, *key.split("/")) + suffix
+
+    @staticmethod
+    def _object(key: str) -> str:
+        return f"{OBJECT_PREFIX}/{key}.npz"
+
+    def _write_local(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        # Readers only ever see complete files
+        os.replace(tmp, path)
+
+    def save(self, rental_id, fused: np.ndarray, level: float = MASK_LEVEL) -> dict:
+        """
+        Store the mask and regions for one verification. Returns {key, url,
+        object, regions, bytes}; object is the storage path (None when local).
+        """
+        binary, regions = damage_regions(fused, level)
+        key = mask_key(rental_id)
+
+        buf = io.BytesIO()
+        np.savez_compressed(buf, shape=np.array(binary.shape, dtype=np.int32), bits=pack_mask(binary),
+                            regions=regions)
+        data = buf.getvalue()
+        if self.bucket is not None:
+            self.bucket.upload(self._object(key), data,
+                               {"content-type": "application/octet-stream", "upsert": "false"})
+        self._write_local(self._path(key, ".npz"), data)
+        return {"key": key, "url": self.url(key), "object": self._object(key) if self.bucket is not None else None,
+                "regions": regions_to_dicts(regions), "bytes": len(data)}
+
+    def delete(self, key: str):
+        """Remove a mask (and its cached overlay), e.g. when its damage report could not be saved."""
+        if self.bucket is not None:
+            self.bucket.remove([self._object(key)])
+        for suffix in (".npz", ".overlay.png"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path(key, suffix))
+
+    def load(self, key: str):
+        """(binary mask, regions array) for a stored key, fetched from storage if not cached locally."""
+        path = self._path(key, ".npz")
+        if not os.path.exists(path) and self.bucket is not None:
+            self._write_local(path, self.bucket.download(self._object(key)))
+        with np.load(path) as data:
+            return unpack_mask(data["bits"], tuple(data["shape"])), data["regions"]
+
+    def url(self, key: str) -> str:
+        if self.bucket is not None:
+            return self.bucket.get_public_url(self._object(key))
+        if self.url_base:
+            return f"{self.url_base.rstrip('/')}/{key}.npz"
+        return self._path(key, ".npz")
+
+    def damage_map(self, key: str) -> np.ndarray:
+        """Float32 map of the stored mask: 1.0 where damaged, 0.0 elsewhere."""
+        binary, _ = self.load(key)
+        return binary.astype(np.float32)
+
+    def overlay(self, key: str, after_image, render) -> str:
+        """
+        Path of the overlay PNG for a stored mask, rendering it on first view.
+        render(after_bgr, damage_map) -> BGR image; after_image is the
+        decoded "after" photo.
+        """
+        path = self._path(key, ".overlay.png")
+        if os.path.exists(path):
+            return path
+
+        damage = self.damage_map(key)
+        h, w = damage.shape
+        after = cv2.resize(after_image, (w, h), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".png", render(after, damage))
+        if not ok:
+            raise ValueError(f"Could not encode overlay for {key}")
+
+        tmp = f"{path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(buf.tobytes())
+        os.replace(tmp, path)
+        return path
+
+
+_default_store = None
+
+
+def default_store() -> MaskStore:
+    """Store backed by Supabase storage when credentials are set, else local files only."""
+    global _default_store
+    if _default_store is None:
+        url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        bucket = None
+        if url and key:
+            sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            from supabase_transport import get_client
+            bucket = get_client(url, key).storage.from_(BUCKET)
+        _default_store = MaskStore(bucket=bucket)
+    return _default_store
@@ -4,22 +4,24 @@ import path from 'path';
 // Define the base path to the agents directory
 const AGENTS_DIR = path.resolve(process.cwd(), 'agents');
 
-// Map agent names to their script paths
-const AGENT_SCRIPTS = {
-    orchestrator: path.join(AGENTS_DIR, 'orchestrator', 'orchestrator.py'),
-    matching: path.join(AGENTS_DIR, 'matching_agent', 'matching_agent.py'),
-    pricing: path.join(AGENTS_DIR, 'pricing_agent', 'pricing_agent.py'),
-    trust: path.join(AGENTS_DIR, 'trust_agent', 'trust_agent.py'),
-    verification: path.join(AGENTS_DIR, 'verification_agent', 'main.py'),
-    engagement: path.join(AGENTS_DIR, 'engagement_agent', 'engagement_agent.py'),
-    payout: path.join(AGENTS_DIR, 'payout_agent', 'payout_agent.py'),
-};
+// Every agent runs through one entry point, which serves repeatable
+// requests from the result cache and keeps stdout to the JSON reply
+const RUN_AGENT = path.join(AGENTS_DIR, 'run_agent.py');
+
+const AGENTS = new Set([
+    'orchestrator',
+    'matching',
+    'pricing',
+    'trust',
+    'verification',
+    'engagement',
+    'payout',
+    'recommendations',
+]);
 
 export default function handler(req, res) {
     const { agent } = req.query;
-    const scriptPath = AGENT_SCRIPTS[agent];
-
-    if (!scriptPath) {
+    if (!AGENTS.has(agent)) {
         return res.status(404).json({ error: `Agent '${agent}' not found.` });
     }
 
@@ -31,7 +33,7 @@ export default function handler(req, res) {
     const runAgent = new Promise((resolve, reject) => {
         // Use 'python3' or 'python' depending on the system setup.
         // Pass data to the script via stdin for security and to handle large inputs.
-        const pythonProcess = spawn('python', [scriptPath]);
+        const pythonProcess = spawn('python', [RUN_AGENT, agent]);
 
         let stdout = '';
         let stderr = '';
@@ -16,6 +16,8 @@ export const config = {
 
 const AGENTS_DIR = path.resolve(process.cwd(), 'agents');
 const VERIFICATION_SCRIPT_PATH = path.join(AGENTS_DIR, 'verification_agent', 'main.py');
+// Bucket the verification agent uploads damage masks to (see agents/verification_agent/mask_store.py)
+const MASK_BUCKET = process.env.VERIFIER_MASK_BUCKET || 'damage-reports';
 
 // Helper function to upload a file to Supabase Storage
 const uploadFileToSupabase = async (file, rentalId) => {
@@ -68,9 +70,11 @@ export default async function handler(req, res) {
             // 2. Call the Python verification agent
             const pythonProcess = spawn('python', [VERIFICATION_SCRIPT_PATH]);
             
+            // rental_id lets the agent store the damage mask for the report saved below
             const agentPayload = {
                 before_image_url: beforeImageUrl,
                 after_image_url: afterImageUrl,
+                rental_id,
             };
 
             let agentResult = '';
@@ -92,7 +96,7 @@ export default async function handler(req, res) {
                 });
             });
 
-            const { verification_score, damage_heatmap_url } = JSON.parse(agentResult);
+            const { verification_score, damage_heatmap_url, mask_object } = JSON.parse(agentResult);
 
             // 3. Save the report to the database
             const { data: reportData, error: dbError } = await supabase
@@ -112,6 +116,10 @@ export default async function handler(req, res) {
                 .single();
 
             if (dbError) {
+                // The agent already uploaded the damage mask; nothing references it now
+                if (mask_object) {
+                    await supabase.storage.from(MASK_BUCKET).remove([mask_object]);
+                }
                 throw new Error(`Database insert failed: ${dbError.message}`);
             }
 